@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from threading import Thread, Lock, Event
+import atexit
+
+from apps.users.models import default_created_at
+
+WATCH_FIELDS = ('last_position', 'quality', 'playback_speed', 'volume', 'last_watch')
+WATCH_DEFAULTS = {'last_position': 0.0, 'quality': 'auto', 'playback_speed': 1.0, 'volume': 1.0}
+WRITE_BATCH_SIZE = 400
+
+class WatchProgressBuffer:
+    # Write-behind : les positions de lecture (une par seconde et par spectateur) sont fusionnées en
+    # mémoire par (utilisateur, vidéo) et écrites par lots ; seule la dernière valeur est conservée.
+    def __init__(self):
+        self.lock = Lock()
+        self.pending = {}
+        self.stopped = Event()
+        # Réveil anticipé du thread d'écriture quand le tampon déborde
+        self.wakeup = Event()
+        self.flusher = None
+
+    def start(self):
+        with self.lock:
+            if self.flusher is not None:
+                return
+            self.flusher = Thread(target=self.flush_loop, daemon=True)
+            self.flusher.start()
+        atexit.register(self.stop)
+
+    def flush_loop(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(settings.WATCH_PROGRESS_FLUSH_SECONDS)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                break
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                print(f"Erreur lors de l'écriture des positions de lecture : {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Erreur lors de l'écriture des positions de lecture : {e}")
+
+    def update(self, user_id, video_id, **fields):
+        fields = {name: value for name, value in fields.items() if name in WATCH_FIELDS and value is not None}
+        fields['last_watch'] = default_created_at()
+        with self.lock:
+            self.pending.setdefault((user_id, video_id), {}).update(fields)
+            size = len(self.pending)
+        self.start()
+        # Appelé depuis la boucle asynchrone du consumer : aucune écriture ici, le thread d'écriture s'en charge
+        if size >= settings.WATCH_PROGRESS_MAX_PENDING:
+            self.wakeup.set()
+
+    def apply(self, user_id, video_id, watch):
+        # Lecture à travers le tampon : les valeurs pas encore écrites priment sur la base
+        from apps.streaming.models import VideoWatch
+        with self.lock:
+            fields = dict(self.pending.get((user_id, video_id), {}))
+        if not fields:
+            return watch
+        if watch is None:
+            watch = VideoWatch(user_id=user_id, video_id=video_id, **WATCH_DEFAULTS)
+        for name, value in fields.items():
+            setattr(watch, name, value)
+        return watch
+
+    def get(self, user_id, video_id):
+        from apps.streaming.models import VideoWatch
+        return self.apply(user_id, video_id, VideoWatch.objects.filter(user_id=user_id, video_id=video_id).first())
+
+    def flush(self, keys=None):
+        with self.lock:
+            if keys is None:
+                batch, self.pending = self.pending, {}
+            else:
+                batch = {key: self.pending.pop(key) for key in keys if key in self.pending}
+        if not batch:
+            return 0
+        try:
+            return self.write(batch)
+        except Exception:
+            # Remet les valeurs en attente sans écraser celles arrivées entre-temps
+            with self.lock:
+                for key, fields in batch.items():
+                    self.pending[key] = {**fields, **self.pending.get(key, {})}
+            raise
+
+    def write(self, batch):
+        keys = list(batch)
+        written = 0
+        # Par tranches : la condition OR sur les couples reste sous la limite de profondeur de SQLite
+        for start in range(0, len(keys), WRITE_BATCH_SIZE):
+            written += self.write_chunk({key: batch[key] for key in keys[start:start + WRITE_BATCH_SIZE]})
+        return written
+
+    def write_chunk(self, batch):
+        from apps.streaming.models import VideoWatch
+        from apps.videos.models import Video
+        # Les champs absents d'une mise à jour gardent leur valeur en base : on complète avec les lignes existantes
+        condition = Q()
+        for user_id, video_id in batch:
+            condition |= Q(user_id=user_id, video_id=video_id)
+        existing = {
+            (row['user_id'], row['video_id']): row
+            for row in VideoWatch.objects.filter(condition).values('user_id', 'video_id', *WATCH_FIELDS)
+        }
+        # Une vidéo supprimée entre-temps ferait échouer tout le lot sur la clé étrangère
+        video_ids = set(Video.objects.filter(id__in={video_id for _, video_id in batch}).values_list('id', flat=True))
+        watches = []
+        for (user_id, video_id), fields in batch.items():
+            if video_id not in video_ids:
+                continue
+            current = existing.get((user_id, video_id)) or {**WATCH_DEFAULTS, 'last_watch': fields['last_watch']}
+            values = {name: fields.get(name, current[name]) for name in WATCH_FIELDS}
+            watches.append(VideoWatch(user_id=user_id, video_id=video_id, **values))
+        # Upsert sur (video, user) : une seule requête pour créer ou mettre à jour tout le lot
+        VideoWatch.objects.bulk_create(
+            watches, update_conflicts=True, unique_fields=['video', 'user'], update_fields=list(WATCH_FIELDS)
+        )
+        return len(watches)
+
+watch_progress_buffer = WatchProgressBuffer()
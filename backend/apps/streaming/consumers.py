@@ -3,99 +3,65 @@ from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 import json
 from django.conf import settings
-from apps.streaming.models import VideoWatch
-from apps.videos.models import Video, VideoInfo
-from apps.videos.serializers import VideoInfoSerializer
-from helpers.helper import get_available_info
-import os
+from apps.streaming.buffer import watch_progress_buffer
+from apps.videos.models import Video
+from apps.videos.playback import get_playback_descriptor
+from apps.streaming.live import get_live_group
 
 @database_sync_to_async
 def get_video_info_available(video_id):
+    # Descripteur précalculé par la conversion et servi depuis le cache : ni requête ni ffprobe ici
     try:
-        video = Video.objects.get(id=video_id)
-        video_info = VideoInfo.objects.get(video=video)
-        video_path = video.fichier.path
-        probe_info = get_available_info(video_path)
-        # print(VideoInfoSerializer(video_info).data, probe_info)
-        
-        qualities = []
-        base_url = settings.BASE_URL + settings.MEDIA_URL
-        video_dir = os.path.join("videos", str(video.id))
-        for quality in video_info.qualities:
-            manifest_path = os.path.join(video_dir, "segments", quality if quality != video_info.qualities[0] else "original", "video.m3u8")
-            qualities.append({
-                "name": quality,
-                "url": f"{base_url}{manifest_path}",
-                "resolution": {
-                    "2160p": "3840x2160",
-                    "2160p (4K)": "3840x2160",
-                    "1440p": "2560x1440",
-                    "1440p (2K)": "2560x1440",
-                    "1080p": "1920x1080",
-                    "1080p (Full HD)": "1920x1080",
-                    "720p": "1280x720",
-                    "720p (HD)": "1280x720",
-                    "480p": "842x480",
-                    "360p": "640x360",
-                    "240p": "426x240",
-                    "144p": "256x144"
-                }.get(quality, "1920x1080"),
-                "bandwidth": {
-                    "2160p": "3840x2160",
-                    "2160p (4K)": "3840x2160",
-                    "1440p": "2560x1440",
-                    "1440p (2K)": "2560x1440",
-                    "1080p": "1920x1080",
-                    "1080p (Full HD)": "1920x1080",
-                    "720p": "1280x720",
-                    "720p (HD)": "1280x720",
-                    "480p": "842x480",
-                    "360p": "640x360",
-                    "240p": "426x240",
-                    "144p": "256x144"
-                }.get(quality, "5000000")
-            })
-        audio_tracks = []
-        for lang in video_info.audio_languages:
-            audio_manifest = os.path.join(video_dir, "segments", "original", f"audio_{lang}.m3u8")
-            audio_tracks.append({
-                "language": lang,
-                "url": f"{base_url}{audio_manifest}"
-            })
-        subtitle_tracks = []
-        for lang in video_info.subtitle_languages:
-            subtitle_manifest = os.path.join(video_dir, "segments", "original", f"subs_{lang}.m3u8")
-            subtitle_tracks.append({
-                "language": lang,
-                "url": f"{base_url}{subtitle_manifest}"
-            })
-
-        return {
-            "qualities": qualities,
-            "audio_tracks": audio_tracks,
-            "subtitle_tracks": subtitle_tracks,
-            "fps": video_info.fps,
-            "width": video_info.width,
-            "height": video_info.height,
-            "duration": video_info.duration,
-            "size": video_info.size,
-            "master_manifest": os.path.join(base_url, video.master_manifest_file.name),
-            "quality": probe_info["quality"]
-        }
-    except Video.DoesNotExist:
-        return None
-    except VideoInfo.DoesNotExist:
+        descriptor = get_playback_descriptor(video_id)
+    except ValueError:
         return None
-    except Exception as e:
-        print(f"Error in get_video_info_available: {str(e)}")
+    if descriptor is None:
         return None
+    base_url = settings.BASE_URL + settings.MEDIA_URL
+    metadata = descriptor["metadata"]
+    return {
+        "qualities": [
+            {
+                "name": quality["name"],
+                "url": f"{base_url}{quality['path']}",
+                "resolution": quality["resolution"],
+                "bandwidth": quality["bandwidth"]
+            }
+            for quality in descriptor["qualities"]
+        ],
+        "audio_tracks": [{"language": track["language"], "url": f"{base_url}{track['path']}"} for track in descriptor["audio_tracks"]],
+        "subtitle_tracks": [{"language": track["language"], "url": f"{base_url}{track['path']}"} for track in descriptor["subtitle_tracks"]],
+        "fps": metadata["fps"],
+        "width": metadata["width"],
+        "height": metadata["height"],
+        "duration": metadata["duration"],
+        "size": metadata["size"],
+        "master_manifest": f"{base_url}{descriptor['master_manifest']}",
+        "dash_manifest": f"{base_url}{descriptor['dash_manifest']}" if descriptor.get("dash_manifest") else None,
+        "quality": descriptor["default_quality"]
+    }
 
 @database_sync_to_async
-def get_video_watch(video_id, user):
+def get_live_info(video_id):
+    # Direct en cours pour cette vidéo : le lecteur suit la playlist LL-HLS au lieu du manifeste VOD
+    from apps.streaming.models import LiveStream
+    from apps.streaming.live import LIVE_MASTER_NAME
     try:
-        return VideoWatch.objects.get(video_id=video_id, user=user)
-    except VideoWatch.DoesNotExist:
+        live_id = LiveStream.objects.filter(video_id=int(video_id), status__in=['LIVE', 'ENDING']).values_list('id', flat=True).first()
+    except ValueError:
         return None
+    if live_id is None:
+        return None
+    return {
+        "live_id": live_id,
+        "manifest_url": f"{settings.BASE_URL}/api/live/{live_id}/hls/{LIVE_MASTER_NAME}",
+        "part_target": settings.LIVE_PART_DURATION,
+        "segment_duration": settings.LIVE_SEGMENT_DURATION,
+    }
+
+@database_sync_to_async
+def get_video_watch(video_id, user):
+    return watch_progress_buffer.get(user.id, int(video_id))
 
 class VideoWatchConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -107,7 +73,14 @@ class VideoWatchConsumer(AsyncWebsocketConsumer):
             await self.channel_layer.group_add(self.group_name, self.channel_name)
             await self.accept()
             print("✅ Connected...")
-            await self.send_manifest_url()
+            live_info = await get_live_info(self.video_id)
+            if live_info:
+                # Nouvelles parties annoncées par le worker d'ingestion : le lecteur recharge sans attendre
+                self.live_group_name = get_live_group(self.video_id)
+                await self.channel_layer.group_add(self.live_group_name, self.channel_name)
+                await self.send(text_data=json.dumps({'type': 'live_info', **live_info}))
+            else:
+                await self.send_manifest_url()
         else:
             self.user = None
             await self.close()
@@ -115,6 +88,13 @@ class VideoWatchConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            if hasattr(self, 'live_group_name'):
+                await self.channel_layer.group_discard(self.live_group_name, self.channel_name)
+            # Fin de lecture : la dernière position est écrite tout de suite, sans attendre le prochain lot
+            try:
+                await database_sync_to_async(watch_progress_buffer.flush)([(self.user.id, int(self.video_id))])
+            except Exception as e:
+                print(f"Erreur lors de l'écriture de la position de lecture : {e}")
         print("❌ Disconnected...")
 
     async def receive(self, text_data):
@@ -125,16 +105,14 @@ class VideoWatchConsumer(AsyncWebsocketConsumer):
             print(f"📥 Received: {data_info}")
 
             if type_data == 'update':
-                video_watch, _ = await database_sync_to_async(VideoWatch.objects.get_or_create)(
-                    video_id=self.video_id,
-                    user=self.user,
-                    defaults={'last_position': 0.0, 'quality': 'auto', 'playback_speed': 1.0, 'volume': 1.0}
+                # Mémoire seulement : le tampon écrit la dernière position par lots
+                watch_progress_buffer.update(
+                    self.user.id, int(self.video_id),
+                    last_position=data.get('position'),
+                    quality=data.get('quality'),
+                    playback_speed=data.get('speed'),
+                    volume=data.get('volume')
                 )
-                video_watch.last_position = data.get('position', video_watch.last_position)
-                video_watch.quality = data.get('quality', video_watch.quality)
-                video_watch.playback_speed = data.get('speed', video_watch.playback_speed)
-                video_watch.volume = data.get('volume', video_watch.volume)
-                await database_sync_to_async(video_watch.save)()
 
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
@@ -150,7 +128,6 @@ class VideoWatchConsumer(AsyncWebsocketConsumer):
 
     async def send_manifest_url(self):
         try:
-            video = await database_sync_to_async(Video.objects.get)(id=self.video_id)
             video_info = await get_video_info_available(self.video_id)
             if not video_info:
                 await self.send(text_data=json.dumps({
@@ -168,6 +145,7 @@ class VideoWatchConsumer(AsyncWebsocketConsumer):
             await self.send(text_data=json.dumps({
                 'type': 'segment_info',
                 'manifest_url': video_info['master_manifest'],
+                'dash_manifest_url': video_info['dash_manifest'],
                 'last_position': last_position,
                 'last_volume': last_volume,
                 'last_playback_speed': last_playback_speed,
@@ -197,4 +175,17 @@ class VideoWatchConsumer(AsyncWebsocketConsumer):
             'speed': event['speed'],
             'volume': event['volume'],
             'video_id': event['video_id']
-        }))
\ No newline at end of file
+        }))
+
+    async def live_part(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'live_part',
+            'msn': event['msn'],
+            'part': event['part']
+        }))
+
+    async def live_ended(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'live_ended',
+            'video_id': event['video_id']
+        }))
@@ -0,0 +1,473 @@
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone as django_timezone
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from threading import Thread, Event, Lock
+from uuid import uuid4
+import subprocess
+import signal
+import socket
+import struct
+import shutil
+import json
+import math
+import time
+import re
+import os
+
+from helpers.realtime import group_has_subscribers
+
+# Les parties ne sont annoncées que pour les derniers segments de la fenêtre, les plus anciens n'ont que EXTINF
+LIVE_PART_SEGMENTS = 3
+LIVE_MASTER_NAME = "master.m3u8"
+LIVE_STATE_NAME = "state.json"
+LIVE_RECORDING_NAME = "recording.mkv"
+# Seuls fichiers servis aux lecteurs : master.m3u8, playlists, init et segments CMAF (pas l'enregistrement ni l'état)
+LIVE_MEDIA_NAME = re.compile(r"^(?:master|stream[0-9]+)\.m3u8$|^(?:init-stream[0-9]+|chunk-stream[0-9]+-[0-9]+)\.m4s$")
+LIVE_AUDIO_BITRATE = 128000
+
+def get_live_dir(live_id):
+    return os.path.join(settings.LIVE_ROOT, str(live_id))
+
+def can_watch_live(live, user):
+    # Même règle que la liste des directs : un direct privé n'est visible que de son émetteur
+    if live.visibilite != 'PRIVATE':
+        return True
+    return user is not None and user.is_authenticated and user.id == live.envoyeur_id
+
+def get_live_group(video_id):
+    return f"live_{video_id}"
+
+def get_init_name(stream):
+    return f"init-stream{stream}.m4s"
+
+def get_segment_name(stream, number):
+    return f"chunk-stream{stream}-{number:05d}.m4s"
+
+def get_playlist_name(stream):
+    return f"stream{stream}.m3u8"
+
+def get_ingest_url(live):
+    host = settings.IP_ADDR
+    if live.protocol == 'RTMP':
+        return f"rtmp://{host}:{settings.LIVE_RTMP_PORT}/live/{live.stream_key}"
+    if live.protocol == 'SRT':
+        return f"srt://{host}:{settings.LIVE_SRT_PORT}?passphrase={live.stream_key}"
+    return f"ffmpeg -re -i <source> -c copy -f mpegts - | python manage.py live_ingest {live.id}"
+
+def iter_boxes(data, start=0, end=None):
+    # Boîtes ISO BMFF complètes entre start et end : (type, position, taille de l'en-tête, taille totale)
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size, header = struct.unpack_from(">Q", data, pos + 8)[0], 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos, header, size
+        pos += size
+
+def find_box(data, path, start=0, end=None):
+    for box_type, pos, header, size in iter_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return pos + header, pos + size
+            return find_box(data, path[1:], pos + header, pos + size)
+    return None
+
+def parse_init(data):
+    # Échelle de temps de la piste (mdhd) et durée d'échantillon par défaut (trex), None si l'init est incomplet
+    mdhd = find_box(data, [b"moov", b"trak", b"mdia", b"mdhd"])
+    if mdhd is None:
+        return None
+    start = mdhd[0]
+    timescale = struct.unpack_from(">I", data, start + (20 if data[start] == 1 else 12))[0]
+    trex = find_box(data, [b"moov", b"mvex", b"trex"])
+    default_duration = struct.unpack_from(">I", data, trex[0] + 12)[0] if trex else 0
+    return timescale, default_duration
+
+def parse_fragment_duration(data, default_duration=0):
+    # Durée d'un fragment (moof) : somme des durées d'échantillons du trun, ou durée par défaut du tfhd/trex
+    traf = find_box(data, [b"traf"])
+    if traf is None:
+        return 0
+    total = 0
+    duration = default_duration
+    for box_type, pos, header, size in iter_boxes(data, *traf):
+        start = pos + header
+        flags = int.from_bytes(data[start + 1:start + 4], "big")
+        if box_type == b"tfhd":
+            offset = start + 8 + (8 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0)
+            if flags & 0x8:
+                duration = struct.unpack_from(">I", data, offset)[0]
+        elif box_type == b"trun":
+            count = struct.unpack_from(">I", data, start + 4)[0]
+            offset = start + 8 + (4 if flags & 0x1 else 0) + (4 if flags & 0x4 else 0)
+            if flags & 0x100:
+                step = 4 * bin(flags & 0xF00).count("1")
+                total += sum(struct.unpack_from(">I", data, offset + idx * step)[0] for idx in range(count))
+            else:
+                total += duration * count
+    return total
+
+class LiveSegment:
+    def __init__(self, number):
+        self.number = number
+        self.parts = []
+        self.complete = False
+
+    @property
+    def duration(self):
+        return sum(part[2] for part in self.parts)
+
+class LiveTrack:
+    # Suit les segments qu'écrit ffmpeg (dash, streaming) pour une piste : chaque paire moof+mdat écrite
+    # devient une partie LL-HLS, adressée par plage d'octets dans le segment en cours d'écriture
+    def __init__(self, live_dir, stream, is_video):
+        self.live_dir = live_dir
+        self.stream = stream
+        self.is_video = is_video
+        self.timescale = None
+        self.default_duration = 0
+        self.segments = []
+        self.number = 1
+        self.offset = 0
+        self.part_start = 0
+        self.pending_duration = None
+        self.part_target = settings.LIVE_PART_DURATION
+        self.target_duration = math.ceil(settings.LIVE_SEGMENT_DURATION)
+
+    def path(self, name):
+        return os.path.join(self.live_dir, name)
+
+    def scan(self):
+        if self.timescale is None:
+            try:
+                with open(self.path(get_init_name(self.stream)), 'rb') as f:
+                    parsed = parse_init(f.read())
+            except OSError:
+                return False
+            if parsed is None:
+                return False
+            self.timescale, self.default_duration = parsed
+        changed = False
+        while os.path.exists(self.path(get_segment_name(self.stream, self.number))):
+            # Segment suivant commencé avant la lecture : celui-ci est donc entièrement écrit
+            finished = os.path.exists(self.path(get_segment_name(self.stream, self.number + 1)))
+            changed = self.read_parts() or changed
+            if not finished:
+                break
+            self.finish_segment()
+        return changed
+
+    def current_segment(self):
+        if not self.segments or self.segments[-1].number != self.number:
+            self.segments.append(LiveSegment(self.number))
+        return self.segments[-1]
+
+    def read_parts(self):
+        with open(self.path(get_segment_name(self.stream, self.number)), 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        changed = False
+        read = 0
+        for box_type, pos, header, size in iter_boxes(data):
+            if box_type == b"moof":
+                self.pending_duration = parse_fragment_duration(data[pos + header:pos + size], self.default_duration)
+            elif box_type == b"mdat" and self.pending_duration is not None:
+                end = self.offset + pos + size
+                # La première partie commence à 0 (styp compris), les suivantes à la fin de la précédente
+                self.current_segment().parts.append((self.part_start, end - 1, self.pending_duration / self.timescale))
+                self.part_target = max(self.part_target, self.pending_duration / self.timescale)
+                self.part_start = end
+                self.pending_duration = None
+                changed = True
+            read = pos + size
+        self.offset += read
+        return changed
+
+    def finish_segment(self):
+        if self.segments and self.segments[-1].number == self.number and self.segments[-1].parts:
+            segment = self.segments[-1]
+            segment.complete = True
+            self.target_duration = max(self.target_duration, math.ceil(segment.duration))
+        self.number += 1
+        self.offset = self.part_start = 0
+        self.pending_duration = None
+        complete = [segment for segment in self.segments if segment.complete]
+        if len(complete) > settings.LIVE_WINDOW_SEGMENTS:
+            self.segments = self.segments[len(complete) - settings.LIVE_WINDOW_SEGMENTS:]
+
+    def last_part(self):
+        segment = next((segment for segment in reversed(self.segments) if segment.parts), None)
+        if segment is None:
+            return None
+        return [segment.number, len(segment.parts) - 1, segment.complete]
+
+    def write_playlist(self, ended=False):
+        if not self.segments:
+            return
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:9",
+            f"#EXT-X-TARGETDURATION:{self.target_duration}",
+            f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * self.part_target:.3f}",
+            f"#EXT-X-PART-INF:PART-TARGET={self.part_target:.3f}",
+            f"#EXT-X-MEDIA-SEQUENCE:{self.segments[0].number}",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+            f'#EXT-X-MAP:URI="{get_init_name(self.stream)}"',
+        ]
+        for idx, segment in enumerate(self.segments):
+            name = get_segment_name(self.stream, segment.number)
+            if idx >= len(self.segments) - LIVE_PART_SEGMENTS:
+                for part_idx, (start, end, duration) in enumerate(segment.parts):
+                    # Vidéo : seule la première partie commence par une image clé (GOP = segment)
+                    independent = ",INDEPENDENT=YES" if part_idx == 0 or not self.is_video else ""
+                    lines.append(f'#EXT-X-PART:DURATION={duration:.5f},URI="{name}",BYTERANGE="{end - start + 1}@{start}"{independent}')
+            if segment.complete:
+                lines += [f"#EXTINF:{segment.duration:.5f},", name]
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+        write_atomic(self.path(get_playlist_name(self.stream)), "\n".join(lines) + "\n")
+
+def write_atomic(path, content):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def read_live_state(live_dir):
+    try:
+        with open(os.path.join(live_dir, LIVE_STATE_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def is_part_available(state, stream, msn, part=None):
+    # Rechargement bloquant LL-HLS : _HLS_msn seul attend la fin du segment, avec _HLS_part la partie demandée
+    if state.get("ended"):
+        return True
+    last = state.get("streams", {}).get(str(stream))
+    if last is None:
+        return False
+    last_msn, last_part, complete = last
+    if last_msn > msn:
+        return True
+    if last_msn < msn:
+        return False
+    return complete if part is None else last_part >= part
+
+class LivePackager:
+    def __init__(self, live_dir, video_streams, on_part=None):
+        self.live_dir = live_dir
+        # Pistes vidéo 0..n-1 (une par qualité), puis l'audio (absente si la source n'en a pas)
+        self.tracks = [LiveTrack(live_dir, stream, True) for stream in range(video_streams)]
+        self.tracks.append(LiveTrack(live_dir, video_streams, False))
+        self.on_part = on_part
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+    @property
+    def has_audio(self):
+        return self.tracks[-1].timescale is not None
+
+    def is_live(self):
+        return self.tracks[0].last_part() is not None
+
+    def start(self):
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                print(f"Erreur du packager direct : {e}")
+            self.stopped.wait(settings.LIVE_PACKAGER_POLL_SECONDS)
+
+    def step(self, ended=False):
+        with self.lock:
+            changed = [track for track in self.tracks if track.scan()]
+            if ended:
+                for track in self.tracks:
+                    track.finish_segment()
+                changed = [track for track in self.tracks if track.timescale is not None]
+            if not changed:
+                return
+            for track in changed:
+                track.write_playlist(ended)
+            write_atomic(os.path.join(self.live_dir, LIVE_STATE_NAME), json.dumps({
+                "streams": {str(track.stream): track.last_part() for track in self.tracks if track.last_part() is not None},
+                "ended": ended,
+            }))
+        if self.on_part is not None and self.tracks[0] in changed and not ended:
+            self.on_part(*self.tracks[0].last_part()[:2])
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.step(ended=True)
+
+def write_live_master(live_dir, qualities, has_audio):
+    from apps.videos.tasks import BANDWIDTHS, RESOLUTIONS, get_quality_key
+    lines = ["#EXTM3U", "#EXT-X-VERSION:9", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    audio = ""
+    if has_audio:
+        lines.append(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="audio",DEFAULT=YES,AUTOSELECT=YES,URI="{get_playlist_name(len(qualities))}"')
+        audio = ',AUDIO="audio"'
+    for stream, q in enumerate(qualities):
+        key = get_quality_key(q)
+        bandwidth = int(BANDWIDTHS[key]) + (LIVE_AUDIO_BITRATE if has_audio else 0)
+        lines += [f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={RESOLUTIONS[key]}{audio},NAME="{q}"', get_playlist_name(stream)]
+    write_atomic(os.path.join(live_dir, LIVE_MASTER_NAME), "\n".join(lines) + "\n")
+
+def live_input_args(live):
+    args = ["-fflags", "nobuffer"]
+    host = settings.LIVE_INGEST_HOST
+    if live.protocol == 'RTMP':
+        return args + ["-listen", "1", "-i", f"rtmp://{host}:{settings.LIVE_RTMP_PORT}/live/{live.stream_key}"]
+    if live.protocol == 'SRT':
+        # Latence SRT en microsecondes côté ffmpeg
+        return args + ["-i", f"srt://{host}:{settings.LIVE_SRT_PORT}?mode=listener&latency={settings.LIVE_SRT_LATENCY_MS * 1000}&passphrase={live.stream_key}"]
+    return args + ["-i", "pipe:0"]
+
+def live_output_args(live_dir, qualities):
+    # Une seule sortie dash "streaming" : chaque fragment (moof+mdat) est écrit dès qu'il est prêt, dans des
+    # segments CMAF que LivePackager découpe en parties LL-HLS. L'enregistrement de la source (copie) à côté
+    # devient la vidéo à la fin du direct.
+    from apps.videos.tasks import BANDWIDTHS, QUALITY_HEIGHTS, get_quality_key
+    split_labels = "".join(f"[s{idx}]" for idx in range(len(qualities)))
+    filters = [f"[0:v:0]split={len(qualities)}{split_labels}"]
+    for idx, q in enumerate(qualities):
+        filters.append(f"[s{idx}]scale=-2:{QUALITY_HEIGHTS[get_quality_key(q)]}[v{idx}]")
+    args = ["-filter_complex", ";".join(filters)]
+    for idx, q in enumerate(qualities):
+        bitrate = int(BANDWIDTHS[get_quality_key(q)])
+        args += [
+            "-map", f"[v{idx}]",
+            f"-b:v:{idx}", str(bitrate), f"-maxrate:v:{idx}", str(int(bitrate * 1.07)), f"-bufsize:v:{idx}", str(bitrate)
+        ]
+    args += [
+        "-c:v", "libx264", "-preset", "veryfast", "-tune", "zerolatency", "-profile:v", "main", "-pix_fmt", "yuv420p",
+        "-force_key_frames", f"expr:gte(t,n_forced*{settings.LIVE_SEGMENT_DURATION})", "-sc_threshold", "0",
+        "-map", "0:a:0?", "-c:a", "aac", "-b:a", str(LIVE_AUDIO_BITRATE), "-ar", "48000",
+        "-f", "dash", "-streaming", "1", "-ldash", "1",
+        "-seg_duration", str(settings.LIVE_SEGMENT_DURATION),
+        "-frag_type", "duration", "-frag_duration", str(settings.LIVE_PART_DURATION),
+        "-use_template", "1", "-use_timeline", "0",
+        "-window_size", str(settings.LIVE_WINDOW_SEGMENTS), "-extra_window_size", str(settings.LIVE_WINDOW_SEGMENTS),
+        "-remove_at_exit", "0",
+        "-init_seg_name", "init-stream$RepresentationID$.m4s",
+        "-media_seg_name", "chunk-stream$RepresentationID$-$Number%05d$.m4s",
+        os.path.join(live_dir, "manifest.mpd"),
+        "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy", "-f", "matroska", os.path.join(live_dir, LIVE_RECORDING_NAME)
+    ]
+    return args
+
+class LiveIngestWorker:
+    def __init__(self, live_id):
+        self.live_id = live_id
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.video_id = None
+        self.qualities = list(settings.LIVE_QUALITIES)
+
+    def claim(self):
+        from apps.streaming.models import LiveStream
+        # Compare-and-swap : un seul worker par direct
+        return LiveStream.objects.filter(id=self.live_id, status='IDLE').update(status='STARTING', worker_id=self.worker_id)
+
+    def notify(self, message):
+        channel_layer = get_channel_layer()
+        if channel_layer is None or self.video_id is None:
+            return
+        group = get_live_group(self.video_id)
+        if async_to_sync(group_has_subscribers)(channel_layer, group):
+            async_to_sync(channel_layer.group_send)(group, message)
+
+    def on_part(self, msn, part):
+        self.notify({"type": "live_part", "msn": msn, "part": part})
+
+    def go_live(self, live, packager):
+        from apps.streaming.models import LiveStream
+        from apps.videos.models import Video
+        from apps.videos.events import publish_event
+        close_old_connections()
+        write_live_master(packager.live_dir, self.qualities, packager.has_audio)
+        video = Video.objects.create(
+            titre=live.titre, description=live.description, categorie=live.categorie, visibilite=live.visibilite,
+            envoyeur_id=live.envoyeur_id, fichier=os.path.relpath(os.path.join(packager.live_dir, LIVE_RECORDING_NAME), settings.MEDIA_ROOT)
+        )
+        LiveStream.objects.filter(id=live.id).update(status='LIVE', video=video, started_at=django_timezone.now())
+        self.video_id = video.id
+        publish_event("live_started", video_id=video.id, user_id=live.envoyeur_id)
+        print(f"🔴 Direct {live.id} à l'antenne (vidéo {video.id})")
+
+    def run(self):
+        from apps.streaming.models import LiveStream
+        if not self.claim():
+            return False
+        live = LiveStream.objects.get(id=self.live_id)
+        live_dir = get_live_dir(live.id)
+        shutil.rmtree(live_dir, ignore_errors=True)
+        os.makedirs(live_dir, exist_ok=True)
+
+        packager = LivePackager(live_dir, len(self.qualities), on_part=self.on_part)
+        cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", *live_input_args(live), *live_output_args(live_dir, self.qualities)]
+        # En mode PIPE, ffmpeg lit l'entrée standard de ce processus
+        process = subprocess.Popen(cmd, stdin=None if live.protocol == 'PIPE' else subprocess.DEVNULL)
+        packager.start()
+        print(f"🚀 Ingestion du direct {live.id} ({live.protocol}) : {get_ingest_url(live)}")
+        checked_at = time.monotonic()
+        try:
+            while process.poll() is None:
+                if self.video_id is None and packager.is_live():
+                    self.go_live(live, packager)
+                if time.monotonic() - checked_at >= settings.LIVE_STATUS_POLL_SECONDS:
+                    checked_at = time.monotonic()
+                    close_old_connections()
+                    if LiveStream.objects.filter(id=live.id, status='ENDING').exists():
+                        # SIGINT : ffmpeg termine proprement les segments et l'enregistrement
+                        process.send_signal(signal.SIGINT)
+                        process.wait()
+                time.sleep(settings.LIVE_PACKAGER_POLL_SECONDS)
+        except KeyboardInterrupt:
+            process.send_signal(signal.SIGINT)
+            process.wait()
+        finally:
+            packager.stop()
+            self.finish(live, process.returncode)
+        return True
+
+    def finish(self, live, returncode):
+        from apps.streaming.models import LiveStream
+        from apps.videos.models import Video, VideoInfo
+        from apps.videos.events import publish_event
+        from apps.videos.scheduler import video_processing_scheduler
+        close_old_connections()
+        if self.video_id is None:
+            # Jamais passé à l'antenne (émetteur absent, flux illisible) : la clé reste utilisable
+            status = 'ENDED' if LiveStream.objects.filter(id=live.id, status='ENDING').exists() else 'IDLE'
+            LiveStream.objects.filter(id=live.id).update(status=status, worker_id=None)
+            print(f"[❕] Direct {live.id} terminé sans diffusion (code ffmpeg {returncode})")
+            return
+        LiveStream.objects.filter(id=live.id).update(status='ENDED', worker_id=None, ended_at=django_timezone.now())
+        self.notify({"type": "live_ended", "video_id": self.video_id})
+        publish_event("live_ended", video_id=self.video_id, user_id=live.envoyeur_id)
+        recording = os.path.join(get_live_dir(live.id), LIVE_RECORDING_NAME)
+        if os.path.exists(recording) and os.path.getsize(recording) > 0 and Video.objects.filter(id=self.video_id).exists():
+            # L'enregistrement suit ensuite le chemin d'une vidéo envoyée : miniature puis conversion VOD.
+            # Les informations éventuellement sondées pendant le direct (durée partielle) sont recalculées.
+            VideoInfo.objects.filter(video_id=self.video_id).delete()
+            video_processing_scheduler.submit("THUMBNAILS", self.video_id)
+            video_processing_scheduler.submit("CONVERSION", self.video_id)
+        print(f"✅ Direct {live.id} terminé, vidéo {self.video_id} en conversion")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.streaming.models import LiveStream
+from apps.streaming.live import LiveIngestWorker
+
+class Command(BaseCommand):
+    help = "Lance l'ingestion d'un direct : écoute SRT/RTMP (ou lit l'entrée standard en PIPE), transcode l'échelle de qualités et publie la playlist LL-HLS."
+
+    def add_arguments(self, parser):
+        parser.add_argument('live_id', type=int, help="Identifiant du direct (LiveStream)")
+        parser.add_argument('--force', action='store_true', help="Reprend un direct resté bloqué par un worker arrêté brutalement")
+
+    def handle(self, *args, **options):
+        live_id = options['live_id']
+        if not LiveStream.objects.filter(id=live_id).exists():
+            raise CommandError(f"Direct introuvable : {live_id}")
+        if options['force']:
+            LiveStream.objects.filter(id=live_id, status__in=['STARTING', 'LIVE', 'ENDING']).update(status='IDLE', worker_id=None)
+        if not LiveIngestWorker(live_id).run():
+            raise CommandError(f"Le direct {live_id} n'est pas disponible (déjà en cours ou terminé)")
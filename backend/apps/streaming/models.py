@@ -1,6 +1,11 @@
 from django.db import models
 from apps.videos.models import Video
 from apps.users.models import User, default_created_at
+import secrets
+import uuid
+
+def generate_stream_key():
+    return secrets.token_urlsafe(24)
 
 class VideoWatch(models.Model):
     video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="watches")
@@ -11,12 +16,52 @@ class VideoWatch(models.Model):
     playback_speed = models.FloatField(default=1.0)
     last_watch = models.DateTimeField(default=default_created_at) 
 
+    def __str__(self):
+        return f"{self.user} watching {self.video} at {self.last_position}s"
+    
     class Meta:
+        # Une seule classe Meta : la seconde écrasait la première et perdait la contrainte d'unicité,
+        # nécessaire à l'upsert du tampon de positions de lecture
         unique_together = ('video', 'user')
-        db_table = "videowatch"
+        db_table = "video_watch"
+
+class LiveStream(models.Model):
+    STATUS_CHOICES = (
+        ('IDLE', 'Idle'),
+        ('STARTING', 'Starting'),
+        ('LIVE', 'Live'),
+        ('ENDING', 'Ending'),
+        ('ENDED', 'Ended'),
+        ('FAILED', 'Failed'),
+    )
+    PROTOCOLS = (
+        ('PIPE', 'Pipe'),
+        ('SRT', 'SRT'),
+        ('RTMP', 'RTMP'),
+    )
+
+    code_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    # Secret de l'émetteur : chemin RTMP, streamid/passphrase SRT
+    stream_key = models.CharField(max_length=64, unique=True, default=generate_stream_key)
+    envoyeur = models.ForeignKey(User, on_delete=models.CASCADE, related_name="live_streams")
+    titre = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    categorie = models.CharField(max_length=200, blank=True, null=True)
+    visibilite = models.CharField(max_length=200, choices=[(x, x) for x in ['PUBLIC', 'PRIVATE', 'UNLISTED']], default='PUBLIC')
+    protocol = models.CharField(max_length=10, choices=PROTOCOLS, default='RTMP')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='IDLE')
+    # Vidéo créée au passage à l'antenne : même id pour le lecteur et les commentaires pendant et après le direct
+    video = models.OneToOneField(Video, on_delete=models.SET_NULL, null=True, blank=True, related_name="live_stream")
+    worker_id = models.CharField(max_length=255, null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=default_created_at)
 
     def __str__(self):
-        return f"{self.user} watching {self.video} at {self.last_position}s"
-    
+        return f"{self.titre} ({self.status})"
+
     class Meta:
-        db_table = "video_watch"
\ No newline at end of file
+        db_table = "live_stream"
+        indexes = [
+            models.Index(fields=['status', 'started_at']),
+        ]
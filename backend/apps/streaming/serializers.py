@@ -1,7 +1,38 @@
 from rest_framework import serializers
-from apps.streaming.models import VideoWatch
+from django.conf import settings
+from apps.streaming.models import VideoWatch, LiveStream
+from apps.streaming.live import LIVE_MASTER_NAME, get_ingest_url
 
 class VideoWatchSerializer(serializers.ModelSerializer):
     class Meta:
         model = VideoWatch
-        fields = ['video', 'user', 'last_position', 'quality', 'playback_speed', 'volume', 'last_watch']
\ No newline at end of file
+        fields = ['video', 'user', 'last_position', 'quality', 'playback_speed', 'volume', 'last_watch']
+
+class LiveStreamSerializer(serializers.ModelSerializer):
+    manifest_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LiveStream
+        fields = [
+            'id', 'code_id', 'titre', 'description', 'categorie', 'visibilite', 'protocol', 'status',
+            'video', 'manifest_url', 'started_at', 'ended_at', 'created_at'
+        ]
+        read_only_fields = ['status', 'video', 'started_at', 'ended_at', 'created_at']
+
+    def get_manifest_url(self, obj):
+        if obj.status not in ('LIVE', 'ENDING'):
+            return None
+        return f"{settings.BASE_URL}/api/live/{obj.id}/hls/{LIVE_MASTER_NAME}"
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        # Clé et adresse d'ingestion : réservées à l'émetteur
+        request = self.context.get("request", None)
+        if request is not None and request.user.is_authenticated and request.user.id == instance.envoyeur_id:
+            representation['stream_key'] = instance.stream_key
+            representation['ingest_url'] = get_ingest_url(instance)
+        return representation
+
+    def create(self, validated_data):
+        validated_data['envoyeur'] = self.context['request'].user
+        return LiveStream.objects.create(**validated_data)
@@ -1,6 +1,16 @@
 from django.urls import path
-from apps.streaming.views import VideoWatchUpdateView
+from apps.streaming.views import (
+    VideoWatchUpdateView, LiveStreamListView, LiveStreamCreateView, LiveStreamDetailView, LiveStreamEndView,
+    LiveMediaView, live_playlist_view
+)
 
 urlpatterns = [
     path('videowatch/<uuid:code_id>/', VideoWatchUpdateView.as_view(), name='video_watch_update'),
-]
\ No newline at end of file
+    path('live/', LiveStreamListView.as_view(), name='live-list'),
+    path('live/create/', LiveStreamCreateView.as_view(), name='live-create'),
+    path('live/<int:live_id>/', LiveStreamDetailView.as_view(), name='live-detail'),
+    path('live/<int:live_id>/end/', LiveStreamEndView.as_view(), name='live-end'),
+    # Playlists LL-HLS (rechargement bloquant) puis maîtresse, init et segments (LIVE_MEDIA_NAME)
+    path('live/<int:live_id>/hls/stream<int:stream>.m3u8', live_playlist_view, name='live-playlist'),
+    path('live/<int:live_id>/hls/<str:name>', LiveMediaView.as_view(), name='live-media'),
+]
@@ -1,11 +1,23 @@
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from apps.streaming.models import VideoWatch
-from apps.streaming.serializers import VideoWatchSerializer
-from apps.users.models import default_created_at
+from rest_framework.exceptions import AuthenticationFailed
+from apps.streaming.buffer import watch_progress_buffer
+from apps.streaming.live import get_live_dir, read_live_state, is_part_available, can_watch_live, LIVE_MEDIA_NAME
+from apps.videos.models import Video
+from apps.streaming.models import LiveStream
+from apps.streaming.serializers import VideoWatchSerializer, LiveStreamSerializer
+from helpers.media import file_response
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.core.exceptions import SuspiciousFileOperation
+from asgiref.sync import sync_to_async
+import asyncio
+import time
+import os
 
 class VideoWatchUpdateView(APIView):
     permission_classes = [IsAuthenticated]
@@ -27,11 +39,12 @@ class VideoWatchUpdateView(APIView):
     )
     def get(self, request, code_id):
         try:
-            video_watch = VideoWatch.objects.get(video__code_id=code_id, user=request.user)
+            video_id = Video.objects.filter(code_id=code_id).values_list('id', flat=True).first()
+            video_watch = watch_progress_buffer.get(request.user.id, video_id) if video_id else None
+            if video_watch is None:
+                return Response({"erreur": "Session de visionnage non trouvée"}, status=404)
             serializer = VideoWatchSerializer(video_watch)
             return Response(serializer.data, status=200)
-        except VideoWatch.DoesNotExist:
-            return Response({"erreur": "Session de visionnage non trouvée"}, status=404)
         except Exception as e:
             return Response({"erreur": str(e)}, status=500)
 
@@ -49,6 +62,10 @@ class VideoWatchUpdateView(APIView):
         ),
         responses={
             200: VideoWatchSerializer(),
+            404: openapi.Response(
+                description="Vidéo non trouvée",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"erreur": openapi.Schema(type=openapi.TYPE_STRING)})
+            ),
             500: openapi.Response(
                 description="Erreur serveur",
                 schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"erreur": openapi.Schema(type=openapi.TYPE_STRING)})
@@ -57,25 +74,157 @@ class VideoWatchUpdateView(APIView):
     )
     def post(self, request, code_id):
         try:
-            video_watch, created = VideoWatch.objects.get_or_create(
-                video__code_id=code_id,
-                user=request.user,
-                defaults={
-                    'last_position': request.data.get('last_position', 0.0),
-                    'quality': request.data.get('quality', 'auto'),
-                    'playback_speed': request.data.get('playback_speed', 1.0),
-                    'volume': request.data.get('volume', 1.0),
-                    'last_watch': default_created_at()
-                }
+            video_id = Video.objects.filter(code_id=code_id).values_list('id', flat=True).first()
+            if video_id is None:
+                return Response({"erreur": "Vidéo non trouvée"}, status=404)
+            # Écriture différée : la position est fusionnée dans le tampon, écrit en base par lots
+            watch_progress_buffer.update(
+                request.user.id, video_id,
+                last_position=request.data.get('last_position'),
+                quality=request.data.get('quality'),
+                playback_speed=request.data.get('playback_speed'),
+                volume=request.data.get('volume')
             )
-            if not created:
-                video_watch.last_position = request.data.get('last_position', video_watch.last_position)
-                video_watch.quality = request.data.get('quality', video_watch.quality)
-                video_watch.playback_speed = request.data.get('playback_speed', video_watch.playback_speed)
-                video_watch.volume = request.data.get('volume', video_watch.volume)
-                video_watch.last_watch = default_created_at()
-                video_watch.save()
+            video_watch = watch_progress_buffer.get(request.user.id, video_id)
             serializer = VideoWatchSerializer(video_watch)
             return Response(serializer.data, status=200)
         except Exception as e:
-            return Response({"erreur": str(e)}, status=500)
\ No newline at end of file
+            return Response({"erreur": str(e)}, status=500)
+
+class LiveStreamListView(APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Liste les directs publics en cours",
+        tags=["Live"],
+        responses={200: LiveStreamSerializer(many=True)}
+    )
+    def get(self, request):
+        lives = LiveStream.objects.filter(status='LIVE', visibilite='PUBLIC').order_by('-started_at')
+        return Response(LiveStreamSerializer(lives, many=True, context={'request': request}).data, status=200)
+
+class LiveStreamCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Crée un direct et renvoie sa clé et son adresse d'ingestion (PIPE, SRT ou RTMP)",
+        tags=["Live"],
+        request_body=LiveStreamSerializer,
+        responses={
+            201: LiveStreamSerializer(),
+            400: openapi.Response(description="Données invalides")
+        }
+    )
+    def post(self, request):
+        serializer = LiveStreamSerializer(data=request.data, context={'request': request})
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=201)
+        return Response(serializer.errors, status=400)
+
+class LiveStreamDetailView(APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Récupère l'état d'un direct",
+        tags=["Live"],
+        responses={
+            200: LiveStreamSerializer(),
+            404: openapi.Response(
+                description="Direct non trouvé",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"erreur": openapi.Schema(type=openapi.TYPE_STRING)})
+            )
+        }
+    )
+    def get(self, request, live_id):
+        live = LiveStream.objects.filter(id=live_id).first()
+        if live is None or not can_watch_live(live, request.user):
+            return Response({"erreur": "Direct non trouvé"}, status=404)
+        return Response(LiveStreamSerializer(live, context={'request': request}).data, status=200)
+
+class LiveStreamEndView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Termine un direct : le worker d'ingestion arrête ffmpeg et l'enregistrement devient une vidéo",
+        tags=["Live"],
+        responses={
+            200: LiveStreamSerializer(),
+            404: openapi.Response(
+                description="Direct non trouvé",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"erreur": openapi.Schema(type=openapi.TYPE_STRING)})
+            )
+        }
+    )
+    def post(self, request, live_id):
+        live = LiveStream.objects.filter(id=live_id, envoyeur=request.user).first()
+        if live is None:
+            return Response({"erreur": "Direct non trouvé"}, status=404)
+        # Sans worker, le direct se termine tout de suite ; sinon le worker voit ENDING et s'arrête
+        LiveStream.objects.filter(id=live.id, status='IDLE').update(status='ENDED')
+        LiveStream.objects.filter(id=live.id, status__in=['STARTING', 'LIVE']).update(status='ENDING')
+        live.refresh_from_db()
+        return Response(LiveStreamSerializer(live, context={'request': request}).data, status=200)
+
+class LiveMediaView(APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Sert la playlist maîtresse et les segments CMAF d'un direct (plages d'octets acceptées)",
+        tags=["Live"]
+    )
+    def get(self, request, live_id, name):
+        if not LIVE_MEDIA_NAME.match(name):
+            return Response({"erreur": "Fichier non trouvé"}, status=404)
+        live = LiveStream.objects.filter(id=live_id).only('id', 'visibilite', 'envoyeur_id').first()
+        if live is None or not can_watch_live(live, request.user):
+            return Response({"erreur": "Fichier non trouvé"}, status=404)
+        try:
+            return file_response(request, safe_join(get_live_dir(live_id), name))
+        except (Http404, SuspiciousFileOperation):
+            return Response({"erreur": "Fichier non trouvé"}, status=404)
+
+def get_request_user(request):
+    # Vue Django hors DRF : même authentification JWT que les APIView, None sans token valide
+    from apps.users.authentication import CachedJWTAuthentication
+    try:
+        result = CachedJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+async def live_playlist_view(request, live_id, stream):
+    # Playlist LL-HLS avec rechargement bloquant (_HLS_msn / _HLS_part) : la réponse part dès que la partie
+    # demandée est publiée, sans que le lecteur ait à interroger en boucle. Vue asynchrone : l'attente
+    # n'occupe pas de thread.
+    live = await LiveStream.objects.filter(id=live_id).only('id', 'visibilite', 'envoyeur_id').afirst()
+    if live is None:
+        return HttpResponse(status=404)
+    if live.visibilite == 'PRIVATE' and not can_watch_live(live, await sync_to_async(get_request_user)(request)):
+        return HttpResponse(status=404)
+    live_dir = get_live_dir(live_id)
+    try:
+        msn = int(request.GET['_HLS_msn']) if '_HLS_msn' in request.GET else None
+        part = int(request.GET['_HLS_part']) if '_HLS_part' in request.GET else None
+    except ValueError:
+        return HttpResponse(status=400)
+    if msn is not None:
+        state = read_live_state(live_dir)
+        last = state.get("streams", {}).get(str(stream))
+        # Demande trop en avance (plus de deux segments) : refusée tout de suite, comme l'exige LL-HLS
+        if last is not None and msn > last[0] + 2:
+            return HttpResponse(status=400)
+        deadline = time.monotonic() + 3 * settings.LIVE_SEGMENT_DURATION
+        while not is_part_available(state, stream, msn, part):
+            if time.monotonic() >= deadline:
+                return HttpResponse(status=503)
+            await asyncio.sleep(settings.LIVE_PACKAGER_POLL_SECONDS)
+            state = read_live_state(live_dir)
+    try:
+        with open(os.path.join(live_dir, f"stream{stream}.m3u8"), 'rb') as f:
+            content = f.read()
+    except OSError:
+        return HttpResponse(status=404)
+    response = HttpResponse(content, content_type='application/vnd.apple.mpegurl')
+    response['Cache-Control'] = 'no-cache'
+    return response
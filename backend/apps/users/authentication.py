@@ -1,11 +1,36 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth.hashers import make_password
-from apps.users.models import User
-import uuid
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from apps.users.cache import user_cache, anonymous_identity
 from helpers.helper import get_token_from_request, get_user
 
+class CachedJWTAuthentication(JWTAuthentication):
+    # Même contrôles que JWTAuthentication, mais token validé et utilisateur servis depuis le cache
+    def get_validated_token(self, raw_token):
+        try:
+            return user_cache.get_token(raw_token)
+        except TokenError:
+            # Laisse JWTAuthentication produire son message d'erreur détaillé
+            return super().get_validated_token(raw_token)
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        user = user_cache.get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+        return user
+
 class AnonymousOrAuthenticated(BaseAuthentication):
     def authenticate(self, request):
         try:
@@ -17,22 +42,9 @@ class AnonymousOrAuthenticated(BaseAuthentication):
                     raise AuthenticationFailed("Token invalide.")
                 return (user, token)
             else:
-                anonymous_user, _ = User.objects.get_or_create(
-                    email='anonymous@anonymous.com',
-                    is_anonymous=True,
-                    defaults={
-                        'sexe': 'I',
-                        'birth_date': '1000-01-01',
-                        'name': 'anonymous',
-                        'password': make_password("An0nym0us!@?1000_01/01."),
-                        'is_staff': False,
-                        'is_superuser': False,
-                        'is_verified': True,
-                        'is_active': True
-                    }
-                )
-                refresh = RefreshToken.for_user(anonymous_user)
-                token = str(refresh.access_token)
+                # Utilisateur anonyme et token mémorisés pour le processus : aucune requête SQL ni signature
+                anonymous_user = anonymous_identity.get_user()
+                token = anonymous_identity.get_access_token()
                 
                 request.user = anonymous_user
                 request.auth = f'Bearer {token}'
@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from collections import OrderedDict
+from threading import Lock
+import copy
+import time
+
+ANONYMOUS_EMAIL = 'anonymous@anonymous.com'
+
+class TTLCache:
+    # LRU borné dont les entrées expirent : la durée de vie borne l'écart avec la base
+    # quand la modification a eu lieu dans un autre processus (pas de signal reçu ici)
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class UserCache:
+    def __init__(self):
+        self.users = TTLCache(settings.USER_CACHE_SIZE)
+        self.tokens = TTLCache(settings.USER_CACHE_TOKEN_SIZE)
+
+    def get_user(self, user_id):
+        from apps.users.models import User
+        # Le claim du token est une chaîne, les signaux donnent un entier : clé normalisée
+        key = str(user_id)
+        user = self.users.get(key)
+        if user is None:
+            user = User.objects.filter(id=user_id).first()
+            if user is None:
+                return None
+            self.users.put(key, user, settings.USER_CACHE_TTL_SECONDS)
+        # Copie par requête : les vues peuvent modifier request.user sans toucher l'instance partagée
+        return copy.copy(user)
+
+    def get_token(self, raw_token):
+        # Un token déjà validé n'est plus re-décodé ni re-signé jusqu'à son expiration
+        if isinstance(raw_token, bytes):
+            raw_token = raw_token.decode()
+        token = self.tokens.get(raw_token)
+        if token is None:
+            token = AccessToken(raw_token)
+            ttl = token.get('exp', 0) - time.time()
+            if ttl > 0:
+                self.tokens.put(raw_token, token, ttl)
+        return token
+
+    def get_user_from_token(self, raw_token):
+        token = self.get_token(raw_token)
+        user_id = token.get(api_settings.USER_ID_CLAIM)
+        return self.get_user(user_id) if user_id else None
+
+    def invalidate(self, user_id):
+        self.users.invalidate(str(user_id))
+
+user_cache = UserCache()
+
+class AnonymousIdentity:
+    # Utilisateur anonyme partagé par tout le processus, et son token d'accès réémis seulement
+    # à l'approche de son expiration au lieu d'un nouveau token par requête
+    def __init__(self):
+        self.lock = Lock()
+        self.user = None
+        self.token = None
+        self.token_expires_at = 0
+
+    def get_user(self):
+        from apps.users.models import User
+        with self.lock:
+            user = self.user
+        if user is None:
+            # Hors du verrou : la création déclenche post_save, qui appelle invalidate()
+            user, _ = User.objects.get_or_create(
+                email=ANONYMOUS_EMAIL,
+                is_anonymous=True,
+                defaults={
+                    'sexe': 'I',
+                    'birth_date': '1000-01-01',
+                    'name': 'anonymous',
+                    'password': make_password("An0nym0us!@?1000_01/01."),
+                    'is_staff': False,
+                    'is_superuser': False,
+                    'is_verified': True,
+                    'is_active': True
+                }
+            )
+            with self.lock:
+                self.user = user
+        return copy.copy(user)
+
+    def get_access_token(self):
+        user = self.get_user()
+        with self.lock:
+            if self.token is None or self.token_expires_at - time.time() < settings.ANONYMOUS_TOKEN_REFRESH_SECONDS:
+                token = AccessToken.for_user(user)
+                self.token, self.token_expires_at = str(token), token['exp']
+            return self.token
+
+    def invalidate(self, user_id=None):
+        with self.lock:
+            if self.user is not None and (user_id is None or self.user.id == user_id):
+                self.user = None
+                self.token = None
+
+anonymous_identity = AnonymousIdentity()
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.users.models import User
+from apps.users.cache import user_cache, anonymous_identity
+
+# Toute modification d'un utilisateur (mot de passe, is_active, profil...) sort immédiatement du cache de ce processus
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    user_cache.invalidate(instance.id)
+    anonymous_identity.invalidate(instance.id)
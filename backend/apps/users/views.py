@@ -12,6 +12,7 @@ from django.contrib.auth.hashers import make_password
 
 from apps.users.serializers import UserSerializer, LoginSerializer, RegisterSerializer, UpdateProfileSerializer
 from apps.users.models import User, UserOtp, default_created_at
+from apps.users.cache import anonymous_identity
 
 from dotenv import load_dotenv
 from django.core.validators import EmailValidator
@@ -70,10 +71,7 @@ class ProfileAnonymousView(APIView):
     )
     def get(self, request: Request):
         try:
-            user, _= User.objects.get_or_create(email='anonymous@anonymous.com',is_anonymous=True,defaults={
-                'sexe':'I','birth_date':'1000-01-01','name':'anonymous','password':make_password("An0nym0us!@?1000_01/01.")
-                , 'is_staff':False, 'is_superuser':False, 'is_verified':True, 'is_active':True
-            })
+            user = anonymous_identity.get_user()
             refresh = RefreshToken.for_user(user)
             return Response({"refresh":str(refresh),"access":str(refresh.access_token)}, status=200)
         except Exception as e:
@@ -0,0 +1,126 @@
+from django.conf import settings
+import shutil
+import ffmpeg
+import os
+
+from apps.videos.dash import parse_media_playlist, measure_bandwidth, get_codecs
+
+# Chaînes RFC 6381 : profil (et octet de contraintes) selon le nom donné par ffprobe, niveau ajouté ensuite
+AVC_PROFILES = {
+    "Constrained Baseline": "42e0",
+    "Baseline": "4200",
+    "Main": "4d40",
+    "High": "6400",
+    "High 10": "6e00",
+    "High 4:2:2": "7a00",
+    "High 4:4:4 Predictive": "f400",
+}
+HEVC_PROFILES = {"Main": "1.6", "Main 10": "2.4"}
+AAC_PROFILES = {"LC": "mp4a.40.2", "HE-AAC": "mp4a.40.5", "HE-AACv2": "mp4a.40.29"}
+AUDIO_CODECS = {"mp3": "mp4a.40.34", "ac3": "ac-3", "eac3": "ec-3"}
+
+def measure_average_bandwidth(playlist):
+    total_size = total_duration = 0
+    for duration, path, media_range in playlist["segments"]:
+        total_size += media_range[1] - media_range[0] + 1 if media_range else os.path.getsize(path)
+        total_duration += duration
+    return int(total_size * 8 / total_duration) if total_duration > 0 else 0
+
+def parse_frame_rate(value):
+    num, _, den = (value or "0/0").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0
+
+def format_codec(stream):
+    codec, profile, level = stream.get("codec_name"), stream.get("profile", ""), stream.get("level", 0)
+    if codec == "h264" and profile in AVC_PROFILES and level > 0:
+        return f"avc1.{AVC_PROFILES[profile]}{level:02x}"
+    if codec == "hevc" and profile in HEVC_PROFILES and level > 0:
+        return f"hvc1.{HEVC_PROFILES[profile]}.L{level}.B0"
+    if codec == "aac":
+        return AAC_PROFILES.get(profile, "mp4a.40.2")
+    return AUDIO_CODECS.get(codec)
+
+def analyze_rendition(manifest):
+    # Débit crête (segment le plus lourd) et moyen mesurés sur les segments produits ; résolution, codec et
+    # cadence lus dans le flux lui-même (segment d'initialisation en CMAF, premier segment en MPEG-TS)
+    playlist = parse_media_playlist(manifest)
+    stats = {
+        "bandwidth": measure_bandwidth(playlist), "average_bandwidth": measure_average_bandwidth(playlist),
+        "resolution": None, "codecs": None, "frame_rate": None, "start_pts": None
+    }
+    target = playlist["init"][0] if playlist["init"] is not None else (playlist["segments"][0][1] if playlist["segments"] else None)
+    if target is None:
+        return stats
+    try:
+        streams = ffmpeg.probe(target)["streams"]
+    except Exception as e:
+        print(f"Erreur lors de l'analyse de {manifest} : {e}")
+        streams = []
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is not None:
+        if video.get("width") and video.get("height"):
+            stats["resolution"] = f"{video['width']}x{video['height']}"
+        stats["frame_rate"] = parse_frame_rate(video.get("avg_frame_rate")) or parse_frame_rate(video.get("r_frame_rate")) or None
+        # Premier PTS du premier segment MPEG-TS, en horloge 90 kHz (X-TIMESTAMP-MAP des sous-titres)
+        if playlist["init"] is None and video.get("start_time") not in (None, "N/A"):
+            stats["start_pts"] = round(float(video["start_time"]) * 90000)
+    # avcC/esds du segment d'initialisation : octet de contraintes exact ; sinon reconstruit depuis ffprobe
+    stats["codecs"] = get_codecs(playlist["init"]) if playlist["init"] is not None else None
+    if stats["codecs"] is None:
+        stats["codecs"] = ",".join(filter(None, (format_codec(s) for s in streams))) or None
+    return stats
+
+def analyze_audio(audio_manifests):
+    # Le lecteur ajoute une seule piste audio à la vidéo : la plus lourde borne le débit de chaque variante,
+    # et CODECS doit annoncer tous les formats du groupe audio
+    audio = [analyze_rendition(manifest) for _, manifest in audio_manifests if os.path.exists(manifest)]
+    codecs = []
+    for track in audio:
+        for codec in (track["codecs"] or "").split(","):
+            if codec and codec not in codecs:
+                codecs.append(codec)
+    return {
+        "bandwidth": max((track["bandwidth"] for track in audio), default=0),
+        "average_bandwidth": max((track["average_bandwidth"] for track in audio), default=0),
+        "codecs": codecs,
+    }
+
+def analyze_ladder(variant_manifests, audio_manifests, frame_rate=None, prune=True):
+    # Étape après empaquetage : valeurs mesurées à la place des débits et résolutions visés, puis retrait des
+    # qualités qui n'apportent rien (pas nettement moins lourdes que celle du dessus : même coût, image moindre).
+    # Renvoie les variantes gardées (débit vidéo seul, comme le veut le MPD) et, par qualité, les attributs
+    # du master (BANDWIDTH/AVERAGE-BANDWIDTH avec l'audio, CODECS, FRAME-RATE).
+    from apps.videos.tasks import BANDWIDTHS, get_quality_key
+    audio = analyze_audio(audio_manifests)
+    measured = []
+    for q, manifest, bandwidth, resolution in variant_manifests:
+        if os.path.exists(manifest):
+            stats = analyze_rendition(manifest)
+        else:
+            # Qualité à la demande (JIT) pas encore produite : débit visé par l'encodeur
+            target = int(BANDWIDTHS[get_quality_key(q)])
+            stats = {"bandwidth": target, "average_bandwidth": target, "resolution": None, "codecs": None, "frame_rate": None, "start_pts": None}
+        measured.append((q, manifest, stats["bandwidth"] or int(bandwidth), stats["resolution"] or resolution, stats))
+
+    kept = measured[:1]
+    for entry in measured[1:]:
+        if prune and entry[4]["average_bandwidth"] * settings.VIDEO_LADDER_MIN_STEP > kept[-1][4]["average_bandwidth"]:
+            print(f"[❕] Qualité {entry[0]} retirée : {entry[4]['average_bandwidth']} b/s pour {kept[-1][4]['average_bandwidth']} b/s au-dessus")
+            shutil.rmtree(os.path.dirname(entry[1]), ignore_errors=True)
+            continue
+        kept.append(entry)
+
+    ladder_stats = {}
+    for q, _, bandwidth, _, stats in kept:
+        codecs = [stats["codecs"].split(",")[0]] if stats["codecs"] else []
+        ladder_stats[q] = {
+            "bandwidth": bandwidth + audio["bandwidth"],
+            "average_bandwidth": stats["average_bandwidth"] + audio["average_bandwidth"],
+            "codecs": ",".join(codecs + audio["codecs"]) if codecs else None,
+            "frame_rate": stats["frame_rate"] or frame_rate,
+            "start_pts": stats["start_pts"],
+        }
+    return [(q, manifest, bandwidth, resolution) for q, manifest, bandwidth, resolution, _ in kept], ladder_stats
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class VideosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.videos'
+
+    def ready(self):
+        import apps.videos.signals
@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.db import transaction, IntegrityError
+from django.db.models import F, Q
+import shutil
+import time
+import os
+
+from apps.videos.models import MediaBlob, Video, VideoInfo, VideoRendition, VideoProcessingTask
+
+def get_blob_name(sha256, name):
+    return os.path.join("videos", "blobs", sha256, default_storage.get_valid_name(os.path.basename(name)))
+
+def get_blob_dir(sha256):
+    return os.path.join(settings.MEDIA_ROOT, "videos", "blobs", sha256)
+
+def store_blob_file(full_path, path=None, file=None):
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    if path is not None:
+        os.replace(path, full_path)
+    elif hasattr(file, 'temporary_file_path'):
+        file_move_safe(file.temporary_file_path(), full_path)
+    else:
+        with open(full_path, 'wb') as f:
+            for block in file.chunks(settings.UPLOAD_BUFFER_SIZE):
+                f.write(block)
+
+def acquire_blob(sha256, size, name, path=None, file=None):
+    # Prend une référence sur le contenu d'empreinte sha256. Déjà connu : le fichier reçu (chemin "path" ou
+    # fichier envoyé "file") est abandonné ; sinon il est rangé, sans recopie, dans le répertoire du contenu.
+    while True:
+        blob = MediaBlob.objects.filter(sha256=sha256).first()
+        if blob is not None:
+            # Incrément conditionnel : si le dernier référent vient de libérer le contenu, on le recrée
+            if MediaBlob.objects.filter(id=blob.id, ref_count__gt=0).update(ref_count=F('ref_count') + 1):
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+                print(f"♻️ Contenu déjà connu ({sha256[:12]}) : fichier et conversion partagés")
+                return blob
+            continue
+        fichier = get_blob_name(sha256, name)
+        try:
+            with transaction.atomic():
+                blob = MediaBlob.objects.create(sha256=sha256, size=size, fichier=fichier, ref_count=1)
+                store_blob_file(os.path.join(settings.MEDIA_ROOT, fichier), path, file)
+        except IntegrityError:
+            # Envoi concurrent du même contenu : l'autre a créé la ligne, on y prend une référence
+            continue
+        return blob
+
+def release_blob(blob_id):
+    # Le dernier référent emporte le contenu : fichier source, qualités et manifestes partagés.
+    # Suppression du répertoire avant la fin de la transaction, pour qu'un nouvel envoi du même contenu
+    # ne range pas son fichier dans un répertoire sur le point d'être supprimé.
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(id=blob_id).first()
+        if blob is None:
+            return False
+        MediaBlob.objects.filter(id=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        deleted, _ = MediaBlob.objects.filter(id=blob_id, ref_count=0).delete()
+        if deleted:
+            shutil.rmtree(get_blob_dir(blob.sha256), ignore_errors=True)
+            print(f"🗑️ Contenu {blob.sha256[:12]} supprimé (plus aucune vidéo)")
+    return bool(deleted)
+
+def get_blob_video_id(sha256):
+    # Vidéo de référence d'un contenu partagé : la plus ancienne, qui porte les qualités générées à la demande
+    return Video.objects.filter(blob__sha256=sha256).order_by('id').values_list('id', flat=True).first()
+
+def hand_over_renditions(video):
+    # Avant la suppression de la vidéo de référence : ses qualités générées à la demande restent sur le disque,
+    # leur suivi (taille, accès) passe à la vidéo suivante du même contenu
+    successor = Video.objects.filter(blob_id=video.blob_id).exclude(id=video.id).order_by('id').values_list('id', flat=True).first()
+    if successor is not None:
+        VideoRendition.objects.filter(video_id=video.id).update(video_id=successor)
+
+def get_converted_video(blob_id, exclude_id=None):
+    return Video.objects.filter(blob_id=blob_id, master_manifest_file__gt='').exclude(id=exclude_id).order_by('id').first()
+
+def share_blob_media(video, source):
+    # Aucune conversion : même VideoInfo, même descriptor (les chemins pointent vers le répertoire du contenu)
+    from apps.videos.playback import get_playback_descriptor, write_descriptor
+    descriptor = get_playback_descriptor(source.id)
+    if descriptor is None:
+        return False
+    info = VideoInfo.objects.filter(video_id=source.id).values(
+        'qualities', 'audio_languages', 'subtitle_languages', 'fps', 'width', 'height', 'duration', 'size'
+    ).first()
+    if info is not None:
+        VideoInfo.objects.get_or_create(video_id=video.id, defaults=info)
+    write_descriptor(video.id, {**descriptor, "video_id": video.id, "revision": time.time_ns()})
+    Video.objects.filter(id=video.id).update(master_manifest_file=source.master_manifest_file.name, segments_dir=source.segments_dir)
+    print(f"♻️ Vidéo {video.id} : qualités de la vidéo {source.id} réutilisées, conversion évitée")
+    return True
+
+def claim_blob_conversion(video):
+    # Une seule conversion par contenu. True : cette vidéo convertit (première, ou reprise de sa propre
+    # conversion interrompue). False : contenu déjà converti (qualités partagées tout de suite) ou en cours
+    # de conversion par une autre vidéo (partagées à la fin de celle-ci).
+    claim = Q(status='PENDING') | Q(status='PROCESSING', processing_video_id=video.id)
+    if MediaBlob.objects.filter(claim, id=video.blob_id).update(status='PROCESSING', processing_video_id=video.id):
+        return True
+    blob = MediaBlob.objects.get(id=video.blob_id)
+    if blob.status == 'READY':
+        source = get_converted_video(blob.id, exclude_id=video.id)
+        if source is not None and share_blob_media(video, source):
+            return False
+        # Plus aucune vidéo convertie pour ce contenu : on reconvertit
+        MediaBlob.objects.filter(id=blob.id).update(status='PROCESSING', processing_video_id=video.id)
+        return True
+    # Conversion en cours ailleurs, sauf si sa tâche n'est plus active (processus tué, vidéo supprimée) : reprise
+    converting = VideoProcessingTask.objects.filter(
+        video_id=blob.processing_video_id, task_type='CONVERSION', status__in=['PENDING', 'PROCESSING']
+    ).exists()
+    if not converting and MediaBlob.objects.filter(id=blob.id, status='PROCESSING', processing_video_id=blob.processing_video_id).update(processing_video_id=video.id):
+        return True
+    print(f"⏳ Vidéo {video.id} : contenu en cours de conversion par la vidéo {blob.processing_video_id}")
+    return False
+
+def complete_blob_conversion(video):
+    MediaBlob.objects.filter(id=video.blob_id, processing_video_id=video.id).update(status='READY')
+    video = Video.objects.get(id=video.id)
+    # Vidéos du même contenu arrivées pendant la conversion
+    for sibling in Video.objects.filter(blob_id=video.blob_id).exclude(id=video.id).filter(Q(master_manifest_file__isnull=True) | Q(master_manifest_file='')):
+        share_blob_media(sibling, video)
+
+def fail_blob_conversion(video):
+    MediaBlob.objects.filter(id=video.blob_id, processing_video_id=video.id, status='PROCESSING').update(status='PENDING', processing_video_id=None)
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+from apps.videos.models import Video, CommentStreamEntry
+from helpers.realtime import group_has_subscribers
+
+def get_stream_group(video_id):
+    return f"comments_{video_id}"
+
+def serialize_entry(entry):
+    return {"seq": entry.seq, "type": entry.kind, "video_id": entry.video_id, **entry.payload}
+
+def publish_comment_message(kind, message, is_thread=False):
+    # Coût constant par message : un numéro de séquence (UPDATE ... + 1), une ligne dans le tampon de rejeu,
+    # la suppression de la ligne sortie du tampon, puis un seul envoi au groupe comments_<video_id>.
+    from apps.videos.serializers import MessageSerializer
+    commentaire = message.commentaire
+    video_id = commentaire.video_id
+    with transaction.atomic():
+        Video.objects.filter(id=video_id).update(comment_seq=F('comment_seq') + 1)
+        seq = Video.objects.filter(id=video_id).values_list('comment_seq', flat=True).get()
+        entry = CommentStreamEntry.objects.create(video_id=video_id, seq=seq, kind=kind, payload={
+            "commentaire_id": commentaire.id,
+            "is_thread": is_thread,
+            "message": MessageSerializer(message).data,
+        })
+        CommentStreamEntry.objects.filter(video_id=video_id, seq__lte=seq - settings.COMMENT_STREAM_REPLAY_SIZE).delete()
+    data = serialize_entry(entry)
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        group = get_stream_group(video_id)
+        if async_to_sync(group_has_subscribers)(channel_layer, group):
+            async_to_sync(channel_layer.group_send)(group, {"type": "comment_entry", "entry": data})
+    return seq
+
+def get_comment_stream_since(video_id, seq):
+    # reset=True : le client a manqué plus que le tampon ne conserve (ou son numéro est inconnu),
+    # il recharge la première page de fils par /videos/<id>/comments/ puis suit le flux à partir de "seq"
+    current = Video.objects.filter(id=video_id).values_list('comment_seq', flat=True).first()
+    if current is None:
+        return None
+    if seq is None:
+        return {"seq": current, "reset": False, "entries": []}
+    oldest = CommentStreamEntry.objects.filter(video_id=video_id).order_by('seq').values_list('seq', flat=True).first()
+    if seq > current or seq < 0 or (seq < current and (oldest is None or seq < oldest - 1)):
+        return {"seq": current, "reset": True, "entries": []}
+    entries = CommentStreamEntry.objects.filter(video_id=video_id, seq__gt=seq).order_by('seq')
+    return {"seq": current, "reset": False, "entries": [serialize_entry(entry) for entry in entries]}
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from collections import defaultdict
+
+from apps.videos.models import Commentaire, Message
+from apps.videos.pagination import KeysetPaginator, encode_cursor
+
+# Ordre des fils selon le réglage de la vidéo ; chaque clé a son index (video, ..., id)
+COMMENT_ORDERINGS = {
+    'TOP': ['-messages_count', '-id'],
+    'NOUVEAUTE': ['-created_at', '-id'],
+}
+
+# Réponses d'un fil : ordre chronologique, le premier message (le commentaire lui-même) exclu
+REPLY_ORDERING = ['id']
+
+def get_comment_page_size(params, default=None):
+    try:
+        page_size = int(params.get('page_size') or default or settings.COMMENT_PAGE_SIZE)
+    except (TypeError, ValueError):
+        page_size = default or settings.COMMENT_PAGE_SIZE
+    return max(1, min(page_size, settings.COMMENT_MAX_PAGE_SIZE))
+
+def get_comment_ordering(video):
+    return COMMENT_ORDERINGS.get(video.ordre_de_commentaire, COMMENT_ORDERINGS['NOUVEAUTE'])
+
+def plan_comment_queryset(comments):
+    # Nombre de requêtes fixe par page de fils : membres, puis le premier message et un aperçu des réponses
+    # de tous les fils en une requête (prefetch découpé par fil avec une fonction de fenêtre)
+    preview = Message.objects.select_related('envoyeur').order_by('id')[:settings.COMMENT_REPLY_PREVIEW_SIZE + 2]
+    return comments.prefetch_related('membres', Prefetch('messages', queryset=preview, to_attr='thread_messages'))
+
+def get_thread_messages(commentaire):
+    if not hasattr(commentaire, 'thread_messages'):
+        commentaire.thread_messages = list(
+            commentaire.messages.select_related('envoyeur').order_by('id')[:settings.COMMENT_REPLY_PREVIEW_SIZE + 2]
+        )
+    return commentaire.thread_messages
+
+def get_reply_preview(commentaire):
+    # Aperçu des réponses et curseur vers la suite (/comments/<id>/replies/?cursor=)
+    messages = get_thread_messages(commentaire)
+    replies = messages[1:settings.COMMENT_REPLY_PREVIEW_SIZE + 1]
+    next_cursor = None
+    if len(messages) > settings.COMMENT_REPLY_PREVIEW_SIZE + 1 and replies:
+        next_cursor = encode_cursor([replies[-1].id], 'next')
+    return replies, next_cursor
+
+def paginate_comments(video, params):
+    paginator = KeysetPaginator(get_comment_ordering(video), get_comment_page_size(params))
+    comments = plan_comment_queryset(Commentaire.objects.filter(video_id=video.id))
+    return paginator.paginate(comments, params.get('cursor'))
+
+def paginate_replies(commentaire, params):
+    first_id = Message.objects.filter(commentaire_id=commentaire.id).order_by('id').values_list('id', flat=True).first()
+    replies = Message.objects.filter(commentaire_id=commentaire.id).select_related('envoyeur')
+    if first_id is not None:
+        replies = replies.exclude(id=first_id)
+    paginator = KeysetPaginator(REPLY_ORDERING, get_comment_page_size(params))
+    return paginator.paginate(replies, params.get('cursor'))
+
+def paginate_messages(commentaire, params):
+    paginator = KeysetPaginator(['-created_at', '-id'], get_comment_page_size(params))
+    messages = Message.objects.filter(commentaire_id=commentaire.id).select_related('envoyeur')
+    return paginator.paginate(messages, params.get('cursor'))
+
+def attach_comment_pages(videos):
+    # Première page de fils de chaque vidéo d'une liste : une requête par ordre de tri (TOP / NOUVEAUTE),
+    # les N premiers fils de chaque vidéo étant choisis par ROW_NUMBER() partitionné par vidéo.
+    size = settings.COMMENT_EMBED_SIZE
+    by_ordering = defaultdict(list)
+    for video in videos:
+        if video.autoriser_commentaire and not hasattr(video, 'comment_page'):
+            by_ordering[video.ordre_de_commentaire if video.ordre_de_commentaire in COMMENT_ORDERINGS else 'NOUVEAUTE'].append(video)
+    for ordre, group in by_ordering.items():
+        ordering = COMMENT_ORDERINGS[ordre]
+        comments = Commentaire.objects.filter(video_id__in=[video.id for video in group]).annotate(
+            thread_rank=Window(RowNumber(), partition_by=[F('video_id')], order_by=ordering)
+        ).filter(thread_rank__lte=size + 1).order_by('video_id', 'thread_rank')
+        pages = defaultdict(list)
+        for commentaire in plan_comment_queryset(comments):
+            pages[commentaire.video_id].append(commentaire)
+        paginator = KeysetPaginator(ordering, size)
+        for video in group:
+            rows = pages.get(video.id, [])
+            next_cursor = encode_cursor(paginator.get_key(rows[size - 1]), 'next') if len(rows) > size else None
+            video.comment_page = (rows[:size], next_cursor)
+
+def get_comment_page(video):
+    if not hasattr(video, 'comment_page'):
+        rows, next_cursor, _ = paginate_comments(video, {'page_size': settings.COMMENT_EMBED_SIZE})
+        video.comment_page = (rows, next_cursor)
+    return video.comment_page
@@ -2,11 +2,14 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 import json
 from asgiref.sync import sync_to_async
 from django.http import HttpRequest
-from django.utils import timezone as django_timezone
-from django.db.models import Count
-from datetime import timedelta
 from apps.videos.models import Video
 from apps.videos.serializers import VideoSerializer
+from apps.videos.filters import apply_filters, apply_ordering, DEFAULT_VIDEO_ORDERING
+from apps.videos.pagination import paginate_videos, get_paginated_data, InvalidCursor
+from apps.videos.events import parse_group, get_current_version
+from apps.videos.comment_stream import get_stream_group, get_comment_stream_since
+from urllib.parse import parse_qs
+from django.conf import settings
 from helpers.helper import format_file_size, format_duration
 from django.contrib.auth.models import AnonymousUser
 
@@ -42,14 +45,89 @@ class UploadProgressConsumer(AsyncWebsocketConsumer):
             'video_id': event.get('video_id', None)
         }))
 
+class CommentStreamConsumer(AsyncWebsocketConsumer):
+    # Flux des commentaires d'une vidéo : chaque message créé ou modifié arrive une fois, avec son numéro "seq".
+    # À la (re)connexion, ?since=<dernier seq reçu> renvoie seulement ce qui a été manqué.
+    async def connect(self):
+        self.video_id = int(self.scope['url_route']['kwargs']['video_id'])
+        self.group_name = get_stream_group(self.video_id)
+        query = parse_qs(self.scope.get('query_string', b'').decode('utf-8'))
+        since = self.parse_seq((query.get('since') or [None])[0])
+        # Abonnement avant la lecture du tampon : rien ne se perd entre les deux, les doublons se filtrent par seq
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send_replay(since)
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    def parse_seq(self, value):
+        try:
+            return int(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    async def send_replay(self, since):
+        replay = await sync_to_async(get_comment_stream_since)(self.video_id, since)
+        if replay is None:
+            await self.send(text_data=json.dumps({"status": "error", "message": "Vidéo non trouvée"}))
+            await self.close()
+            return
+        await self.send(text_data=json.dumps({"status": "replay", "data": replay}))
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send(text_data=json.dumps({"status": "error", "message": "Invalid JSON format"}))
+            return
+        if data.get('type') == "resume":
+            await self.send_replay(self.parse_seq(data.get('since')))
+        else:
+            await self.send(text_data=json.dumps({"status": "error", "message": "Invalid message type"}))
+
+    async def comment_entry(self, event):
+        await self.send(text_data=json.dumps({
+            "status": "comment",
+            "data": event['entry']
+        }))
+
 class VideoConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        self.subscriptions = set()
         await self.accept()
+        # Le groupe privé user_<id> est rejoint d'office ; les autres (videos, video_<id>, chaine_<id>)
+        # sont demandés par le client avec un message "subscribe".
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            await self.join_group(f"user_{user.id}")
+        # Version courante envoyée après l'abonnement : tout événement suivant a une version supérieure
+        await self.send(text_data=json.dumps({
+            "status": "connected",
+            "version": await sync_to_async(get_current_version)(),
+            "subscriptions": sorted(self.subscriptions)
+        }))
         print("ℹ️ Connecté video consumers ....")
 
     async def disconnect(self, close_code):
+        for group in list(getattr(self, 'subscriptions', ())):
+            await self.channel_layer.group_discard(group, self.channel_name)
         print("[❗] Deconnecté video consumers ....")
-        pass
+
+    async def join_group(self, group):
+        await self.channel_layer.group_add(group, self.channel_name)
+        self.subscriptions.add(group)
+
+    async def leave_group(self, group):
+        await self.channel_layer.group_discard(group, self.channel_name)
+        self.subscriptions.discard(group)
+
+    async def video_event(self, event):
+        await self.send(text_data=json.dumps({
+            "status": "event",
+            "data": event['event']
+        }))
 
     async def receive(self, text_data):
         try:
@@ -67,13 +145,28 @@ class VideoConsumer(AsyncWebsocketConsumer):
             await self.handle_get_video_by_id(data)
         elif message_type == "get_video_by_code":
             await self.handle_get_video_by_code(data)
+        elif message_type == "subscribe":
+            await self.handle_subscribe(data)
+        elif message_type == "unsubscribe":
+            await self.handle_unsubscribe(data)
         else:
             await self.send_error("Invalid message type")
 
+    def get_list_params(self, data):
+        # Le curseur peut être envoyé dans params ou à la racine du message
+        params = dict(data.get('params') or {})
+        if data.get('cursor'):
+            params['cursor'] = data['cursor']
+        return params
+
     async def handle_list_videos(self, data):
-        params = data.get('params', {})
+        params = self.get_list_params(data)
         user = self.scope['user']
-        video_data = await get_video_list(params, user)
+        try:
+            video_data = await get_video_list(params, user)
+        except InvalidCursor as e:
+            await self.send_error(str(e))
+            return
         await self.send_success(video_data)
 
     async def handle_list_my_videos(self, data):
@@ -81,10 +174,51 @@ class VideoConsumer(AsyncWebsocketConsumer):
         if not user.is_authenticated:
             await self.send_error("Authentication required")
             return
-        params = data.get('params', {})
-        video_data = await get_my_video_list(params, user)
+        params = self.get_list_params(data)
+        try:
+            video_data = await get_my_video_list(params, user)
+        except InvalidCursor as e:
+            await self.send_error(str(e))
+            return
         await self.send_success(video_data)
 
+    async def handle_subscribe(self, data):
+        groups = data.get('groups')
+        if not isinstance(groups, list) or not groups:
+            await self.send_error("Groups list required")
+            return
+        user = self.scope.get('user')
+        for group in groups:
+            parsed = parse_group(group) if isinstance(group, str) else None
+            if parsed is None:
+                await self.send_error(f"Invalid group: {group}")
+                return
+            # Les groupes user_<id> sont privés : seul le sien, déjà rejoint à la connexion
+            if parsed[0] == 'user' and not (user is not None and user.is_authenticated and parsed[1] == user.id):
+                await self.send_error(f"Forbidden group: {group}")
+                return
+        new_groups = [group for group in dict.fromkeys(groups) if group not in self.subscriptions]
+        if len(self.subscriptions) + len(new_groups) > settings.VIDEO_EVENT_MAX_SUBSCRIPTIONS:
+            await self.send_error("Too many subscriptions")
+            return
+        for group in new_groups:
+            await self.join_group(group)
+        # La version renvoyée sert de point de départ pour détecter les trous des nouveaux groupes
+        await self.send_success({
+            "subscriptions": sorted(self.subscriptions),
+            "version": await sync_to_async(get_current_version)()
+        })
+
+    async def handle_unsubscribe(self, data):
+        groups = data.get('groups')
+        if not isinstance(groups, list) or not groups:
+            await self.send_error("Groups list required")
+            return
+        for group in groups:
+            if group in self.subscriptions:
+                await self.leave_group(group)
+        await self.send_success({"subscriptions": sorted(self.subscriptions)})
+
     async def handle_get_video_by_id(self, data):
         video_id = data.get('video_id')
         if not video_id:
@@ -123,19 +257,23 @@ class VideoConsumer(AsyncWebsocketConsumer):
 def get_video_list(params, user):
     videos = Video.objects.all()
     videos = apply_filters(videos, params)
+    videos, ordering = apply_ordering(videos, params)
     dummy_request = HttpRequest()
     dummy_request.user = user
+    videos, next_cursor, previous_cursor = paginate_videos(videos, ordering or DEFAULT_VIDEO_ORDERING, params, dummy_request)
     serializer = VideoSerializer(videos, many=True, context={'request': dummy_request, "with_suggestion": False})
-    return serializer.data
+    return get_paginated_data(serializer.data, next_cursor, previous_cursor)
 
 @sync_to_async
 def get_my_video_list(params, user):
     videos = Video.objects.filter(envoyeur=user)
     videos = apply_filters(videos, params)
+    videos, ordering = apply_ordering(videos, params)
     dummy_request = HttpRequest()
     dummy_request.user = user
+    videos, next_cursor, previous_cursor = paginate_videos(videos, ordering or DEFAULT_VIDEO_ORDERING, params, dummy_request)
     serializer = VideoSerializer(videos, many=True, context={'request': dummy_request, "with_suggestion": False})
-    return serializer.data
+    return get_paginated_data(serializer.data, next_cursor, previous_cursor)
 
 @sync_to_async
 def get_video_detail_by_id(video_id, user):
@@ -158,42 +296,3 @@ def get_video_detail_by_code(code_id, user):
         return serializer.data
     except Video.DoesNotExist:
         return None
-
-def apply_filters(videos, params):
-    tags = params.get('tags')
-    if tags:
-        videos = videos.filter(tags__name__in=tags.split(','))
-
-    categorie = params.get('categorie')
-    if categorie:
-        videos = videos.filter(categorie=categorie)
-
-    date_filter = params.get('date_filter')
-    now = django_timezone.now()
-    if date_filter == 'today':
-        videos = videos.filter(uploaded_at__date=now.date())
-    elif date_filter == 'week':
-        videos = videos.filter(uploaded_at__gte=now - timedelta(days=7))
-    elif date_filter == 'month':
-        videos = videos.filter(uploaded_at__gte=now - timedelta(days=30))
-    elif date_filter == 'year':
-        videos = videos.filter(uploaded_at__gte=now - timedelta(days=365))
-    elif date_filter == 'recent':
-        videos = videos.order_by('-uploaded_at')
-
-    start_date = params.get('start_date')
-    end_date = params.get('end_date')
-    if start_date and end_date:
-        videos = videos.filter(uploaded_at__range=[start_date, end_date])
-
-    order_by = params.get('order_by')
-    if order_by == 'likes':
-        videos = videos.annotate(like_count=Count('likes')).order_by('-like_count')
-    elif order_by == 'dislikes':
-        videos = videos.annotate(dislike_count=Count('dislikes')).order_by('-dislike_count')
-    elif order_by == 'comments':
-        videos = videos.annotate(comment_count=Count('commentaires')).order_by('-comment_count')
-    elif order_by == 'date':
-        videos = videos.order_by('-uploaded_at')
-
-    return videos
\ No newline at end of file
@@ -0,0 +1,59 @@
+from django.db.models import F
+
+from apps.videos.models import Video, Message, Commentaire
+from apps.videos.serializers import count_subquery
+
+# Colonne dénormalisée -> (table source, clé étrangère vers l'objet compté)
+VIDEO_COUNTER_SOURCES = {
+    'likes_count': (Video.likes.through, 'video_id'),
+    'dislikes_count': (Video.dislikes.through, 'video_id'),
+    'vues_count': (Video.vues.through, 'video_id'),
+    'commentaires_count': (Commentaire, 'video_id'),
+}
+
+COMMENTAIRE_COUNTER_SOURCES = {
+    'messages_count': (Message, 'commentaire_id'),
+}
+
+MESSAGE_COUNTER_SOURCES = {
+    'likes_count': (Message.likes.through, 'message_id'),
+    'dislikes_count': (Message.dislikes.through, 'message_id'),
+}
+
+COUNTER_SOURCES = {
+    Video: VIDEO_COUNTER_SOURCES,
+    Commentaire: COMMENTAIRE_COUNTER_SOURCES,
+    Message: MESSAGE_COUNTER_SOURCES,
+}
+
+def increment_counters(model, pk, **deltas):
+    # UPDATE ... SET x = x + n : atomique côté base, sans lecture préalable ni perte d'incrément concurrent.
+    # À appeler dans la même transaction que l'écriture de la ligne comptée.
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    return model.objects.filter(pk=pk).update(**{name: F(name) + delta for name, delta in deltas.items()})
+
+def reconcile_counters(model, batch_size=500):
+    # Recompte depuis les tables sources et ne réécrit que les lignes qui ont dérivé
+    # (suppressions en cascade, écritures hors des vues, données antérieures aux colonnes...)
+    sources = COUNTER_SOURCES[model]
+    actual = {f'actual_{name}': count_subquery(source, field) for name, (source, field) in sources.items()}
+    rows = model.objects.annotate(**actual).values('id', *sources, *actual)
+    drifted = []
+    repaired = 0
+    for row in rows.iterator(chunk_size=batch_size):
+        values = {name: row[f'actual_{name}'] for name in sources if row[name] != row[f'actual_{name}']}
+        if values:
+            drifted.append((row['id'], values))
+        if len(drifted) >= batch_size:
+            repaired += write_counters(model, drifted)
+            drifted = []
+    if drifted:
+        repaired += write_counters(model, drifted)
+    return repaired
+
+def write_counters(model, drifted):
+    for pk, values in drifted:
+        model.objects.filter(pk=pk).update(**values)
+    return len(drifted)
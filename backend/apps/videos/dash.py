@@ -0,0 +1,198 @@
+from django.conf import settings
+from xml.etree.ElementTree import Element, SubElement, ElementTree
+from urllib.parse import quote
+import os
+import re
+
+DASH_MANIFEST_NAME = "manifest.mpd"
+DASH_NAMESPACE = "urn:mpeg:dash:schema:mpd:2011"
+DASH_PROFILE = "urn:mpeg:dash:profile:isoff-main:2011"
+
+def parse_attributes(value):
+    return {key: val.strip('"') for key, val in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', value)}
+
+def parse_byterange(value, default_offset):
+    # "longueur@début" (début absent : à la suite de la plage précédente du même fichier) -> (début, fin incluse)
+    if value is None:
+        return None
+    length, _, offset = value.partition("@")
+    start = int(offset) if offset else default_offset
+    return start, start + int(length) - 1
+
+def parse_media_playlist(manifest):
+    # Playlist HLS écrite par ffmpeg : segment d'initialisation (EXT-X-MAP) puis (durée, fichier, plage) par segment
+    base_dir = os.path.dirname(manifest)
+    init = None
+    segments = []
+    offsets = {}
+    duration = byterange = None
+    with open(manifest) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-MAP:"):
+                attrs = parse_attributes(line[len("#EXT-X-MAP:"):])
+                init = (os.path.join(base_dir, attrs["URI"]), parse_byterange(attrs.get("BYTERANGE"), 0))
+            elif line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line.startswith("#EXT-X-BYTERANGE:"):
+                byterange = line[len("#EXT-X-BYTERANGE:"):]
+            elif line and not line.startswith("#"):
+                path = os.path.join(base_dir, line)
+                media_range = parse_byterange(byterange, offsets.get(path, 0))
+                if media_range is not None:
+                    offsets[path] = media_range[1] + 1
+                segments.append((duration or 0, path, media_range))
+                duration = byterange = None
+    return {"init": init, "segments": segments}
+
+def read_range(path, media_range):
+    with open(path, 'rb') as f:
+        if media_range is None:
+            return f.read()
+        f.seek(media_range[0])
+        return f.read(media_range[1] - media_range[0] + 1)
+
+def read_descriptor(data, pos):
+    # Descripteur MPEG-4 (esds) : étiquette puis taille sur 1 à 4 octets de 7 bits
+    tag, size = data[pos], 0
+    pos += 1
+    for _ in range(4):
+        byte = data[pos]
+        pos += 1
+        size = (size << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            break
+    return tag, pos, size
+
+def get_audio_codec(data, esds):
+    try:
+        tag, pos, _ = read_descriptor(data, esds + 8)
+        if tag == 0x03:
+            flags = data[pos + 2]
+            pos += 3
+            if flags & 0x80:
+                pos += 2
+            if flags & 0x40:
+                pos += 1 + data[pos]
+            if flags & 0x20:
+                pos += 2
+            tag, pos, _ = read_descriptor(data, pos)
+        if tag == 0x04:
+            object_type = data[pos]
+            if object_type != 0x40:
+                return f"mp4a.{object_type:02X}"
+            tag, pos, _ = read_descriptor(data, pos + 13)
+            if tag == 0x05:
+                return f"mp4a.40.{data[pos] >> 3}"
+    except IndexError:
+        pass
+    return "mp4a.40.2"
+
+def get_codecs(init):
+    # Chaîne "codecs" (RFC 6381) lue dans les boîtes de configuration du segment d'initialisation
+    if init is None:
+        return None
+    data = read_range(*init)
+    codecs = []
+    avcc = data.find(b"avcC")
+    if avcc >= 0 and len(data) >= avcc + 8:
+        codecs.append(f"avc1.{data[avcc + 5:avcc + 8].hex()}")
+    elif data.find(b"hvcC") >= 0:
+        codecs.append("hvc1")
+    esds = data.find(b"esds")
+    if esds >= 0:
+        codecs.append(get_audio_codec(data, esds))
+    elif data.find(b"dac3") >= 0:
+        codecs.append("ac-3")
+    elif data.find(b"dec3") >= 0:
+        codecs.append("ec-3")
+    return ",".join(codecs) or None
+
+def measure_bandwidth(playlist):
+    # Débit du segment le plus lourd, comme l'attend l'attribut bandwidth du MPD
+    peak = 0
+    for duration, path, media_range in playlist["segments"]:
+        size = media_range[1] - media_range[0] + 1 if media_range else os.path.getsize(path)
+        if duration > 0:
+            peak = max(peak, int(size * 8 / duration))
+    return peak
+
+def media_url(video_dir, path):
+    return quote(os.path.relpath(path, video_dir).replace(os.sep, "/"))
+
+def format_range(media_range):
+    return f"{media_range[0]}-{media_range[1]}"
+
+def add_segment_list(representation, video_dir, playlist):
+    # Les mêmes fichiers (ou plages d'octets) que la playlist HLS : rien n'est dupliqué sur le disque
+    segment_list = SubElement(representation, "SegmentList", {"timescale": "1000"})
+    if playlist["init"] is not None:
+        path, media_range = playlist["init"]
+        attrs = {"sourceURL": media_url(video_dir, path)}
+        if media_range is not None:
+            attrs["range"] = format_range(media_range)
+        SubElement(segment_list, "Initialization", attrs)
+    timeline = SubElement(segment_list, "SegmentTimeline")
+    runs = []
+    for duration, _, _ in playlist["segments"]:
+        duration = round(duration * 1000)
+        if runs and runs[-1][0] == duration:
+            runs[-1][1] += 1
+        else:
+            runs.append([duration, 0])
+    for idx, (duration, repeat) in enumerate(runs):
+        attrs = {"t": "0"} if idx == 0 else {}
+        attrs["d"] = str(duration)
+        if repeat:
+            attrs["r"] = str(repeat)
+        SubElement(timeline, "S", attrs)
+    for _, path, media_range in playlist["segments"]:
+        attrs = {"media": media_url(video_dir, path)}
+        if media_range is not None:
+            attrs["mediaRange"] = format_range(media_range)
+        SubElement(segment_list, "SegmentURL", attrs)
+
+def write_dash_manifest(video_dir, variant_manifests, audio_manifests):
+    # MPD statique construit à partir des playlists HLS CMAF. Les sous-titres restent en WebVTT segmenté,
+    # propre à HLS : ils ne sont pas annoncés dans le MPD.
+    # Qualités à la demande (JIT) pas encore produites ou évincées : absentes du MPD jusqu'à leur génération
+    videos = [
+        (q, parse_media_playlist(manifest), bandwidth, resolution)
+        for q, manifest, bandwidth, resolution in variant_manifests if os.path.exists(manifest)
+    ]
+    duration = max((sum(segment[0] for segment in playlist["segments"]) for _, playlist, _, _ in videos), default=0)
+    mpd = Element("MPD", {
+        "xmlns": DASH_NAMESPACE, "profiles": DASH_PROFILE, "type": "static",
+        "mediaPresentationDuration": f"PT{duration:.3f}S", "minBufferTime": "PT2S"
+    })
+    # Le MPD est aussi servi par /api/videos/<id>/dash/ : les URL relatives des segments sont résolues
+    # depuis le répertoire média, pas depuis l'URL de l'API
+    base_url = SubElement(mpd, "BaseURL")
+    base_url.text = f"{settings.BASE_URL}{settings.MEDIA_URL}{media_url(settings.MEDIA_ROOT, video_dir)}/"
+    period = SubElement(mpd, "Period", {"id": "0", "start": "PT0S"})
+
+    video_set = SubElement(period, "AdaptationSet", {"id": "0", "contentType": "video", "mimeType": "video/mp4", "startWithSAP": "1"})
+    for q, playlist, bandwidth, resolution in videos:
+        width, _, height = resolution.partition("x")
+        attrs = {"id": re.sub(r"\s+", "_", q), "bandwidth": str(bandwidth), "width": width, "height": height}
+        codecs = get_codecs(playlist["init"])
+        if codecs:
+            attrs["codecs"] = codecs
+        add_segment_list(SubElement(video_set, "Representation", attrs), video_dir, playlist)
+
+    for idx, (name, manifest) in enumerate(audio_manifests, start=1):
+        playlist = parse_media_playlist(manifest)
+        set_attrs = {"id": str(idx), "contentType": "audio", "mimeType": "audio/mp4", "startWithSAP": "1"}
+        lang = name.split("_")[0]
+        if re.fullmatch(r"[A-Za-z]{2,3}(-[A-Za-z0-9]+)*", lang):
+            set_attrs["lang"] = lang
+        audio_set = SubElement(period, "AdaptationSet", set_attrs)
+        attrs = {"id": f"audio_{name}", "bandwidth": str(measure_bandwidth(playlist))}
+        codecs = get_codecs(playlist["init"])
+        if codecs:
+            attrs["codecs"] = codecs
+        add_segment_list(SubElement(audio_set, "Representation", attrs), video_dir, playlist)
+
+    dash_manifest_path = os.path.join(video_dir, DASH_MANIFEST_NAME)
+    ElementTree(mpd).write(dash_manifest_path, encoding="utf-8", xml_declaration=True)
+    return dash_manifest_path
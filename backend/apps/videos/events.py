@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.db.models import Q, F
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+import re
+
+from apps.videos.models import Video, Chaine, VideoEvent
+from apps.videos.serializers import count_subquery
+from helpers.realtime import filter_subscribed_groups, group_send_many
+
+# Groupe du catalogue (créations/suppressions) ; le reste est réparti en video_<id>, user_<id> et chaine_<id>
+CATALOG_GROUP = "videos"
+GROUP_PATTERN = re.compile(r"^(video|user|chaine)_([0-9]+)$")
+
+VIDEO_COUNTERS = {
+    'likes': lambda: F('likes_count'),
+    'dislikes': lambda: F('dislikes_count'),
+    'vues': lambda: F('vues_count'),
+    'commentaires': lambda: F('commentaires_count'),
+}
+
+CHAINE_COUNTERS = {
+    'abonnees': lambda: count_subquery(Chaine.abonnees.through, 'chaine_id'),
+}
+
+# Compteurs modifiés par chaque type d'événement : seuls ceux-là sont envoyés
+EVENT_COUNTERS = {
+    'video_created': (),
+    'video_updated': (),
+    'video_deleted': (),
+    'video_viewed': ('vues',),
+    'video_liked': ('likes', 'dislikes'),
+    'video_disliked': ('likes', 'dislikes'),
+    'comment_created': ('commentaires',),
+    'watch_later_added': (),
+    'channel_subscribed': ('abonnees',),
+    'live_started': (),
+    'live_ended': (),
+}
+
+# Groupes destinataires de chaque type d'événement : un socket ne reçoit que ce à quoi il est abonné
+EVENT_GROUPS = {
+    'video_created': ('catalog', 'user'),
+    'video_updated': ('video',),
+    'video_deleted': ('catalog', 'video'),
+    'video_viewed': ('video',),
+    'video_liked': ('video',),
+    'video_disliked': ('video',),
+    'comment_created': ('video',),
+    'watch_later_added': ('user',),
+    'channel_subscribed': ('chaine', 'user'),
+    'live_started': ('catalog', 'user', 'video'),
+    'live_ended': ('catalog', 'video'),
+}
+
+def parse_group(group):
+    if group == CATALOG_GROUP:
+        return 'catalog', None
+    match = GROUP_PATTERN.match(group or "")
+    if not match:
+        return None
+    return match.group(1), int(match.group(2))
+
+def get_event_groups(event):
+    groups = []
+    for kind in EVENT_GROUPS.get(event.event_type, ()):
+        if kind == 'catalog':
+            groups.append(CATALOG_GROUP)
+        elif getattr(event, f'{kind}_id') is not None:
+            groups.append(f"{kind}_{getattr(event, f'{kind}_id')}")
+    return groups
+
+def group_filter(group):
+    # Inverse de get_event_groups : les événements du journal destinés à ce groupe
+    kind, object_id = parse_group(group)
+    event_types = [event_type for event_type, kinds in EVENT_GROUPS.items() if kind in kinds]
+    if kind == 'catalog':
+        return Q(event_type__in=event_types)
+    return Q(event_type__in=event_types, **{f'{kind}_id': object_id})
+
+def get_previous_version(group, version):
+    return VideoEvent.objects.filter(group_filter(group), id__lt=version).order_by('-id').values_list('id', flat=True).first() or 0
+
+def get_current_version():
+    return VideoEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+def load_counters(model, counters, object_ids, names):
+    if not object_ids or not names:
+        return {}
+    rows = model.objects.filter(id__in=object_ids).annotate(**{f'counter_{name}': counters[name]() for name in names})
+    return {row['id']: {name: row[f'counter_{name}'] for name in names} for row in rows.values('id', *[f'counter_{name}' for name in names])}
+
+def serialize_events(events):
+    # Compteurs lus en une requête par table pour tout le lot, quelle que soit sa taille
+    video_names, chaine_names = set(), set()
+    video_ids, chaine_ids = set(), set()
+    for event in events:
+        for name in EVENT_COUNTERS.get(event.event_type, ()):
+            if name in VIDEO_COUNTERS and event.video_id:
+                video_names.add(name)
+                video_ids.add(event.video_id)
+            elif name in CHAINE_COUNTERS and event.chaine_id:
+                chaine_names.add(name)
+                chaine_ids.add(event.chaine_id)
+    video_counters = load_counters(Video, VIDEO_COUNTERS, video_ids, sorted(video_names))
+    chaine_counters = load_counters(Chaine, CHAINE_COUNTERS, chaine_ids, sorted(chaine_names))
+
+    data = []
+    for event in events:
+        item = {"type": event.event_type, "version": event.id}
+        for field in ('video_id', 'chaine_id', 'user_id', 'object_id'):
+            if getattr(event, field) is not None:
+                item[field] = getattr(event, field)
+        names = EVENT_COUNTERS.get(event.event_type, ())
+        if names:
+            current = {**video_counters.get(event.video_id, {}), **chaine_counters.get(event.chaine_id, {})}
+            item["counters"] = {name: current[name] for name in names if name in current}
+        data.append(item)
+    return data
+
+def prune_events(version):
+    if version % settings.VIDEO_EVENT_PRUNE_INTERVAL == 0:
+        VideoEvent.objects.filter(id__lte=version - settings.VIDEO_EVENT_LOG_SIZE).delete()
+
+def publish_event(event_type, video_id=None, chaine_id=None, user_id=None, object_id=None):
+    # L'événement est toujours journalisé (version + rattrapage), mais le message n'est construit
+    # (compteurs compris) que pour les groupes qui ont des abonnés.
+    event = VideoEvent.objects.create(
+        event_type=event_type, video_id=video_id, chaine_id=chaine_id, user_id=user_id, object_id=object_id
+    )
+    prune_events(event.id)
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return event.id
+    groups = async_to_sync(filter_subscribed_groups)(channel_layer, get_event_groups(event))
+    if not groups:
+        return event.id
+    data = serialize_events([event])[0]
+    # "previous" : version du précédent événement du même groupe. Si elle dépasse la dernière version
+    # reçue pour ce groupe, le client a manqué quelque chose et appelle /videos/events/?since=&groups=
+    async_to_sync(group_send_many)(channel_layer, [
+        (group, {"type": "video_event", "event": {**data, "group": group, "previous": get_previous_version(group, event.id)}})
+        for group in groups
+    ])
+    return event.id
+
+def get_events_since(version, limit=None, groups=None):
+    # reset=True : le trou est plus ancien que le journal conservé, le client doit recharger ses listes
+    limit = min(limit or settings.VIDEO_EVENT_RESYNC_LIMIT, settings.VIDEO_EVENT_RESYNC_LIMIT)
+    current_version = get_current_version()
+    oldest = VideoEvent.objects.order_by('id').values_list('id', flat=True).first()
+    if version > current_version or (oldest is not None and version < oldest - 1):
+        return {"version": current_version, "reset": True, "events": []}
+    events = VideoEvent.objects.filter(id__gt=version)
+    if groups:
+        condition = Q()
+        for group in groups:
+            condition |= group_filter(group)
+        events = events.filter(condition)
+    events = list(events.order_by('id')[:limit + 1])
+    has_more = len(events) > limit
+    return {
+        "version": current_version,
+        "reset": False,
+        "has_more": has_more,
+        "events": serialize_events(events[:limit])
+    }
@@ -0,0 +1,61 @@
+from django.utils import timezone as django_timezone
+from django.db.models import F
+from datetime import timedelta
+
+from apps.videos.models import Video
+
+# Clé de tri par défaut : (uploaded_at, id) est unique et stable, donc utilisable comme curseur
+DEFAULT_VIDEO_ORDERING = ['-uploaded_at', '-id']
+
+# Tri sur les colonnes dénormalisées : chacune a un index (compteur, id), parcouru tel quel par le curseur
+SORT_COUNTERS = {
+    'likes': 'likes_count',
+    'dislikes': 'dislikes_count',
+    'comments': 'commentaires_count',
+}
+
+def apply_filters(videos, params):
+    tags = params.get('tags')
+    if tags:
+        # Sous-requête plutôt que jointure : une vidéo portant plusieurs des tags n'apparaît qu'une fois
+        videos = videos.filter(id__in=Video.tags.through.objects.filter(tag__name__in=tags.split(',')).values('video_id'))
+
+    categorie = params.get('categorie')
+    if categorie:
+        videos = videos.filter(categorie=categorie)
+
+    date_filter = params.get('date_filter')
+    now = django_timezone.now()
+    if date_filter == 'today':
+        videos = videos.filter(uploaded_at__date=now.date())
+    elif date_filter == 'week':
+        videos = videos.filter(uploaded_at__gte=now - timedelta(days=7))
+    elif date_filter == 'month':
+        videos = videos.filter(uploaded_at__gte=now - timedelta(days=30))
+    elif date_filter == 'year':
+        videos = videos.filter(uploaded_at__gte=now - timedelta(days=365))
+
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    if start_date and end_date:
+        videos = videos.filter(uploaded_at__range=[start_date, end_date])
+
+    return videos
+
+def apply_ordering(videos, params):
+    # Renvoie None si aucun tri n'est demandé, pour laisser la vue choisir (pertinence, date...)
+    order_by = params.get('order_by')
+    if order_by == 'trending':
+        # Lecture directe de l'index (score, video) de la table des tendances, recalculée en tâche de fond
+        from apps.videos.trending import trending_index
+        trending_index.ensure_fresh()
+        # Départage sur la colonne de l'index plutôt que video.id (même valeur) : pas de tri temporaire
+        videos = videos.filter(trending__isnull=False).annotate(
+            trending_score=F('trending__score'), trending_video_id=F('trending__video_id')
+        )
+        return videos, ['-trending_score', '-trending_video_id']
+    if order_by in SORT_COUNTERS:
+        return videos, [f'-{SORT_COUNTERS[order_by]}', '-id']
+    if order_by == 'date' or params.get('date_filter') == 'recent':
+        return videos, DEFAULT_VIDEO_ORDERING
+    return videos, None
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.videos.renditions import rendition_evictor
+
+class Command(BaseCommand):
+    help = "Évince les qualités générées à la demande les moins utilisées jusqu'à repasser sous le quota disque."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quota', type=int, default=None, help="Quota en octets (par défaut VIDEO_RENDITION_DISK_QUOTA)")
+
+    def handle(self, *args, **options):
+        quota = settings.VIDEO_RENDITION_DISK_QUOTA if options['quota'] is None else options['quota']
+        if not quota:
+            self.stdout.write("❕ Aucun quota défini (VIDEO_RENDITION_DISK_QUOTA=0), rien à évincer")
+            return
+        freed = rendition_evictor.evict(quota)
+        self.stdout.write(f"✅ {freed} octet(s) libéré(s)")
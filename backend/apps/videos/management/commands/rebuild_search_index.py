@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.videos.search import video_search_index
+import time
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des vidéos (titre, description, tags, catégorie)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Nombre de vidéos lues par lot")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        self.stdout.write("🚀 Reconstruction de l'index de recherche...")
+        count = video_search_index.rebuild(options['batch_size'])
+        self.stdout.write(f"✅ {count} vidéo(s) indexée(s) en {time.monotonic() - start:.1f}s")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.videos.trending import trending_index
+import time
+
+class Command(BaseCommand):
+    help = "Recalcule entièrement le classement des tendances à partir des vues, likes et commentaires récents."
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        self.stdout.write("🚀 Recalcul des tendances...")
+        count = trending_index.recompute()
+        self.stdout.write(f"✅ {count} vidéo(s) classée(s) en {time.monotonic() - start:.1f}s")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.videos.models import Video, Commentaire, Message
+from apps.videos.counters import reconcile_counters
+import time
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs dénormalisés (likes, dislikes, vues, commentaires, messages) des vidéos, des fils et des messages et corrige ceux qui ont dérivé."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Nombre de lignes lues et corrigées par lot")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        self.stdout.write("🚀 Réconciliation des compteurs...")
+        for model in (Video, Commentaire, Message):
+            count = reconcile_counters(model, options['batch_size'])
+            self.stdout.write(f"✅ {model._meta.db_table} : {count} ligne(s) corrigée(s)")
+        self.stdout.write(f"⏱️ Terminé en {time.monotonic() - start:.1f}s")
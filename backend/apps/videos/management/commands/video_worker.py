@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from apps.videos.scheduler import VideoProcessingScheduler, TASK_PRIORITIES
+import time
+
+class Command(BaseCommand):
+    help = "Lance un worker de traitement vidéo qui récupère les tâches de la file partagée (VideoProcessingTask)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.VIDEO_PROCESSING_WORKERS, help="Nombre de processus de traitement")
+        parser.add_argument('--types', type=str, default=",".join(TASK_PRIORITIES), help="Types de tâches séparés par des virgules")
+
+    def handle(self, *args, **options):
+        task_types = [t.strip() for t in options['types'].split(',') if t.strip()]
+        unknown = [t for t in task_types if t not in TASK_PRIORITIES]
+        if unknown:
+            raise CommandError(f"Types de tâches inconnus : {', '.join(unknown)}")
+
+        scheduler = VideoProcessingScheduler(max_workers=options['workers'], task_types=task_types)
+        scheduler.start()
+        self.stdout.write(f"🚀 Worker {scheduler.worker_id} démarré ({options['workers']} processus, {', '.join(task_types)})")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write("[❗] Arrêt du worker, remise en file des tâches en cours...")
+            scheduler.stop()
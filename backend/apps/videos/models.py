@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from apps.users.models import User, default_created_at
 import uuid
 
@@ -54,7 +55,11 @@ class VideoUpload(models.Model):
     tags = models.CharField(max_length=500, blank=True)
     total_size = models.PositiveBigIntegerField()
     total_chunks = models.PositiveIntegerField()
+    # Offset validé (octets contigus reçus depuis le début) et prochain chunk attendu
+    uploaded_bytes = models.PositiveBigIntegerField(default=0)
+    next_chunk = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(default=default_created_at)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = "video_upload"
@@ -66,7 +71,9 @@ class VideoUpload(models.Model):
 class VideoChunk(models.Model):
     video_upload = models.ForeignKey(VideoUpload, on_delete=models.CASCADE, related_name="chunks")
     chunk_number = models.PositiveIntegerField()
-    chunk_file = models.FileField(upload_to="video_chunks/")
+    offset = models.PositiveBigIntegerField(default=0)
+    size = models.PositiveIntegerField(default=0)
+    checksum = models.CharField(max_length=200, blank=True)
 
     class Meta:
         db_table = "video_chunk"
@@ -76,6 +83,30 @@ class VideoChunk(models.Model):
     def __str__(self):
         return f"Chunk {self.chunk_number} for upload {self.video_upload.upload_id}"
 
+class MediaBlob(models.Model):
+    # Contenu envoyé, adressé par son empreinte SHA-256 : les vidéos au contenu identique partagent le fichier source,
+    # les qualités converties et le descripteur (répertoire videos/blobs/<sha256>/). Supprimé au dernier référent.
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('READY', 'Ready'),
+    )
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()
+    fichier = models.CharField(max_length=255)
+    ref_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # Vidéo dont la conversion produit (ou a produit) les qualités partagées
+    processing_video_id = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=default_created_at)
+
+    class Meta:
+        db_table = "media_blob"
+
+    def __str__(self):
+        return self.sha256
+
 class Video(models.Model):
     code_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     titre = models.CharField(max_length=200)
@@ -94,8 +125,18 @@ class Video(models.Model):
     dislikes = models.ManyToManyField(User, related_name="videos_disliked")
     vues = models.ManyToManyField(User, related_name="videos_vues")
     
+    # Compteurs dénormalisés, tenus à jour par F() dans la transaction de l'écriture (cf. apps/videos/counters.py)
+    likes_count = models.IntegerField(default=0)
+    dislikes_count = models.IntegerField(default=0)
+    vues_count = models.IntegerField(default=0)
+    commentaires_count = models.IntegerField(default=0)
+    # Dernier numéro de séquence du flux de commentaires de la vidéo (cf. apps/videos/comment_stream.py)
+    comment_seq = models.IntegerField(default=0)
+    
     master_manifest_file = models.FileField(upload_to="videos/manifests/", null=True, blank=True)
     segments_dir = models.CharField(max_length=255, null=True, blank=True)
+    # Contenu partagé (dédupliqué) ; null pour les vidéos antérieures et les enregistrements de direct
+    blob = models.ForeignKey(MediaBlob, on_delete=models.SET_NULL, null=True, blank=True, related_name="videos")
     
     uploaded_at = models.DateTimeField(default=default_created_at)
     updated_at = models.DateTimeField(default=default_created_at)
@@ -106,7 +147,47 @@ class Video(models.Model):
     class Meta:
         db_table = "video"
         app_label = 'videos'
+        indexes = [
+            models.Index(fields=['uploaded_at', 'id']),
+            # Tri par popularité : parcours d'index, avec id pour départager (clé du curseur)
+            models.Index(fields=['likes_count', 'id']),
+            models.Index(fields=['dislikes_count', 'id']),
+            models.Index(fields=['vues_count', 'id']),
+            models.Index(fields=['commentaires_count', 'id']),
+        ]
         
+class VideoTrending(models.Model):
+    # Score "hot" en espace log2 : log2(somme des poids * 2^(âge depuis l'époque / demi-vie)).
+    # L'ordre entre vidéos ne dépend pas de l'instant présent : pas besoin de réécrire les scores pour les faire décroître.
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, primary_key=True, related_name="trending")
+    score = models.FloatField()
+    updated_at = models.DateTimeField(default=default_created_at)
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "video_trending"
+        indexes = [
+            models.Index(fields=['score', 'video']),
+            models.Index(fields=['computed_at']),
+        ]
+
+class VideoSimilarityVector(models.Model):
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name="similarity_vector")
+    vector = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        db_table = "video_similarity_vector"
+
+class VideoSearchDocument(models.Model):
+    # Document normalisé de l'index de recherche en mémoire, partagé entre processus ; null : vidéo supprimée
+    video_id = models.IntegerField(primary_key=True)
+    document = models.JSONField(null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        db_table = "video_search_document"
+
 class VideoInfo(models.Model):
     video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name="info")
     qualities = models.JSONField()
@@ -129,6 +210,10 @@ class VideoVue(models.Model):
     class Meta:
         db_table = "videovue"
         unique_together = ('video', 'user')
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id']),
+            models.Index(fields=['created_at', 'video']),
+        ]
 
 class VideoLike(models.Model):
     video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="likes_detaillees")
@@ -138,6 +223,10 @@ class VideoLike(models.Model):
     class Meta:
         db_table = "videolike"
         unique_together = ('video', 'user')
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id']),
+            models.Index(fields=['created_at', 'video']),
+        ]
 
 class VideoDislike(models.Model):
     video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="dislikes_detaillees")
@@ -147,6 +236,9 @@ class VideoDislike(models.Model):
     class Meta:
         db_table = "videodislike"
         unique_together = ('video', 'user')
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
 
 class VideoRegarderPlusTard(models.Model):
     video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="regarder_plus_tard")
@@ -156,6 +248,9 @@ class VideoRegarderPlusTard(models.Model):
     class Meta:
         db_table = "videoregarderplustard"
         unique_together = ('video', 'user')
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
 
 class VideoPlaylist(models.Model):
     playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='videos_playlist')
@@ -169,11 +264,19 @@ class VideoPlaylist(models.Model):
 class Commentaire(models.Model):
     video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="commentaires")
     membres = models.ManyToManyField(User, related_name="commentaires")
+    # Messages du fil (le premier compris) : tri TOP et nombre de réponses sans COUNT
+    messages_count = models.IntegerField(default=0)
     
     created_at = models.DateTimeField(default=default_created_at)
     
     class Meta:
         db_table = "commentaire"
+        indexes = [
+            models.Index(fields=['created_at', 'video']),
+            # Pages de fils par vidéo, pour chacun des deux ordres (NOUVEAUTE, TOP)
+            models.Index(fields=['video', 'created_at', 'id']),
+            models.Index(fields=['video', 'messages_count', 'id']),
+        ]
         
 class Message(models.Model):
     commentaire = models.ForeignKey(Commentaire, on_delete=models.CASCADE, related_name="messages")
@@ -181,6 +284,8 @@ class Message(models.Model):
     contenu = models.TextField(blank=True, null=True)
     likes = models.ManyToManyField(User, related_name="messages_liked")
     dislikes = models.ManyToManyField(User, related_name="messages_disliked")
+    likes_count = models.IntegerField(default=0)
+    dislikes_count = models.IntegerField(default=0)
     
     created_at = models.DateTimeField(default=default_created_at)
     
@@ -189,11 +294,17 @@ class Message(models.Model):
     
     class Meta:
         db_table = "message"
+        indexes = [
+            models.Index(fields=['commentaire', 'likes_count', 'id']),
+            models.Index(fields=['commentaire', 'dislikes_count', 'id']),
+        ]
 
 class VideoProcessingTask(models.Model):
     TASK_TYPES = (
         ('THUMBNAILS', 'Generate Thumbnails'),
+        ('METADATA', 'Extract Metadata'),
         ('CONVERSION', 'Convert Video'),
+        ('RENDITION', 'Generate Rendition'),
     )
     STATUS_CHOICES = (
         ('PENDING', 'Pending'),
@@ -204,10 +315,69 @@ class VideoProcessingTask(models.Model):
 
     video_id = models.IntegerField()
     task_type = models.CharField(max_length=20, choices=TASK_TYPES)
+    # Qualité à produire (tâches RENDITION) ; vide pour les autres types
+    quality = models.CharField(max_length=50, blank=True, default='')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    priority = models.PositiveSmallIntegerField(default=0)
+    worker_id = models.CharField(max_length=255, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     error_message = models.TextField(null=True, blank=True)
 
     class Meta:
-        db_table = 'video_processing_tasks'
\ No newline at end of file
+        db_table = 'video_processing_tasks'
+        indexes = [
+            models.Index(fields=['status', 'priority', 'created_at']),
+            models.Index(fields=['status', 'lease_expires_at']),
+            models.Index(fields=['video_id', 'task_type', 'status']),
+        ]
+
+class VideoRendition(models.Model):
+    # Qualité produite à la demande (mode JIT) : taille sur le disque et fréquentation, pour l'éviction sous quota.
+    # "original" et la qualité encodée à l'envoi n'ont pas de ligne : ils ne sont jamais évincés.
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="renditions")
+    quality = models.CharField(max_length=50)
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    generated_at = models.DateTimeField(default=default_created_at)
+    last_accessed_at = models.DateTimeField(default=default_created_at)
+
+    class Meta:
+        db_table = 'video_rendition'
+        unique_together = ('video', 'quality')
+        indexes = [
+            models.Index(fields=['last_accessed_at', 'hits']),
+        ]
+
+class VideoEvent(models.Model):
+    # Journal des événements temps réel : l'id sert de version monotone, pour détecter les trous côté client
+    event_type = models.CharField(max_length=50)
+    video_id = models.IntegerField(null=True, blank=True)
+    chaine_id = models.IntegerField(null=True, blank=True)
+    user_id = models.IntegerField(null=True, blank=True)
+    object_id = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'video_events'
+        indexes = [
+            models.Index(fields=['video_id', 'id']),
+            models.Index(fields=['user_id', 'id']),
+            models.Index(fields=['chaine_id', 'id']),
+        ]
+
+class CommentStreamEntry(models.Model):
+    # Tampon de rejeu borné du flux de commentaires : les derniers messages créés/modifiés de chaque vidéo,
+    # numérotés par vidéo, pour renvoyer à un client qui se reconnecte seulement ce qu'il a manqué
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="comment_stream")
+    seq = models.IntegerField()
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'comment_stream'
+        unique_together = ('video', 'seq')
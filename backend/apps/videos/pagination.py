@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from datetime import datetime
+
+CURSOR_SALT = "apps.videos.pagination"
+
+class InvalidCursor(ValueError):
+    pass
+
+def get_page_size(params):
+    try:
+        page_size = int(params.get('page_size') or settings.VIDEO_LIST_PAGE_SIZE)
+    except (TypeError, ValueError):
+        page_size = settings.VIDEO_LIST_PAGE_SIZE
+    return max(1, min(page_size, settings.VIDEO_LIST_MAX_PAGE_SIZE))
+
+def encode_cursor(values, direction):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return signing.dumps({'v': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+def decode_cursor(cursor, size):
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise InvalidCursor("Curseur invalide")
+    if data.get('d') not in ('next', 'previous') or len(data.get('v', [])) != size:
+        raise InvalidCursor("Curseur invalide")
+    return data['v'], data['d']
+
+class KeysetPaginator:
+    # Pagination par clé (keyset) : chaque page est un "WHERE clé > dernière clé LIMIT n",
+    # dont le coût ne dépend pas de la profondeur de la page, contrairement à un OFFSET.
+    def __init__(self, ordering, page_size=None):
+        self.ordering = list(ordering)
+        self.page_size = page_size or settings.VIDEO_LIST_PAGE_SIZE
+
+    def get_key(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def keyset_filter(self, values, forward):
+        # (a, b) après (va, vb) : a après va, OU a = va ET b après vb
+        condition = None
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') == forward else 'gt'
+            term = equal & Q(**{f"{name}__{lookup}": value})
+            condition = term if condition is None else condition | term
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate(self, queryset, cursor=None):
+        values, direction = decode_cursor(cursor, len(self.ordering)) if cursor else (None, 'next')
+        forward = direction == 'next'
+        ordering = self.ordering if forward else [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, forward))
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if (has_more if forward else values is not None):
+                next_cursor = encode_cursor(self.get_key(rows[-1]), 'next')
+            if (values is not None if forward else has_more):
+                previous_cursor = encode_cursor(self.get_key(rows[0]), 'previous')
+        return rows, next_cursor, previous_cursor
+
+def paginate_videos(videos, ordering, params, request=None):
+    from apps.videos.serializers import plan_video_queryset
+    # Le plan (prefetch, sous-requêtes) est appliqué à la page seulement
+    paginator = KeysetPaginator(ordering, get_page_size(params))
+    return paginator.paginate(plan_video_queryset(videos, request), params.get('cursor'))
+
+def paginate_related_videos(related, params, request=None):
+    from apps.videos.models import Video
+    from apps.videos.serializers import plan_video_queryset
+    # Historique, likes... : on pagine la table de liaison sur (created_at, id), puis on charge les vidéos de la page
+    paginator = KeysetPaginator(['-created_at', '-id'], get_page_size(params))
+    rows, next_cursor, previous_cursor = paginator.paginate(related, params.get('cursor'))
+    videos = plan_video_queryset(Video.objects.filter(id__in=[row.video_id for row in rows]), request).in_bulk()
+    return [videos[row.video_id] for row in rows if row.video_id in videos], next_cursor, previous_cursor
+
+def paginate_search(videos, search_term, params, request=None):
+    from apps.videos.models import Video
+    from apps.videos.search import video_search_index, parse_query
+    from apps.videos.serializers import plan_video_queryset
+    # Tri par pertinence : on pagine sur le rang dans la liste classée par l'index (le curseur est ce rang),
+    # en lisant l'index par fenêtres et en ne gardant que les vidéos qui passent les filtres de la requête.
+    # Renvoie None si le terme ne contient aucun mot cherchable.
+    if not any(parse_query(search_term)):
+        return None
+    page_size = get_page_size(params)
+    cursor = params.get('cursor')
+    values, direction = decode_cursor(cursor, 1) if cursor else (None, 'next')
+    if values is not None and (not isinstance(values[0], int) or values[0] < 0):
+        raise InvalidCursor("Curseur invalide")
+    forward = direction == 'next'
+    if values is None:
+        position = 0
+    else:
+        position = values[0] + 1 if forward else values[0]
+    size = page_size + 1
+    ranked = []
+    while len(ranked) <= page_size:
+        start = position if forward else max(0, position - size)
+        if start == position and not forward:
+            break
+        results = video_search_index.search(search_term, limit=size if forward else position - start, offset=start)
+        ids = [video_id for video_id, score in results]
+        kept = set(videos.filter(id__in=ids).values_list('id', flat=True))
+        window = [(start + rank, video_id) for rank, video_id in enumerate(ids) if video_id in kept]
+        if forward:
+            ranked.extend(window)
+            position = start + len(results)
+            if len(results) < size:
+                break
+        else:
+            ranked[:0] = window
+            position = start
+        # Filtres sélectifs : fenêtres de plus en plus grandes, bornées
+        size = min(size * 2, max(page_size + 1, settings.VIDEO_SEARCH_MAX_RESULTS))
+    has_more = len(ranked) > page_size
+    ranked = ranked[:page_size] if forward else ranked[-page_size:]
+
+    loaded = plan_video_queryset(Video.objects.filter(id__in=[video_id for rank, video_id in ranked]), request).in_bulk()
+    rows = [loaded[video_id] for rank, video_id in ranked if video_id in loaded]
+    next_cursor = previous_cursor = None
+    if ranked:
+        if (has_more if forward else values is not None):
+            next_cursor = encode_cursor([ranked[-1][0]], 'next')
+        if (values is not None if forward else has_more):
+            previous_cursor = encode_cursor([ranked[0][0]], 'previous')
+    return rows, next_cursor, previous_cursor
+
+def get_paginated_data(results, next_cursor, previous_cursor):
+    return {
+        "next": next_cursor,
+        "previous": previous_cursor,
+        "results": results
+    }
@@ -0,0 +1,165 @@
+from django.conf import settings
+from collections import OrderedDict
+from threading import Lock
+import json
+import time
+import os
+
+# À incrémenter si le format du descripteur change : les anciens fichiers sont alors reconstruits
+PLAYBACK_DESCRIPTOR_VERSION = 1
+PLAYBACK_DESCRIPTOR_NAME = "playback.json"
+
+def get_video_dir(video_id):
+    return os.path.join(settings.MEDIA_ROOT, "videos", str(video_id))
+
+def can_watch_video(video, user):
+    # Manifestes HLS et DASH : une vidéo privée n'est lisible que par son envoyeur
+    if video.visibilite != 'PRIVATE':
+        return True
+    return user is not None and user.is_authenticated and user.id == video.envoyeur_id
+
+def get_descriptor_path(video_id):
+    return os.path.join(get_video_dir(video_id), PLAYBACK_DESCRIPTOR_NAME)
+
+def media_relpath(path):
+    return os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, "/")
+
+def build_descriptor(video_id, master_manifest_path, variant_manifests, audio_manifests, subtitle_manifests, video_info, dash_manifest_path=None, ladder_stats=None):
+    # Tout ce dont le lecteur a besoin, calculé une fois par la conversion : chemins relatifs à MEDIA_ROOT
+    # (les URL absolues dépendent de BASE_URL, assemblées à la lecture)
+    return {
+        "version": PLAYBACK_DESCRIPTOR_VERSION,
+        "revision": time.time_ns(),
+        "video_id": video_id,
+        "master_manifest": media_relpath(master_manifest_path),
+        # MPD DASH (empaquetage CMAF uniquement) : mêmes fragments que les playlists HLS
+        "dash_manifest": media_relpath(dash_manifest_path) if dash_manifest_path else None,
+        "default_quality": video_info.get("quality"),
+        # bandwidth : débit crête de la vidéo seule ; attributs du master (avec l'audio) mesurés à l'empaquetage
+        "qualities": [
+            {
+                "name": q, "path": media_relpath(manifest), "resolution": resolution, "bandwidth": int(bandwidth),
+                **({
+                    "average_bandwidth": ladder_stats[q]["average_bandwidth"], "codecs": ladder_stats[q]["codecs"],
+                    "frame_rate": ladder_stats[q]["frame_rate"]
+                } if ladder_stats and q in ladder_stats else {})
+            }
+            for q, manifest, bandwidth, resolution in variant_manifests
+        ],
+        "audio_tracks": [{"language": lang, "path": media_relpath(manifest)} for lang, manifest in audio_manifests],
+        "subtitle_tracks": [{"language": lang, "path": media_relpath(manifest)} for lang, manifest in subtitle_manifests],
+        "metadata": {
+            "fps": video_info.get("fps"),
+            "width": video_info.get("width"),
+            "height": video_info.get("height"),
+            "duration": video_info.get("duration"),
+            "size": video_info.get("size"),
+        },
+    }
+
+def write_descriptor(video_id, descriptor):
+    path = get_descriptor_path(video_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(descriptor, f)
+    os.replace(tmp_path, path)
+    playback_cache.invalidate(video_id)
+    return path
+
+def build_legacy_descriptor(video_id):
+    # Vidéos converties avant l'existence du descripteur : reconstruit à partir de VideoInfo et des
+    # fichiers présents sur le disque, puis écrit pour que les connexions suivantes passent par le cache
+    from apps.videos.models import Video, VideoInfo
+    from apps.videos.tasks import BANDWIDTHS, RESOLUTIONS, QUALITY_HEIGHTS, get_quality_key
+    from apps.videos.dash import DASH_MANIFEST_NAME, parse_media_playlist, measure_bandwidth
+    from helpers.helper import get_available_info
+    video = Video.objects.filter(id=video_id).first()
+    info = VideoInfo.objects.filter(video_id=video_id).first()
+    if video is None or info is None or not video.master_manifest_file:
+        return None
+    # Répertoire de master.m3u8 : celui de la vidéo, ou celui du contenu partagé (videos/blobs/<sha256>/)
+    video_dir = os.path.dirname(os.path.join(settings.MEDIA_ROOT, video.master_manifest_file.name))
+    segments_dir = os.path.join(video_dir, "segments")
+    variant_manifests = []
+    for idx, quality in enumerate(info.qualities):
+        manifest = os.path.join(segments_dir, "original" if idx == 0 else quality, "video.m3u8")
+        key = "original" if idx == 0 else get_quality_key(quality)
+        # En mode JIT, les qualités pas encore produites restent annoncées : générées à la première demande
+        if os.path.exists(manifest) or (settings.VIDEO_JIT_RENDITIONS and key in QUALITY_HEIGHTS):
+            resolution = f"{info.width}x{info.height}" if idx == 0 else RESOLUTIONS[key]
+            # Débit crête mesuré sur les segments présents (simple stat des fichiers), sinon débit visé
+            bandwidth = measure_bandwidth(parse_media_playlist(manifest)) if os.path.exists(manifest) else 0
+            variant_manifests.append((quality, manifest, bandwidth or BANDWIDTHS[key], resolution))
+    original_dir = os.path.join(segments_dir, "original")
+    tracks = sorted(os.listdir(original_dir)) if os.path.isdir(original_dir) else []
+    audio_manifests = [(name[len("audio_"):-len(".m3u8")], os.path.join(original_dir, name)) for name in tracks if name.startswith("audio_") and name.endswith(".m3u8")]
+    subtitle_manifests = [(name[len("subs_"):-len(".m3u8")], os.path.join(original_dir, name)) for name in tracks if name.startswith("subs_") and name.endswith(".m3u8")]
+    try:
+        quality = get_available_info(video.fichier.path)["quality"]
+    except Exception:
+        quality = info.qualities[0] if info.qualities else None
+    dash_manifest_path = os.path.join(video_dir, DASH_MANIFEST_NAME)
+    video_info = {"quality": quality, "fps": info.fps, "width": info.width, "height": info.height, "duration": info.duration, "size": info.size}
+    descriptor = build_descriptor(
+        video_id, os.path.join(settings.MEDIA_ROOT, video.master_manifest_file.name),
+        variant_manifests, audio_manifests, subtitle_manifests, video_info,
+        dash_manifest_path if os.path.exists(dash_manifest_path) else None
+    )
+    write_descriptor(video_id, descriptor)
+    return descriptor
+
+class PlaybackDescriptorCache:
+    # LRU borné en mémoire ; chaque entrée est validée par le mtime du fichier, si bien qu'une
+    # reconversion faite dans un autre processus (worker de conversion) est vue au prochain accès.
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or settings.PLAYBACK_DESCRIPTOR_CACHE_SIZE
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, video_id):
+        path = get_descriptor_path(video_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self.lock:
+            entry = self.entries.get(video_id)
+            if entry is not None and mtime is not None and entry[0] == mtime:
+                self.entries.move_to_end(video_id)
+                return entry[1]
+        descriptor = None
+        if mtime is not None:
+            try:
+                with open(path) as f:
+                    descriptor = json.load(f)
+            except (OSError, ValueError):
+                descriptor = None
+        if descriptor is None or descriptor.get("version") != PLAYBACK_DESCRIPTOR_VERSION:
+            descriptor = build_legacy_descriptor(video_id)
+            if descriptor is None:
+                self.invalidate(video_id)
+                return None
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                return descriptor
+        with self.lock:
+            self.entries[video_id] = (mtime, descriptor)
+            self.entries.move_to_end(video_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return descriptor
+
+    def invalidate(self, video_id):
+        with self.lock:
+            self.entries.pop(video_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+playback_cache = PlaybackDescriptorCache()
+
+def get_playback_descriptor(video_id):
+    return playback_cache.get(int(video_id))
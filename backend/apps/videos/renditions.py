@@ -0,0 +1,285 @@
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Sum
+from datetime import timedelta
+from threading import Thread, Lock, Event
+import atexit
+import shutil
+import time
+import re
+import os
+
+from apps.users.models import default_created_at
+
+# Chemin (relatif à MEDIA_ROOT) d'un fichier de qualité : videos/<id>/segments/<qualité>/...
+# ou, pour un contenu dédupliqué, videos/blobs/<sha256>/segments/<qualité>/...
+RENDITION_PATH = re.compile(r"^videos/(?:([0-9]+)|blobs/([0-9a-f]{64}))/segments/([^/]+)/")
+RENDITION_PLAYLIST_NAME = "video.m3u8"
+
+def get_rendition_dir(video_id, quality):
+    # Répertoire des qualités : celui de master.m3u8 d'après le descripteur (propre à la vidéo ou partagé)
+    from apps.videos.playback import get_playback_descriptor, get_video_dir
+    descriptor = get_playback_descriptor(video_id)
+    media_dir = os.path.dirname(os.path.join(settings.MEDIA_ROOT, descriptor["master_manifest"])) if descriptor else get_video_dir(video_id)
+    return os.path.join(media_dir, "segments", quality)
+
+def parse_rendition_path(path):
+    # (propriétaire, qualité) : l'id de la vidéo, ou l'empreinte du contenu partagé
+    match = RENDITION_PATH.match(path.replace(os.sep, "/"))
+    if match is None or match.group(3) == "original":
+        return None
+    return int(match.group(1)) if match.group(1) else match.group(2), match.group(3)
+
+def resolve_rendition_video(owner):
+    from apps.videos.blobs import get_blob_video_id
+    return owner if isinstance(owner, int) else get_blob_video_id(owner)
+
+def filter_renditions(owner, quality):
+    from apps.videos.models import VideoRendition
+    if isinstance(owner, int):
+        return VideoRendition.objects.filter(video_id=owner, quality=quality)
+    return VideoRendition.objects.filter(video__blob__sha256=owner, quality=quality)
+
+def is_jit_quality(video_id, quality):
+    # Seules les qualités annoncées par le descripteur de lecture (donc par master.m3u8) peuvent être produites
+    from apps.videos.playback import get_playback_descriptor
+    descriptor = get_playback_descriptor(video_id)
+    if descriptor is None:
+        return False
+    return any(q["name"] == quality for q in descriptor["qualities"][1:])
+
+def read_playlist(playlist):
+    try:
+        with open(playlist) as f:
+            return f.read()
+    except OSError:
+        return None
+
+def is_playlist_ready(playlist):
+    return "#EXTINF" in (read_playlist(playlist) or "")
+
+def is_rendition_generating(video_id, quality):
+    from apps.videos.models import VideoProcessingTask
+    return VideoProcessingTask.objects.filter(
+        video_id=video_id, task_type='RENDITION', quality=quality, status__in=['PENDING', 'PROCESSING']
+    ).exists()
+
+def get_generating_renditions():
+    from apps.videos.models import VideoProcessingTask
+    return set(VideoProcessingTask.objects.filter(
+        task_type='RENDITION', status__in=['PENDING', 'PROCESSING']
+    ).values_list('video_id', 'quality'))
+
+def refresh_dash_manifest(video_id):
+    # MPD réécrit après génération ou éviction d'une qualité : il n'annonce que ce qui est sur le disque
+    from apps.videos.playback import get_playback_descriptor
+    from apps.videos.dash import write_dash_manifest
+    descriptor = get_playback_descriptor(video_id)
+    if descriptor is None or not descriptor.get("dash_manifest"):
+        return None
+    variant_manifests = [
+        (q["name"], os.path.join(settings.MEDIA_ROOT, q["path"]), q["bandwidth"], q["resolution"])
+        for q in descriptor["qualities"]
+    ]
+    audio_manifests = [(track["language"], os.path.join(settings.MEDIA_ROOT, track["path"])) for track in descriptor["audio_tracks"]]
+    dash_dir = os.path.dirname(os.path.join(settings.MEDIA_ROOT, descriptor["dash_manifest"]))
+    return write_dash_manifest(dash_dir, variant_manifests, audio_manifests)
+
+def refresh_master_manifest(video_id):
+    # Qualité produite à la demande : ses attributs dans master.m3u8 passent des valeurs visées aux valeurs mesurées
+    from apps.videos.playback import get_playback_descriptor
+    from apps.videos.analysis import analyze_ladder
+    from apps.videos.tasks import write_master_manifest
+    descriptor = get_playback_descriptor(video_id)
+    if descriptor is None:
+        return None
+    variant_manifests = [
+        (q["name"], os.path.join(settings.MEDIA_ROOT, q["path"]), q["bandwidth"], q["resolution"])
+        for q in descriptor["qualities"]
+    ]
+    audio_manifests = [(track["language"], os.path.join(settings.MEDIA_ROOT, track["path"])) for track in descriptor["audio_tracks"]]
+    subtitle_manifests = [(track["language"], os.path.join(settings.MEDIA_ROOT, track["path"])) for track in descriptor["subtitle_tracks"]]
+    variant_manifests, ladder_stats = analyze_ladder(variant_manifests, audio_manifests, descriptor["metadata"]["fps"], prune=False)
+    master_dir = os.path.dirname(os.path.join(settings.MEDIA_ROOT, descriptor["master_manifest"]))
+    return write_master_manifest(master_dir, variant_manifests, audio_manifests, subtitle_manifests, ladder_stats)
+
+class RenditionRequests:
+    # Single-flight : les lecteurs qui demandent en même temps une qualité absente déclenchent une seule
+    # génération. Dans le processus, une demande déjà soumise n'est pas resoumise pendant la durée d'un bail ;
+    # entre processus et noeuds, submit() ne crée pas de seconde tâche pour la même (vidéo, qualité).
+    def __init__(self):
+        self.lock = Lock()
+        self.submitted = {}
+
+    def request(self, video_id, quality):
+        from apps.videos.scheduler import video_processing_scheduler
+        key = (video_id, quality)
+        now = time.monotonic()
+        with self.lock:
+            submitted_at = self.submitted.get(key)
+            if submitted_at is not None and now - submitted_at < settings.VIDEO_PROCESSING_LEASE_SECONDS:
+                return False
+            self.submitted[key] = now
+            for stale in [k for k, t in self.submitted.items() if now - t >= settings.VIDEO_PROCESSING_LEASE_SECONDS]:
+                del self.submitted[stale]
+        video_processing_scheduler.submit("RENDITION", video_id, quality)
+        return True
+
+    def ensure(self, video_id, quality, playlist):
+        # True si la playlist est servable : complète (ENDLIST), ou EVENT en cours d'encodage avec un premier segment.
+        # False si la génération est lancée ou en cours sans segment (le lecteur réessaie après Retry-After : aucune
+        # attente dans la vue), None si la qualité n'existe pas pour cette vidéo.
+        # Playlist sans ENDLIST et sans tâche active : encodage interrompu (ffmpeg tué, bail expiré), on régénère.
+        content = read_playlist(playlist)
+        if content is not None and "#EXT-X-ENDLIST" in content:
+            with self.lock:
+                self.submitted.pop((video_id, quality), None)
+            return True
+        if not is_jit_quality(video_id, quality):
+            return None
+        if content is not None and is_rendition_generating(video_id, quality):
+            return "#EXTINF" in content
+        if content is not None:
+            print(f"[❕] Qualité {quality} de la vidéo {video_id} incomplète et sans encodage actif : régénération")
+            with self.lock:
+                self.submitted.pop((video_id, quality), None)
+        self.request(video_id, quality)
+        return False
+
+class RenditionAccessBuffer:
+    # Fréquentation des qualités à la demande (playlists et segments servis) : cumulée en mémoire et écrite
+    # par lots, une mise à jour par (vidéo, qualité) touchée dans l'intervalle
+    def __init__(self):
+        self.lock = Lock()
+        self.pending = {}
+        self.stopped = Event()
+        self.flusher = None
+
+    def start(self):
+        with self.lock:
+            if self.flusher is not None:
+                return
+            self.flusher = Thread(target=self.flush_loop, daemon=True)
+            self.flusher.start()
+        atexit.register(self.stop)
+
+    def flush_loop(self):
+        while not self.stopped.wait(settings.RENDITION_ACCESS_FLUSH_SECONDS):
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                print(f"Erreur lors de l'écriture des accès aux qualités : {e}")
+
+    def stop(self):
+        self.stopped.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Erreur lors de l'écriture des accès aux qualités : {e}")
+
+    def touch(self, owner, quality):
+        now = default_created_at()
+        with self.lock:
+            entry = self.pending.setdefault((owner, quality), [now, 0])
+            entry[0] = now
+            entry[1] += 1
+        self.start()
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        for (owner, quality), (last_accessed_at, hits) in batch.items():
+            # Sans ligne (qualité encodée à l'envoi, ou génération en cours) : rien à mettre à jour
+            filter_renditions(owner, quality).update(
+                last_accessed_at=last_accessed_at, hits=F('hits') + hits
+            )
+        return len(batch)
+
+class RenditionEvictor:
+    # Garde l'espace occupé par les qualités à la demande sous VIDEO_RENDITION_DISK_QUOTA : les plus froides
+    # (dernier accès le plus ancien) partent d'abord, celles que des spectateurs récents ont choisies
+    # (VideoWatch.quality) en dernier. Une qualité évincée reste annoncée et sera régénérée si on la redemande.
+    def __init__(self):
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        if not settings.VIDEO_JIT_RENDITIONS or not settings.VIDEO_RENDITION_DISK_QUOTA:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(settings.VIDEO_RENDITION_EVICT_SECONDS):
+            try:
+                close_old_connections()
+                self.evict()
+            except Exception as e:
+                print(f"Erreur lors de l'éviction des qualités : {e}")
+
+    def reclaim_interrupted(self):
+        # Ligne créée avant l'encodage (taille 0) sans tâche active : encodage interrompu, fichiers partiels supprimés.
+        # La qualité reste annoncée et sera régénérée si on la redemande.
+        from apps.videos.models import VideoRendition
+        generating = get_generating_renditions()
+        reclaimed = 0
+        for rendition in VideoRendition.objects.filter(size_bytes=0).values('id', 'video_id', 'quality'):
+            if (rendition['video_id'], rendition['quality']) in generating:
+                continue
+            shutil.rmtree(get_rendition_dir(rendition['video_id'], rendition['quality']), ignore_errors=True)
+            VideoRendition.objects.filter(id=rendition['id'], size_bytes=0).delete()
+            reclaimed += 1
+        if reclaimed:
+            print(f"[❕] {reclaimed} qualité(s) à l'encodage interrompu supprimée(s)")
+        return reclaimed
+
+    def evict(self, quota=None):
+        from apps.videos.models import VideoRendition
+        from apps.videos.tasks import get_quality_key, is_cmaf
+        from apps.streaming.models import VideoWatch
+        quota = settings.VIDEO_RENDITION_DISK_QUOTA if quota is None else quota
+        rendition_access.flush()
+        self.reclaim_interrupted()
+        total = VideoRendition.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+        if total <= quota:
+            return 0
+        now = default_created_at()
+        generating = get_generating_renditions()
+        candidates = [candidate for candidate in VideoRendition.objects.filter(
+            last_accessed_at__lt=now - timedelta(seconds=settings.VIDEO_RENDITION_MIN_IDLE_SECONDS)
+        ).order_by('last_accessed_at', 'hits', 'id').values('id', 'video_id', 'quality', 'size_bytes')
+            if (candidate['video_id'], candidate['quality']) not in generating]
+        watched = {
+            (video_id, get_quality_key(quality))
+            for video_id, quality in VideoWatch.objects.filter(
+                video_id__in={candidate['video_id'] for candidate in candidates},
+                last_watch__gte=now - timedelta(days=settings.VIDEO_RENDITION_WATCH_DAYS)
+            ).exclude(quality='auto').values_list('video_id', 'quality')
+        }
+        # Tri stable : les qualités sans spectateur récent d'abord, chaque groupe du plus froid au plus chaud
+        candidates.sort(key=lambda candidate: (candidate['video_id'], get_quality_key(candidate['quality'])) in watched)
+        evicted = set()
+        freed = 0
+        for candidate in candidates:
+            if total <= quota:
+                break
+            shutil.rmtree(get_rendition_dir(candidate['video_id'], candidate['quality']), ignore_errors=True)
+            VideoRendition.objects.filter(id=candidate['id']).delete()
+            total -= candidate['size_bytes']
+            freed += candidate['size_bytes']
+            evicted.add(candidate['video_id'])
+        if is_cmaf():
+            for video_id in evicted:
+                refresh_dash_manifest(video_id)
+        if evicted:
+            print(f"[❕] Éviction : {freed} octets libérés sur {len(evicted)} vidéo(s), {total} octets restants")
+        return freed
+
+rendition_requests = RenditionRequests()
+rendition_access = RenditionAccessBuffer()
+rendition_evictor = RenditionEvictor()
@@ -4,4 +4,5 @@ from apps.videos import consumers
 video_websocket_urlpatterns = [
     re_path(r'ws/upload/(?P<upload_id>[^/]+)/$', consumers.UploadProgressConsumer.as_asgi()),
     re_path(r'ws/videos/$', consumers.VideoConsumer.as_asgi()),
+    re_path(r'ws/comments/(?P<video_id>[0-9]+)/$', consumers.CommentStreamConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,263 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone as django_timezone
+from threading import Thread, Condition, Event
+from datetime import timedelta
+from uuid import uuid4
+import multiprocessing
+import tempfile
+import traceback
+import socket
+import signal
+import time
+import os
+
+# Plus la valeur est petite, plus la tâche passe tôt : miniatures et métadonnées
+# ne doivent jamais attendre derrière une longue conversion, ni une qualité qu'un lecteur attend (JIT).
+TASK_PRIORITIES = {
+    'THUMBNAILS': 0,
+    'METADATA': 1,
+    'CONVERSION': 2,
+    'RENDITION': 0,
+}
+
+def _init_worker():
+    import django
+    django.setup()
+
+def get_task_handler(task_type):
+    from apps.videos.tasks import generate_video_affichage, generate_video_info, process_video_conversion, generate_rendition
+    return {
+        'THUMBNAILS': generate_video_affichage,
+        'METADATA': generate_video_info,
+        'CONVERSION': process_video_conversion,
+        'RENDITION': generate_rendition,
+    }[task_type]
+
+def finish_task(task_id, worker_id, status, error_message=None):
+    from apps.videos.models import VideoProcessingTask
+    # Seul le détenteur du bail peut clore la tâche : si le bail a expiré et qu'un
+    # autre noeud l'a reprise, ce résultat est ignoré.
+    return VideoProcessingTask.objects.filter(id=task_id, worker_id=worker_id, status='PROCESSING').update(
+        status=status, error_message=error_message, lease_expires_at=None, updated_at=django_timezone.now()
+    )
+
+def requeue_expired_tasks():
+    from apps.videos.models import VideoProcessingTask
+    now = django_timezone.now()
+    expired = VideoProcessingTask.objects.filter(status='PROCESSING', lease_expires_at__lt=now)
+    failed = expired.filter(attempts__gte=settings.VIDEO_PROCESSING_MAX_ATTEMPTS).update(
+        status='FAILED', error_message="Bail expiré : nombre maximal de tentatives atteint",
+        worker_id=None, lease_expires_at=None, updated_at=now
+    )
+    requeued = expired.update(status='PENDING', worker_id=None, lease_expires_at=None, updated_at=now)
+    if failed or requeued:
+        print(f"[❕] Baux expirés : {requeued} tâche(s) remise(s) en file, {failed} en échec")
+    return requeued
+
+def expire_overdue_tasks(runs, worker_id):
+    # runs : (id, tentative) ; la tentative évite de toucher à une nouvelle exécution de la même tâche
+    from apps.videos.models import VideoProcessingTask
+    now = django_timezone.now()
+    error_message = "Durée maximale d'exécution dépassée"
+    failed = requeued = 0
+    for task_id, attempts in runs:
+        overdue = VideoProcessingTask.objects.filter(id=task_id, attempts=attempts, worker_id=worker_id, status='PROCESSING')
+        if attempts >= settings.VIDEO_PROCESSING_MAX_ATTEMPTS:
+            failed += overdue.update(status='FAILED', error_message=error_message, worker_id=None, lease_expires_at=None, updated_at=now)
+        else:
+            requeued += overdue.update(status='PENDING', error_message=error_message, worker_id=None, lease_expires_at=None, updated_at=now)
+    if failed or requeued:
+        print(f"[❕] Durée maximale dépassée : {requeued} tâche(s) remise(s) en file, {failed} en échec")
+    return requeued
+
+def on_runtime_exceeded(signum, frame):
+    raise TimeoutError("Durée maximale d'exécution dépassée")
+
+def run_processing_task(task_id, task_type, video_id, worker_id, quality=''):
+    # Exécuté dans un processus du pool : chaque tâche a son propre répertoire
+    # de travail temporaire pour les fichiers intermédiaires (ffmpeg, moviepy...).
+    previous_cwd = os.getcwd()
+    previous_tempdir = tempfile.tempdir
+    # Processus bloqué (ffmpeg, moviepy) : interrompu par SIGALRM, subprocess.run tue alors son ffmpeg
+    has_alarm = hasattr(signal, 'SIGALRM')
+    if has_alarm:
+        signal.signal(signal.SIGALRM, on_runtime_exceeded)
+        signal.alarm(settings.VIDEO_PROCESSING_MAX_RUNTIME[task_type])
+    with tempfile.TemporaryDirectory(prefix=f"{task_type.lower()}_{video_id}_") as work_dir:
+        try:
+            os.chdir(work_dir)
+            tempfile.tempdir = work_dir
+            print(f"[!] 🖼️ Worker {worker_id} : {task_type} pour vidéo ID: {video_id}")
+            get_task_handler(task_type)(video_id, *([quality] if quality else []))
+            finish_task(task_id, worker_id, 'COMPLETED')
+        except Exception as e:
+            print("[❌] Erreur dans le worker pour vidéo ID:", video_id, str(e))
+            finish_task(task_id, worker_id, 'FAILED', f"{e}\n{traceback.format_exc()}")
+        finally:
+            if has_alarm:
+                signal.alarm(0)
+            tempfile.tempdir = previous_tempdir
+            os.chdir(previous_cwd)
+
+class VideoProcessingScheduler:
+    def __init__(self, max_workers=None, concurrency=None, task_types=None):
+        self.max_workers = max_workers or settings.VIDEO_PROCESSING_WORKERS
+        self.concurrency = concurrency or settings.VIDEO_PROCESSING_CONCURRENCY
+        self.task_types = task_types or list(TASK_PRIORITIES)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.condition = Condition()
+        self.stopped = Event()
+        self.running = {task_type: 0 for task_type in TASK_PRIORITIES}
+        # (id, tentative) -> (type, début) : une tâche remise en file et reprise ici est une nouvelle exécution
+        self.running_tasks = {}
+        self.executor = None
+        self.dispatcher = None
+
+    def start(self):
+        with self.condition:
+            if self.dispatcher is not None:
+                return
+            self.executor = self.create_executor()
+            self.dispatcher = Thread(target=self.dispatch_loop, daemon=True)
+            self.dispatcher.start()
+            Thread(target=self.heartbeat_loop, daemon=True).start()
+        # Les noeuds de traitement font aussi l'éviction des qualités à la demande (sans effet hors mode JIT)
+        from apps.videos.renditions import rendition_evictor
+        rendition_evictor.start()
+
+    def create_executor(self):
+        context = multiprocessing.get_context(settings.VIDEO_PROCESSING_START_METHOD)
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context, initializer=_init_worker)
+
+    def submit(self, task_type, video_id, quality=''):
+        from apps.videos.models import VideoProcessingTask
+        if task_type not in TASK_PRIORITIES:
+            raise ValueError(f"Type de tâche inconnu : {task_type}")
+        if VideoProcessingTask.objects.filter(video_id=video_id, task_type=task_type, quality=quality, status__in=['PENDING', 'PROCESSING']).exists():
+            return None
+        task = VideoProcessingTask.objects.create(video_id=video_id, task_type=task_type, quality=quality, priority=TASK_PRIORITIES[task_type])
+        if settings.VIDEO_PROCESSING_EMBEDDED_WORKER:
+            self.start()
+            with self.condition:
+                self.condition.notify()
+        return task
+
+    def claim_task(self):
+        from apps.videos.models import VideoProcessingTask
+        with self.condition:
+            if sum(self.running.values()) >= self.max_workers:
+                return None
+            available_types = [t for t in self.task_types if self.running[t] < self.concurrency.get(t, 1)]
+        if not available_types:
+            return None
+        candidates = VideoProcessingTask.objects.filter(
+            status='PENDING', task_type__in=available_types
+        ).order_by('priority', 'created_at', 'id').values_list('id', flat=True)[:10]
+        for task_id in candidates:
+            now = django_timezone.now()
+            # Compare-and-swap : un seul noeud peut faire passer la tâche de PENDING à PROCESSING
+            claimed = VideoProcessingTask.objects.filter(id=task_id, status='PENDING').update(
+                status='PROCESSING', worker_id=self.worker_id, heartbeat_at=now, updated_at=now,
+                lease_expires_at=now + timedelta(seconds=settings.VIDEO_PROCESSING_LEASE_SECONDS),
+                attempts=F('attempts') + 1
+            )
+            if claimed:
+                return VideoProcessingTask.objects.get(id=task_id)
+        return None
+
+    def dispatch_loop(self):
+        while not self.stopped.is_set():
+            try:
+                close_old_connections()
+                requeue_expired_tasks()
+                task = self.claim_task()
+            except Exception as e:
+                print(f"Erreur lors de la récupération des tâches : {e}")
+                task = None
+            if task is None:
+                with self.condition:
+                    self.condition.wait(settings.VIDEO_PROCESSING_POLL_SECONDS)
+                continue
+            with self.condition:
+                self.running[task.task_type] += 1
+                self.running_tasks[(task.id, task.attempts)] = (task.task_type, time.monotonic())
+            args = (run_processing_task, task.id, task.task_type, task.video_id, self.worker_id, task.quality)
+            with self.condition:
+                executor = self.executor
+            try:
+                future = executor.submit(*args)
+            except BrokenProcessPool:
+                executor = self.replace_executor(executor)
+                future = executor.submit(*args)
+            future.add_done_callback(lambda f, task=task, executor=executor: self.on_task_done(f, task, executor))
+
+    def heartbeat_loop(self):
+        from apps.videos.models import VideoProcessingTask
+        while not self.stopped.wait(settings.VIDEO_PROCESSING_HEARTBEAT_SECONDS):
+            # Seuls les baux des tâches sous leur durée maximale sont renouvelés ; une tâche bloquée au-delà
+            # (marge d'un battement pour laisser le processus s'interrompre lui-même) est remise en file
+            deadline = time.monotonic() - settings.VIDEO_PROCESSING_HEARTBEAT_SECONDS
+            with self.condition:
+                task_ids, overdue_runs = [], []
+                for run, (task_type, started_at) in self.running_tasks.items():
+                    if started_at + settings.VIDEO_PROCESSING_MAX_RUNTIME[task_type] < deadline:
+                        overdue_runs.append(run)
+                    else:
+                        task_ids.append(run[0])
+            if not task_ids and not overdue_runs:
+                continue
+            try:
+                close_old_connections()
+                if overdue_runs:
+                    expire_overdue_tasks(overdue_runs, self.worker_id)
+                now = django_timezone.now()
+                VideoProcessingTask.objects.filter(id__in=task_ids, worker_id=self.worker_id, status='PROCESSING').update(
+                    heartbeat_at=now, lease_expires_at=now + timedelta(seconds=settings.VIDEO_PROCESSING_LEASE_SECONDS)
+                )
+            except Exception as e:
+                print(f"Erreur lors du renouvellement des baux : {e}")
+
+    def replace_executor(self, broken):
+        # Pool cassé : toutes ses tâches en cours échouent en même temps, un seul remplacement
+        with self.condition:
+            if self.executor is not broken:
+                return self.executor
+            self.executor = self.create_executor()
+            executor = self.executor
+        broken.shutdown(wait=False, cancel_futures=True)
+        return executor
+
+    def on_task_done(self, future, task, executor):
+        error = future.exception()
+        if error is not None:
+            # Le processus est mort avant d'avoir pu enregistrer l'échec lui-même
+            print("[❌] Processus de traitement interrompu pour vidéo ID:", task.video_id, str(error))
+            try:
+                finish_task(task.id, self.worker_id, 'FAILED', str(error))
+            except Exception as e:
+                print(f"Erreur lors de la mise à jour de la tâche {task.id} : {e}")
+            if isinstance(error, BrokenProcessPool):
+                self.replace_executor(executor)
+        with self.condition:
+            self.running[task.task_type] -= 1
+            self.running_tasks.pop((task.id, task.attempts), None)
+            self.condition.notify()
+
+    def stop(self):
+        from apps.videos.models import VideoProcessingTask
+        self.stopped.set()
+        with self.condition:
+            task_ids = [task_id for task_id, _ in self.running_tasks]
+            self.condition.notify_all()
+        # Les tâches en cours sont rendues à la file pour qu'un autre noeud les reprenne
+        VideoProcessingTask.objects.filter(id__in=task_ids, worker_id=self.worker_id, status='PROCESSING').update(
+            status='PENDING', worker_id=None, lease_expires_at=None, updated_at=django_timezone.now()
+        )
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+video_processing_scheduler = VideoProcessingScheduler()
@@ -0,0 +1,349 @@
+from django.conf import settings
+from django.db import connection, transaction, close_old_connections
+from django.db.models.expressions import RawSQL
+from collections import defaultdict
+from datetime import timedelta
+from threading import Event, Lock, Thread
+import unicodedata
+import bisect
+import math
+import re
+
+# Poids des champs pour le classement BM25 : un mot du titre compte plus qu'un mot de la description
+FIELD_WEIGHTS = {
+    'titre': 3.0,
+    'description': 1.0,
+    'tags': 2.0,
+    'categorie': 2.0,
+}
+
+ELISION_PATTERN = re.compile(r"\b(?:l|d|j|m|n|s|t|c|qu|jusqu|lorsqu|puisqu)['’]", re.IGNORECASE)
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+STOP_WORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "cet", "cette", "dans", "de", "des", "du", "elle", "elles",
+    "en", "est", "et", "il", "ils", "je", "la", "le", "les", "leur", "leurs", "lui", "ma", "mais", "me",
+    "mes", "mon", "ne", "nos", "notre", "nous", "on", "ou", "par", "pas", "pour", "qu", "que", "qui",
+    "sa", "se", "ses", "son", "sont", "sur", "ta", "te", "tes", "ton", "tu", "un", "une", "vos", "votre",
+    "vous", "y",
+}
+
+def fold_accents(text):
+    text = text.lower().replace("œ", "oe").replace("æ", "ae")
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def stem_token(token):
+    # Racinisation légère : on retire seulement les marques de pluriel les plus courantes
+    if len(token) > 3 and token.endswith("x") and token[-3:-1] in ("au", "eu", "ou"):
+        return token[:-1]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text):
+    text = fold_accents(ELISION_PATTERN.sub(" ", text or ""))
+    return [stem_token(token) for token in TOKEN_PATTERN.findall(text) if token not in STOP_WORDS]
+
+def parse_query(search_term):
+    # Le dernier mot en cours de frappe est cherché comme préfixe (recherche à chaque frappe)
+    text = fold_accents(ELISION_PATTERN.sub(" ", search_term or ""))
+    words = TOKEN_PATTERN.findall(text)
+    if not words:
+        return [], None
+    prefix = None
+    if not text[-1:].isspace():
+        # Racinisé aussi : "chats" doit trouver "chat" comme le mot complet
+        prefix = stem_token(words.pop())
+    terms = list(dict.fromkeys(stem_token(word) for word in words if word not in STOP_WORDS))
+    if prefix in terms:
+        prefix = None
+    return terms, prefix
+
+def build_document(video, tag_names=None):
+    if tag_names is None:
+        tag_names = video.tags.values_list('name', flat=True)
+    return {
+        'titre': tokenize(video.titre),
+        'description': tokenize(video.description),
+        'tags': tokenize(" ".join(tag_names)),
+        'categorie': tokenize(video.categorie),
+    }
+
+def iter_documents(batch_size=500):
+    from apps.videos.models import Video
+    videos = Video.objects.only('id', 'titre', 'description', 'categorie').prefetch_related('tags').order_by('id')
+    for video in videos.iterator(chunk_size=batch_size):
+        yield video.id, build_document(video, [tag.name for tag in video.tags.all()])
+
+class SQLiteSearchBackend:
+    table = "video_search"
+
+    def __init__(self):
+        self.ready = False
+
+    def ensure_table(self):
+        if self.ready:
+            return
+        columns = ", ".join(FIELD_WEIGHTS)
+        with connection.cursor() as cursor:
+            # Le texte est déjà normalisé (accents, élisions, pluriels) avant l'insertion
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5({columns}, tokenize='unicode61', prefix='2 3')")
+        if connection.in_atomic_block:
+            # Création annulée si la transaction englobante l'est : tenue pour acquise seulement une fois validée
+            transaction.on_commit(self.mark_ready)
+        else:
+            self.ready = True
+
+    def mark_ready(self):
+        self.ready = True
+
+    def index(self, video_id, document):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [video_id])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, {', '.join(FIELD_WEIGHTS)}) VALUES (%s, %s, %s, %s, %s)",
+                [video_id] + [" ".join(document[field]) for field in FIELD_WEIGHTS]
+            )
+
+    def remove(self, video_id):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [video_id])
+
+    def clear(self):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def rebuild(self, batch_size=500):
+        self.ensure_table()
+        count = 0
+        with transaction.atomic():
+            self.clear()
+            for video_id, document in iter_documents(batch_size):
+                self.index(video_id, document)
+                count += 1
+        with connection.cursor() as cursor:
+            # Fusionne les segments de l'index FTS5 après un chargement massif
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+        return count
+
+    def get_match(self, terms, prefix):
+        return " ".join([f'"{term}"' for term in terms] + ([f'"{prefix}"*'] if prefix else []))
+
+    def search(self, terms, prefix, limit, offset=0):
+        self.ensure_table()
+        weights = ", ".join(str(weight) for weight in FIELD_WEIGHTS.values())
+        with connection.cursor() as cursor:
+            # bm25() renvoie un score négatif : plus il est petit, plus le document est pertinent.
+            # rowid départage les ex aequo : le rang d'un document est stable d'une page à l'autre
+            cursor.execute(
+                f"SELECT rowid, -bm25({self.table}, {weights}) AS score FROM {self.table} "
+                f"WHERE {self.table} MATCH %s ORDER BY score DESC, rowid LIMIT %s OFFSET %s",
+                [self.get_match(terms, prefix), limit, offset]
+            )
+            return cursor.fetchall()
+
+    def filter(self, queryset, terms, prefix):
+        # Sous-requête sur l'index : toutes les correspondances, sans liste d'ids en mémoire
+        self.ensure_table()
+        return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [self.get_match(terms, prefix)]))
+
+class MemorySearchBackend:
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.lock = Lock()
+        self.load_lock = Lock()
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+        self.documents = {}
+        self.vocabulary = []
+        self.vocabulary_dirty = False
+        self.loaded = False
+        self.synced_at = None
+        self.stopped = Event()
+        self.syncer = None
+
+    def apply(self, video_id, document):
+        with self.lock:
+            self.remove_locked(video_id)
+            if document is None:
+                return
+            frequencies = defaultdict(float)
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in document.get(field, []):
+                    frequencies[token] += weight
+            for token, frequency in frequencies.items():
+                if token not in self.postings:
+                    self.vocabulary_dirty = True
+                self.postings[token][video_id] = frequency
+            self.lengths[video_id] = sum(frequencies.values())
+            self.documents[video_id] = list(frequencies)
+
+    def index(self, video_id, document):
+        # Le document est écrit en base pour les autres processus, qui le récupèrent à leur synchronisation
+        from apps.videos.models import VideoSearchDocument
+        VideoSearchDocument.objects.update_or_create(video_id=video_id, defaults={'document': document})
+        self.apply(video_id, document)
+
+    def remove_locked(self, video_id):
+        for token in self.documents.pop(video_id, []):
+            postings = self.postings[token]
+            postings.pop(video_id, None)
+            if not postings:
+                del self.postings[token]
+                self.vocabulary_dirty = True
+        self.lengths.pop(video_id, None)
+
+    def remove(self, video_id):
+        from apps.videos.models import VideoSearchDocument
+        VideoSearchDocument.objects.update_or_create(video_id=video_id, defaults={'document': None})
+        self.apply(video_id, None)
+
+    def load(self, batch_size=500):
+        from apps.videos.models import Video, VideoSearchDocument
+        # Construit un nouvel index à part puis l'échange : les recherches en cours ne voient jamais d'index partiel
+        fresh = MemorySearchBackend()
+        synced_at = None
+        rows = VideoSearchDocument.objects.filter(document__isnull=False).values_list('video_id', 'document', 'updated_at')
+        for video_id, document, updated_at in rows.iterator(chunk_size=batch_size):
+            fresh.apply(video_id, document)
+            synced_at = max(synced_at or updated_at, updated_at)
+        with self.lock:
+            self.postings, self.lengths, self.documents = fresh.postings, fresh.lengths, fresh.documents
+            self.vocabulary_dirty = True
+            self.synced_at = synced_at
+            self.loaded = True
+        # Vidéos sans document (antérieures à l'index) : on les indexe maintenant
+        missing = Video.objects.exclude(id__in=VideoSearchDocument.objects.values('video_id'))
+        indexed = 0
+        for video in missing.only('id', 'titre', 'description', 'categorie').prefetch_related('tags').iterator(chunk_size=batch_size):
+            self.index(video.id, build_document(video, [tag.name for tag in video.tags.all()]))
+            indexed += 1
+        if indexed:
+            print(f"[❕] Index de recherche : {indexed} vidéo(s) indexée(s), {len(self.lengths)} au total")
+        return len(self.lengths)
+
+    def rebuild(self, batch_size=500):
+        from apps.videos.models import VideoSearchDocument
+        with transaction.atomic():
+            VideoSearchDocument.objects.all().delete()
+            VideoSearchDocument.objects.bulk_create(
+                (VideoSearchDocument(video_id=video_id, document=document) for video_id, document in iter_documents(batch_size)),
+                batch_size=batch_size
+            )
+        return self.load(batch_size)
+
+    def sync(self):
+        # Incrémental : seuls les documents modifiés (ou supprimés) depuis la dernière synchronisation
+        from apps.videos.models import VideoSearchDocument
+        rows = VideoSearchDocument.objects.all()
+        if self.synced_at is not None:
+            # Petite marge pour ne pas manquer les écritures d'autres processus validées en retard
+            rows = rows.filter(updated_at__gte=self.synced_at - timedelta(seconds=settings.VIDEO_SEARCH_REFRESH_SECONDS))
+        for video_id, document, updated_at in rows.values_list('video_id', 'document', 'updated_at'):
+            self.apply(video_id, document)
+            self.synced_at = max(self.synced_at or updated_at, updated_at)
+
+    def sync_loop(self):
+        while not self.stopped.wait(settings.VIDEO_SEARCH_REFRESH_SECONDS):
+            try:
+                close_old_connections()
+                self.sync()
+            except Exception as e:
+                print(f"Erreur lors de la synchronisation de l'index de recherche : {e}")
+
+    def ensure_loaded(self):
+        # Chargé une fois par processus ; les écritures des autres processus arrivent ensuite en tâche de fond
+        if self.loaded:
+            return
+        with self.load_lock:
+            if self.loaded:
+                return
+            self.load()
+            self.syncer = Thread(target=self.sync_loop, daemon=True)
+            self.syncer.start()
+
+    def prefix_postings(self, prefix):
+        if self.vocabulary_dirty:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_dirty = False
+        postings = {}
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            for video_id, frequency in self.postings[token].items():
+                postings[video_id] = max(frequency, postings.get(video_id, 0.0))
+        return postings
+
+    def get_term_postings(self, terms, prefix):
+        term_postings = [self.postings.get(term, {}) for term in terms]
+        if prefix:
+            term_postings.append(self.prefix_postings(prefix))
+        if not term_postings or not all(term_postings):
+            return [], set()
+        # Tous les termes doivent être présents (ET implicite, comme FTS5)
+        return term_postings, set.intersection(*(set(postings) for postings in sorted(term_postings, key=len)))
+
+    def search(self, terms, prefix, limit, offset=0):
+        self.ensure_loaded()
+        with self.lock:
+            term_postings, candidates = self.get_term_postings(terms, prefix)
+            if not candidates:
+                return []
+            total = len(self.lengths)
+            average_length = sum(self.lengths.values()) / total
+            scores = defaultdict(float)
+            for postings in term_postings:
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for video_id in candidates:
+                    frequency = postings[video_id]
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[video_id] / average_length)
+                    scores[video_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[offset:offset + limit]
+
+    def filter(self, queryset, terms, prefix):
+        self.ensure_loaded()
+        with self.lock:
+            candidates = self.get_term_postings(terms, prefix)[1]
+        return queryset.filter(id__in=candidates)
+
+class VideoSearchIndex:
+    def __init__(self):
+        self.backend = None
+
+    def get_backend(self):
+        if self.backend is None:
+            name = settings.VIDEO_SEARCH_BACKEND
+            if name == 'auto':
+                name = 'fts5' if connection.vendor == 'sqlite' else 'memory'
+            self.backend = SQLiteSearchBackend() if name == 'fts5' else MemorySearchBackend()
+        return self.backend
+
+    def index_video(self, video):
+        self.get_backend().index(video.id, build_document(video))
+
+    def remove_video(self, video_id):
+        self.get_backend().remove(video_id)
+
+    def rebuild(self, batch_size=500):
+        return self.get_backend().rebuild(batch_size)
+
+    def search(self, search_term, limit=None, offset=0):
+        terms, prefix = parse_query(search_term)
+        if not terms and not prefix:
+            return None
+        return self.get_backend().search(terms, prefix, limit or settings.VIDEO_SEARCH_MAX_RESULTS, offset)
+
+    def filter(self, queryset, search_term):
+        # Restreint aux vidéos correspondantes, sans limite de nombre (tri autre que la pertinence)
+        terms, prefix = parse_query(search_term)
+        if not terms and not prefix:
+            return queryset
+        return self.get_backend().filter(queryset, terms, prefix)
+
+video_search_index = VideoSearchIndex()
@@ -4,41 +4,23 @@ from apps.users.serializers import UserSerializer
 from django.utils.text import slugify
 from apps.streaming.models import VideoWatch
 from apps.streaming.serializers import VideoWatchSerializer
+from apps.streaming.buffer import watch_progress_buffer
 from django.conf import settings
+from django.db import transaction
 from helpers.helper import (
-    calcule_de_similarite_de_phrase, get_available_info, format_file_size, format_duration, format_views, 
+    get_available_info, format_file_size, format_duration, format_views, 
     format_elapsed_time
 )
-from apps.videos.tasks import generate_video_affichage
-from django.db.models import Count
+from apps.videos.scheduler import video_processing_scheduler
+from apps.videos.suggestions import suggestion_index
+from apps.videos.comments import get_thread_messages, get_reply_preview, get_comment_page, attach_comment_pages
+from django.db.models import Count, Exists, OuterRef, Subquery, Prefetch, QuerySet
+from django.db.models.functions import Coalesce
+from django.db.models.manager import BaseManager
 from django.contrib.auth.models import AnonymousUser
-from queue import Queue
-from threading import Thread
 import os
 import time
 
-################################# WORKER #################################
-video_affichage_queue = Queue()
-
-def video_affichage_worker():
-    while True:
-        video_id = video_affichage_queue.get()
-        print("[!] 🖼️ Worker génère image pour vidéo ID:", video_id)
-        try:
-            generate_video_affichage(video_id)
-        except Exception as e:
-            print("[❌] Erreur dans le worker pour image ID:", video_id, str(e))
-        finally:
-            video_affichage_queue.task_done()
-            
-affichage_worker_thread = Thread(target=video_affichage_worker, daemon=True)
-affichage_worker_thread.start()
-
-processing_worker_thread = Thread(target=video_affichage_worker, daemon=True)
-processing_worker_thread.start()
-
-################################# WORKER #################################
-
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -49,8 +31,8 @@ class TagSerializer(serializers.ModelSerializer):
 
 class MessageSerializer(serializers.ModelSerializer):
     envoyeur = UserSerializer(read_only=True)
-    likes_count = serializers.SerializerMethodField()
-    dislikes_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(read_only=True)
+    dislikes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Message
@@ -59,12 +41,6 @@ class MessageSerializer(serializers.ModelSerializer):
             'dislikes_count', 'created_at'
         ]
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-
-    def get_dislikes_count(self, obj):
-        return obj.dislikes.count()
-
 class CommentaireSerializer(serializers.ModelSerializer):
     membres = UserSerializer(many=True, read_only=True)
     membre_ids = serializers.ListField(
@@ -73,27 +49,34 @@ class CommentaireSerializer(serializers.ModelSerializer):
     message = serializers.SerializerMethodField()
     reponses = serializers.SerializerMethodField()
     reponses_count = serializers.SerializerMethodField()
+    reponses_next = serializers.SerializerMethodField()
 
     class Meta:
         model = Commentaire
-        fields = ['id', 'video', 'membres', 'membre_ids', 'created_at', 'message', 'reponses', 'reponses_count']
-        
+        fields = ['id', 'video', 'membres', 'membre_ids', 'created_at', 'message', 'reponses', 'reponses_count', 'reponses_next']
+
     def get_message(self, obj):
-        if obj.messages.exists():
-            return MessageSerializer(obj.messages.first()).data
+        # Premier message et aperçu des réponses : lus par plan_comment_queryset pour toute la page
+        messages = get_thread_messages(obj)
+        if messages:
+            return MessageSerializer(messages[0]).data
         return None
     
     def get_reponses(self, obj):
-        if obj.messages.count() > 1:
-            return MessageSerializer(obj.messages.all()[1:], many=True).data
-        return []
+        return MessageSerializer(get_reply_preview(obj)[0], many=True).data
     
     def get_reponses_count(self, obj):
-        return max(0, obj.messages.count() - 1)
+        return max(0, obj.messages_count - 1)
+
+    def get_reponses_next(self, obj):
+        return get_reply_preview(obj)[1]
 
     def create(self, validated_data):
+        from apps.videos.counters import increment_counters
         membre_ids = validated_data.pop('membre_ids', None)
-        commentaire = Commentaire.objects.create(**validated_data)
+        with transaction.atomic():
+            commentaire = Commentaire.objects.create(**validated_data)
+            increment_counters(Video, commentaire.video_id, commentaires_count=1)
         
         if membre_ids:
             commentaire.membres.set(membre_ids)
@@ -167,12 +150,38 @@ class PlaylistSerializer(serializers.ModelSerializer):
         
         return instance
 
+def count_subquery(model, field):
+    counts = model.objects.filter(**{field: OuterRef('pk')}).values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts[:1]), 0)
+
+def plan_video_queryset(videos, request=None):
+    # Nombre de requêtes fixe quelle que soit la taille de la page :
+    # compteurs lus dans leurs colonnes, indicateurs par utilisateur en sous-requêtes, relations en prefetch.
+    # Les fils de commentaires ne sont pas préchargés ici : seule la première page l'est, par attach_comment_pages
+    videos = videos.select_related('envoyeur', 'info').prefetch_related('tags')
+    user = getattr(request, 'user', None)
+    if user is not None and not isinstance(user, AnonymousUser):
+        videos = videos.annotate(
+            annotated_is_liked_by_me=Exists(Video.likes.through.objects.filter(video_id=OuterRef('pk'), user_id=user.id)),
+            annotated_is_disliked_by_me=Exists(Video.dislikes.through.objects.filter(video_id=OuterRef('pk'), user_id=user.id)),
+            annotated_is_view_by_me=Exists(Video.vues.through.objects.filter(video_id=OuterRef('pk'), user_id=user.id)),
+        ).prefetch_related(Prefetch('watches', queryset=VideoWatch.objects.filter(user_id=user.id), to_attr='my_watches'))
+    return videos
+
+class VideoListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, (QuerySet, BaseManager)):
+            data = plan_video_queryset(data.all(), self.context.get('request'))
+        data = list(data)
+        attach_comment_pages(data)
+        return super().to_representation(data)
+
 class SuggestedVideoSerializer(serializers.ModelSerializer):
     envoyeur = UserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    likes_count = serializers.SerializerMethodField()
-    dislikes_count = serializers.SerializerMethodField()
-    vues_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(read_only=True)
+    dislikes_count = serializers.IntegerField(read_only=True)
+    vues_count = serializers.IntegerField(read_only=True)
     fichier_url = serializers.SerializerMethodField()
     affichage_url = serializers.SerializerMethodField()
 
@@ -190,18 +199,9 @@ class SuggestedVideoSerializer(serializers.ModelSerializer):
 
     def get_affichage_url(self, obj):
         if obj.affichage is None:
-            video_affichage_queue.put(obj.id)
+            video_processing_scheduler.submit("THUMBNAILS", obj.id)
         return f"{settings.BASE_URL}{obj.affichage.url}" if obj.affichage else None
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-
-    def get_dislikes_count(self, obj):
-        return obj.dislikes.count()
-
-    def get_vues_count(self, obj):
-        return obj.vues.count()
-    
     def to_representation(self, instance):
         if not hasattr(instance, 'info'):
             video_path = os.path.join(settings.MEDIA_ROOT, instance.fichier.name)
@@ -229,11 +229,9 @@ class SuggestedVideoSerializer(serializers.ModelSerializer):
             representation['is_liked_by_me'] = user.id in [u.id for u in instance.likes.all()]
             representation['is_disliked_by_me'] = user.id in [u.id for u in instance.dislikes.all()]
             representation['is_view_by_me'] = user.id in [u.id for u in instance.vues.all()]
-            try:
-                watch = VideoWatch.objects.get(video=instance, user=user)
+            watch = watch_progress_buffer.get(user.id, instance.id)
+            if watch is not None:
                 representation["my_watch_video"] = VideoWatchSerializer(watch).data
-            except VideoWatch.DoesNotExist:
-                pass
         if instance.info:
             info = instance.info
             representation["taille"] = format_file_size(info.size)
@@ -255,9 +253,9 @@ class VideoSerializer(serializers.ModelSerializer):
     tag_ids = serializers.ListField(
         child=serializers.IntegerField(), write_only=True, required=False
     )
-    likes_count = serializers.SerializerMethodField()
-    dislikes_count = serializers.SerializerMethodField()
-    vues_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(read_only=True)
+    dislikes_count = serializers.IntegerField(read_only=True)
+    vues_count = serializers.IntegerField(read_only=True)
     fichier_url = serializers.SerializerMethodField()
     affichage_url = serializers.SerializerMethodField()
     suggested_videos = serializers.SerializerMethodField()
@@ -270,25 +268,19 @@ class VideoSerializer(serializers.ModelSerializer):
             'autoriser_commentaire', 'ordre_de_commentaire', 'likes_count', 'dislikes_count',
             'vues_count', 'uploaded_at', 'updated_at', 'suggested_videos', 'code_id'
         ]
+        list_serializer_class = VideoListSerializer
         
     def get_fichier_url(self, obj):
         return f"{settings.BASE_URL}{obj.fichier.url}" if obj.fichier else None
     
     def get_affichage_url(self, obj):
         if not obj.affichage:
-            video_affichage_queue.put(obj.id)
+            video_processing_scheduler.submit("THUMBNAILS", obj.id)
         return f"{settings.BASE_URL}{obj.affichage.url}" if obj.affichage else None
 
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-
-    def get_dislikes_count(self, obj):
-        return obj.dislikes.count()
-
-    def get_vues_count(self, obj):
-        return obj.vues.count()
-
     def get_suggested_videos(self, obj):
+        if not self.context.get("with_suggestion", True):
+            return []
         suggested = []
         
         # Suggest videos from the same playlist
@@ -299,13 +291,7 @@ class VideoSerializer(serializers.ModelSerializer):
             ).order_by('ordre')[:3]
             suggested.extend([vp.video for vp in next_videos])
 
-        all_videos = Video.objects.exclude(id=obj.id)
-        similarity_scores = [
-            (video, calcule_de_similarite_de_phrase(obj.titre + " " + obj.description, video.titre + " " + video.description))
-            for video in all_videos
-        ]
-        similarity_scores.sort(key=lambda x: x[1], reverse=True)
-        suggested.extend([video for video, score in similarity_scores[:3]])
+        suggested.extend([video for video, score in suggestion_index.similar(obj, 3)])
 
         tag_related = Video.objects.filter(tags__in=obj.tags.all()).exclude(id=obj.id).distinct()[:3]
         suggested.extend(tag_related)
@@ -364,22 +350,27 @@ class VideoSerializer(serializers.ModelSerializer):
         with_suggestion = self.context.get("with_suggestion", True)
         if request is not None and not isinstance(request.user, AnonymousUser):
             user = request.user
-            representation['is_liked_by_me'] = user.id in [u.id for u in instance.likes.all()]
-            representation['is_disliked_by_me'] = user.id in [u.id for u in instance.dislikes.all()]
-            representation['is_view_by_me'] = user.id in [u.id for u in instance.vues.all()]
-            try:
-                watch = VideoWatch.objects.get(video=instance, user=user)
+            if hasattr(instance, 'annotated_is_liked_by_me'):
+                representation['is_liked_by_me'] = instance.annotated_is_liked_by_me
+                representation['is_disliked_by_me'] = instance.annotated_is_disliked_by_me
+                representation['is_view_by_me'] = instance.annotated_is_view_by_me
+            else:
+                representation['is_liked_by_me'] = instance.likes.filter(id=user.id).exists()
+                representation['is_disliked_by_me'] = instance.dislikes.filter(id=user.id).exists()
+                representation['is_view_by_me'] = instance.vues.filter(id=user.id).exists()
+            if hasattr(instance, 'my_watches'):
+                watch = watch_progress_buffer.apply(user.id, instance.id, instance.my_watches[0] if instance.my_watches else None)
+            else:
+                watch = watch_progress_buffer.get(user.id, instance.id)
+            if watch is not None:
                 representation["my_watch_video"] = VideoWatchSerializer(watch).data
-            except VideoWatch.DoesNotExist:
-                pass
         
+        representation["commentaires_count"] = instance.commentaires_count
         if instance.autoriser_commentaire:
-            commentaires = instance.commentaires.all()
-            if instance.ordre_de_commentaire == 'TOP':
-                commentaires = commentaires.annotate(message_count=Count('messages')).order_by('-message_count')
-            else:
-                commentaires = commentaires.order_by('-created_at')
+            # Première page seulement ; la suite via /videos/<id>/comments/?cursor=commentaires_next
+            commentaires, next_cursor = get_comment_page(instance)
             representation["commentaires"] = CommentaireSerializer(commentaires, many=True).data
+            representation["commentaires_next"] = next_cursor
         if instance.info:
             info = instance.info
             representation["taille"] = format_file_size(info.size)
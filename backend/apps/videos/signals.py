@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from apps.videos.models import Video, Tag, VideoVue, VideoLike, Commentaire
+from apps.videos.suggestions import suggestion_index
+from apps.videos.search import video_search_index
+from apps.videos.playback import playback_cache
+from apps.videos.trending import trending_index
+from apps.videos.blobs import hand_over_renditions, release_blob
+
+@receiver(post_save, sender=Video)
+def update_video_similarity_vector(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Le vecteur ne dépend que du titre et de la description
+    if raw or (update_fields is not None and not {'titre', 'description'} & set(update_fields)):
+        return
+    suggestion_index.index_video(instance)
+
+@receiver(post_delete, sender=Video)
+def remove_video_similarity_vector(sender, instance, **kwargs):
+    suggestion_index.remove(instance.id)
+
+@receiver(post_save, sender=Video)
+def update_video_search_document(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not {'titre', 'description', 'categorie'} & set(update_fields)):
+        return
+    video_search_index.index_video(instance)
+
+@receiver(post_delete, sender=Video)
+def remove_video_search_document(sender, instance, **kwargs):
+    video_search_index.remove_video(instance.id)
+
+@receiver(m2m_changed, sender=Video.tags.through)
+def update_video_search_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # Après un clear depuis un Tag, on ne saurait plus quelles vidéos réindexer
+        instance._search_cleared_video_ids = list(instance.videos.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        video_search_index.index_video(instance)
+        return
+    video_ids = pk_set if action != 'post_clear' else getattr(instance, '_search_cleared_video_ids', [])
+    for video in Video.objects.filter(id__in=video_ids):
+        video_search_index.index_video(video)
+
+@receiver(post_save, sender=Tag)
+def update_tag_videos_search_documents(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    for video in instance.videos.all():
+        video_search_index.index_video(video)
+
+@receiver(post_delete, sender=Video)
+def remove_video_playback_descriptor(sender, instance, **kwargs):
+    playback_cache.invalidate(instance.id)
+
+@receiver(pre_delete, sender=Video)
+def hand_over_video_renditions(sender, instance, **kwargs):
+    if instance.blob_id is not None:
+        hand_over_renditions(instance)
+
+@receiver(post_delete, sender=Video)
+def release_video_blob(sender, instance, **kwargs):
+    # Quelle que soit la suppression (vue, cascade depuis l'utilisateur, admin) : une référence de moins
+    if instance.blob_id is not None:
+        blob_id = instance.blob_id
+        transaction.on_commit(lambda: release_blob(blob_id))
+
+@receiver(post_save, sender=VideoVue)
+@receiver(post_save, sender=VideoLike)
+@receiver(post_save, sender=Commentaire)
+def update_video_trending_score(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    kind = {VideoVue: 'vue', VideoLike: 'like', Commentaire: 'commentaire'}[sender]
+    trending_index.record(kind, instance.video_id, instance.created_at)
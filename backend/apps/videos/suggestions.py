@@ -0,0 +1,175 @@
+from django.conf import settings
+from datetime import timedelta
+from threading import Lock
+import numpy as np
+import time
+import zlib
+import re
+
+NGRAM_SIZES = (2, 3)
+
+def clean_text(text):
+    # Même nettoyage que calcule_de_similarite_de_phrase
+    return re.sub(r'[^\w\s]', '', (text or "").lower()).strip()
+
+def get_video_text(video):
+    return f"{video.titre} {video.description}"
+
+def get_word_ngrams(word, dimensions):
+    padded = f" {word} "
+    return {
+        zlib.crc32(padded[i:i + size].encode()) % dimensions
+        for size in NGRAM_SIZES for i in range(len(padded) - size + 1)
+    }
+
+def vectorize_document(text, dimensions=None):
+    # Présence des n-grammes de caractères hachés de tous les mots du texte
+    dimensions = dimensions or settings.SUGGESTION_INDEX_DIMENSIONS
+    vector = np.zeros(dimensions, dtype=np.uint8)
+    for word in clean_text(text).split():
+        vector[list(get_word_ngrams(word, dimensions))] = 1
+    return vector
+
+def vectorize_query(text, dimensions=None):
+    # Chaque mot pèse 1 / nombre de mots, réparti sur ses n-grammes : le produit scalaire avec
+    # un document est la moyenne, par mot, de la part de ses n-grammes présents dans le document,
+    # ce qui approche la moyenne des meilleurs SequenceMatcher de calcule_de_similarite_de_phrase.
+    dimensions = dimensions or settings.SUGGESTION_INDEX_DIMENSIONS
+    vector = np.zeros(dimensions, dtype=np.float32)
+    words = clean_text(text).split()
+    for word in words:
+        ngrams = list(get_word_ngrams(word, dimensions))
+        vector[ngrams] += 1 / (len(ngrams) * len(words))
+    return vector
+
+class SuggestionIndex:
+    def __init__(self, dimensions=None):
+        self.dimensions = dimensions or settings.SUGGESTION_INDEX_DIMENSIONS
+        self.lock = Lock()
+        # Une ligne par n-gramme, une colonne par vidéo : une requête ne lit que les lignes
+        # de ses propres n-grammes, comme un index inversé.
+        self.matrix = np.zeros((self.dimensions, 0), dtype=np.uint8)
+        self.video_ids = np.zeros(0, dtype=np.int64)
+        self.positions = {}
+        self.size = 0
+        self.loaded = False
+        self.synced_at = None
+        self.checked_at = 0.0
+
+    def encode(self, vector):
+        return np.packbits(vector).tobytes()
+
+    def decode(self, data):
+        if len(data) * 8 != self.dimensions:
+            return None
+        return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+
+    def upsert(self, video_id, vector):
+        with self.lock:
+            column = self.positions.get(video_id)
+            if column is None:
+                column = self.size
+                if column >= self.matrix.shape[1]:
+                    # Capacité doublée pour garder des ajouts en O(1) amorti
+                    capacity = max(64, 2 * self.matrix.shape[1])
+                    matrix = np.zeros((self.dimensions, capacity), dtype=np.uint8)
+                    matrix[:, :column] = self.matrix[:, :column]
+                    video_ids = np.zeros(capacity, dtype=np.int64)
+                    video_ids[:column] = self.video_ids[:column]
+                    self.matrix, self.video_ids = matrix, video_ids
+                self.video_ids[column] = video_id
+                self.positions[video_id] = column
+                self.size += 1
+            self.matrix[:, column] = vector
+
+    def remove(self, video_id):
+        with self.lock:
+            column = self.positions.pop(video_id, None)
+            if column is None:
+                return
+            # La dernière colonne prend la place de la colonne supprimée
+            self.size -= 1
+            last = self.size
+            if column != last:
+                last_id = int(self.video_ids[last])
+                self.matrix[:, column] = self.matrix[:, last]
+                self.video_ids[column] = last_id
+                self.positions[last_id] = column
+            self.matrix[:, last] = 0
+
+    def index_video(self, video):
+        from apps.videos.models import VideoSimilarityVector
+        vector = vectorize_document(get_video_text(video), self.dimensions)
+        VideoSimilarityVector.objects.update_or_create(video_id=video.id, defaults={'vector': self.encode(vector)})
+        if self.loaded:
+            self.upsert(video.id, vector)
+        return vector
+
+    def load(self):
+        from apps.videos.models import Video, VideoSimilarityVector
+        stale = []
+        for video_id, data, updated_at in VideoSimilarityVector.objects.values_list('video_id', 'vector', 'updated_at').iterator():
+            vector = self.decode(data)
+            if vector is None:
+                stale.append(video_id)
+                continue
+            self.upsert(video_id, vector)
+            self.synced_at = max(self.synced_at or updated_at, updated_at)
+        self.loaded = True
+        # Vidéos sans vecteur (ou calculé avec une autre dimension) : on les indexe maintenant
+        missing = Video.objects.filter(similarity_vector__isnull=True) | Video.objects.filter(id__in=stale)
+        indexed = 0
+        for video in missing.only('id', 'titre', 'description').iterator():
+            self.index_video(video)
+            indexed += 1
+        if indexed:
+            print(f"[❕] Index de suggestions : {indexed} vidéo(s) vectorisée(s), {self.size} au total")
+
+    def sync(self):
+        from apps.videos.models import VideoSimilarityVector
+        rows = VideoSimilarityVector.objects.all()
+        if self.synced_at is not None:
+            # Petite marge pour ne pas manquer les écritures d'autres noeuds validées en retard
+            rows = rows.filter(updated_at__gte=self.synced_at - timedelta(seconds=settings.SUGGESTION_INDEX_SYNC_SECONDS))
+        for video_id, data, updated_at in rows.values_list('video_id', 'vector', 'updated_at'):
+            vector = self.decode(data)
+            if vector is not None:
+                self.upsert(video_id, vector)
+            self.synced_at = max(self.synced_at or updated_at, updated_at)
+
+    def ensure_ready(self):
+        now = time.monotonic()
+        if not self.loaded:
+            self.load()
+            self.checked_at = now
+        elif now - self.checked_at >= settings.SUGGESTION_INDEX_SYNC_SECONDS:
+            self.checked_at = now
+            self.sync()
+
+    def similar(self, video, k=3):
+        from apps.videos.models import Video
+        self.ensure_ready()
+        query = vectorize_query(get_video_text(video), self.dimensions)
+        columns = np.flatnonzero(query)
+        with self.lock:
+            scores = query[columns] @ self.matrix[columns, :self.size].astype(np.float32)
+            ids = self.video_ids[:self.size].copy()
+        keep = ids != video.id
+        scores, ids = scores[keep], ids[keep]
+        if not len(ids):
+            return []
+        # Quelques candidats en plus au cas où des vidéos auraient été supprimées sur un autre noeud
+        n = min(len(ids), k + 5)
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.lexsort((ids[top], -scores[top]))]
+        videos = Video.objects.in_bulk([int(ids[i]) for i in top])
+        results = []
+        for i in top:
+            video_id = int(ids[i])
+            if video_id not in videos:
+                self.remove(video_id)
+                continue
+            results.append((videos[video_id], float(scores[i])))
+        return results[:k]
+
+suggestion_index = SuggestionIndex()
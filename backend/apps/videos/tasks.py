@@ -1,215 +1,368 @@
 from apps.videos.models import Video, VideoInfo
-from helpers.helper import get_available_info, convert_video_quality, extract_random_frame
+from apps.videos.playback import build_descriptor, write_descriptor
+from apps.videos.dash import write_dash_manifest
+from apps.videos.analysis import analyze_ladder
+from apps.videos.blobs import claim_blob_conversion, complete_blob_conversion, fail_blob_conversion
+from helpers.helper import get_available_info, extract_random_frame
+from helpers.probe import probe_media
 import os
 import subprocess
 import shutil
-import ffmpeg
+import re
 from pathlib import Path
 from django.conf import settings
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
-def generate_video_segments(video_id, quality=None):
-    try:
-        video = Video.objects.get(id=video_id)
-        video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))
-        original_filename = os.path.basename(video.fichier.path)
-        if quality == "original":
-            video_path = os.path.join(video_dir, original_filename)
+QUALITY_HEIGHTS = {
+    "2160p": 2160,
+    "1440p": 1440,
+    "1080p": 1080,
+    "720p": 720,
+    "480p": 480,
+    "360p": 360,
+    "240p": 240,
+    "144p": 144
+}
+
+BANDWIDTHS = {
+    "original": "8000000",
+    "2160p": "16000000",
+    "1440p": "8000000",
+    "1080p": "5000000",
+    "720p": "2800000",
+    "480p": "1400000",
+    "360p": "800000",
+    "240p": "400000",
+    "144p": "200000"
+}
+
+RESOLUTIONS = {
+    "original": "1920x1080",
+    "2160p": "3840x2160",
+    "1440p": "2560x1440",
+    "1080p": "1920x1080",
+    "720p": "1280x720",
+    "480p": "842x480",
+    "360p": "640x360",
+    "240p": "426x240",
+    "144p": "256x144"
+}
+
+def get_quality_key(quality):
+    if not quality or quality == "original":
+        return "original"
+    return next((q for q in QUALITY_HEIGHTS if quality.startswith(q)), "original")
+
+# Codecs audio acceptés tels quels dans des segments HLS (MPEG-TS ou MP4 fragmenté) : copiés sans réencodage
+HLS_AUDIO_COPY_CODECS = {"aac", "mp3", "ac3", "eac3"}
+# Sous-titres texte convertibles en WebVTT (les sous-titres image, PGS/DVD, ne le sont pas)
+TEXT_SUBTITLE_CODECS = {"subrip", "srt", "ass", "ssa", "mov_text", "webvtt", "text"}
+# Les segments WebVTT annoncent le premier PTS des segments vidéo pour rester synchronisés avec eux : mesuré sur
+# le premier segment de la qualité "original" (copiée, il dépend de la source). À défaut, le décalage habituel
+# de ffmpeg en MPEG-TS, 1,4 s (126000 en horloge 90 kHz). Les fragments MP4 commencent à 0.
+HLS_MPEGTS_START = 126000
+
+def is_cmaf():
+    return settings.VIDEO_SEGMENT_FORMAT == "cmaf"
+
+def hls_output_args(segments_dir, name="video", playlist_type="vod"):
+    # <name>.m3u8 et ses segments : <name>_%03d.ts, ou en CMAF <name>_init.mp4 + <name>_%03d.m4s
+    # (ou un seul <name>.m4s adressé par EXT-X-BYTERANGE, que le MPD DASH réutilise tel quel)
+    args = [
+        "-f", "hls", "-hls_time", str(settings.HLS_SEGMENT_DURATION), "-hls_list_size", "0",
+        "-hls_playlist_type", playlist_type
+    ]
+    if is_cmaf():
+        args += ["-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", f"{name}_init.mp4"]
+        if settings.VIDEO_SEGMENT_SINGLE_FILE:
+            args += ["-hls_flags", "single_file", "-hls_segment_filename", os.path.join(segments_dir, f"{name}.m4s")]
         else:
-            video_path = os.path.join(video_dir, "qualities", quality, original_filename)
-        
-        segments_dir = os.path.join(video_dir, "segments", quality or "original")
-        os.makedirs(segments_dir, exist_ok=True)
+            args += ["-hls_segment_filename", os.path.join(segments_dir, f"{name}_%03d.m4s")]
+    else:
+        args += ["-hls_segment_filename", os.path.join(segments_dir, f"{name}_%03d.ts")]
+    return args + [os.path.join(segments_dir, f"{name}.m3u8")]
 
-        probe = ffmpeg.probe(video_path)
-        audio_streams = [s for s in probe['streams'] if s['codec_type'] == 'audio']
-        subtitle_streams = [s for s in probe['streams'] if s['codec_type'] == 'subtitle']
-
-        # Générer le manifeste vidéo
-        video_manifest = os.path.join(segments_dir, "video.m3u8")
-        cmd_video = [
-            "ffmpeg", "-i", video_path,
-            "-map", "0:v", "-c:v", "copy",
-            "-f", "hls", "-hls_time", "10", "-hls_list_size", "0",
-            "-hls_segment_filename", os.path.join(segments_dir, "video_%03d.ts"),
-            video_manifest
+def get_track_names(tracks):
+    # Nom de fichier par piste : la langue, suffixée de l'index si deux pistes ont la même
+    names = []
+    for track in tracks:
+        name = re.sub(r"[^A-Za-z0-9-]", "", track.language or "") or f"piste{track.index}"
+        names.append(f"{name}_{track.index}" if name in names else name)
+    return names
+
+def rendition_encoder_args(quality):
+    # Encodage d'une qualité mise à l'échelle ; images clés forcées à chaque segment pour que toutes les
+    # qualités (encodées à l'envoi ou plus tard à la demande) restent alignées
+    bitrate = int(BANDWIDTHS[get_quality_key(quality)])
+    gop = f"expr:gte(t,n_forced*{settings.HLS_SEGMENT_DURATION})"
+    return [
+        "-c:v", "libx264", "-preset", settings.VIDEO_ENCODER_PRESET, "-profile:v", "main",
+        "-pix_fmt", "yuv420p", "-force_key_frames", gop, "-sc_threshold", "0",
+        "-b:v", str(bitrate), "-maxrate", str(int(bitrate * 1.07)), "-bufsize", str(bitrate * 2)
+    ]
+
+def get_eager_qualities(qualities):
+    # Qualités mises à l'échelle dès l'envoi : toutes, ou en mode JIT la plus proche de VIDEO_JIT_EAGER_QUALITY
+    scaled = [q for q in qualities[1:] if get_quality_key(q) in QUALITY_HEIGHTS]
+    if not settings.VIDEO_JIT_RENDITIONS or not scaled:
+        return scaled
+    target = QUALITY_HEIGHTS.get(get_quality_key(settings.VIDEO_JIT_EAGER_QUALITY), 480)
+    return [min(scaled, key=lambda q: abs(QUALITY_HEIGHTS[get_quality_key(q)] - target))]
+
+def ladder_outputs(segments_base_dir, qualities, encoded=None):
+    # "original" est copié tel quel, les autres qualités sont mises à l'échelle dans un seul graphe de filtres.
+    # Toutes sont annoncées ; seules celles de "encoded" sont produites ici, les autres le seront à la demande.
+    renditions = [("original", os.path.join(segments_base_dir, "original"))]
+    for q in qualities[1:]:
+        if get_quality_key(q) in QUALITY_HEIGHTS:
+            renditions.append((q, os.path.join(segments_base_dir, q)))
+
+    args = []
+    scaled = [(q, segments_dir) for q, segments_dir in renditions[1:] if encoded is None or q in encoded]
+    if scaled:
+        split_labels = "".join(f"[s{idx}]" for idx in range(len(scaled)))
+        filters = [f"[0:v:0]split={len(scaled)}{split_labels}"]
+        for idx, (q, _) in enumerate(scaled):
+            filters.append(f"[s{idx}]scale=-2:{QUALITY_HEIGHTS[get_quality_key(q)]}[v{idx}]")
+        args += ["-filter_complex", ";".join(filters)]
+
+    args += ["-map", "0:v:0", "-c:v", "copy", "-an", "-sn"]
+    args += hls_output_args(renditions[0][1])
+
+    for idx, (q, segments_dir) in enumerate(scaled):
+        args += ["-map", f"[v{idx}]", "-an", "-sn", *rendition_encoder_args(q)]
+        args += hls_output_args(segments_dir)
+    return renditions, [segments_dir for _, segments_dir in [renditions[0], *scaled]], args
+
+def track_outputs(media, segments_dir):
+    # Audio et sous-titres uniquement pour "original" car identiques pour toutes les qualités
+    args = []
+    audio_manifests = []
+    for track, name in zip(media.audio_tracks, get_track_names(media.audio_tracks)):
+        codec = ["-c:a", "copy"] if track.codec in HLS_AUDIO_COPY_CODECS else ["-c:a", "aac"]
+        args += ["-map", f"0:a:{track.index}", "-vn", "-sn", *codec]
+        args += hls_output_args(segments_dir, f"audio_{name}")
+        audio_manifests.append((name, os.path.join(segments_dir, f"audio_{name}.m3u8")))
+
+    subtitle_manifests = []
+    text_tracks = [track for track in media.subtitle_tracks if track.codec in TEXT_SUBTITLE_CODECS]
+    for track in media.subtitle_tracks:
+        if track not in text_tracks:
+            print(f"[❕] Sous-titre {track.index} ({track.codec}) ignoré : format image, non convertible en WebVTT")
+    for track, name in zip(text_tracks, get_track_names(text_tracks)):
+        # WebVTT découpé comme la vidéo : le lecteur ne charge que les segments autour de la position
+        manifest = os.path.join(segments_dir, f"subs_{name}.m3u8")
+        args += [
+            "-map", f"0:s:{track.index}", "-vn", "-an", "-c:s", "webvtt",
+            "-f", "segment", "-segment_time", str(settings.HLS_SEGMENT_DURATION),
+            "-segment_format", "webvtt", "-segment_list_type", "m3u8", "-segment_list_size", "0",
+            "-segment_list", manifest,
+            os.path.join(segments_dir, f"subs_{name}_%03d.vtt")
         ]
-        subprocess.run(cmd_video, check=True)
-
-        # Générer les manifestes audio (uniquement pour la qualité "original")
-        audio_manifests = []
-        if quality == "original":  # Audio uniquement pour "original" car identique pour toutes les qualités
-            for idx, stream in enumerate(audio_streams):
-                lang = stream.get('tags', {}).get('language', f"lang{idx}")
-                audio_manifest = os.path.join(segments_dir, f"audio_{lang}.m3u8")
-                cmd_audio = [
-                    "ffmpeg", "-i", video_path,
-                    "-map", f"0:a:{idx}", "-c:a", "aac",
-                    "-f", "hls", "-hls_time", "10", "-hls_list_size", "0",
-                    "-hls_segment_filename", os.path.join(segments_dir, f"audio_{lang}_%03d.ts"),
-                    audio_manifest
-                ]
-                subprocess.run(cmd_audio, check=True)
-                audio_manifests.append((lang, audio_manifest))
-
-        # Générer les manifestes de sous-titres (uniquement pour "original")
-        subtitle_manifests = []
-        if quality == "original":
-            for idx, stream in enumerate(subtitle_streams):
-                lang = stream.get('tags', {}).get('language', f"sub{idx}")
-                subtitle_vtt = os.path.join(segments_dir, f"subs_{lang}.vtt")
-                cmd_subtitle = [
-                    "ffmpeg", "-i", video_path,
-                    "-map", f"0:s:{idx}", "-c:s", "webvtt",
-                    subtitle_vtt
-                ]
-                subprocess.run(cmd_subtitle, check=True)
-                subtitle_manifest = os.path.join(segments_dir, f"subs_{lang}.m3u8")
-                duration = probe['format']['duration']
-                with open(subtitle_manifest, 'w') as f:
-                    f.write("#EXTM3U\n#EXT-X-TARGETDURATION:10\n#EXT-X-VERSION:3\n")
-                    f.write("#EXT-X-MEDIA-SEQUENCE:0\n#EXT-X-PLAYLIST-TYPE:VOD\n")
-                    f.write(f"#EXTINF:{duration},\n{os.path.basename(subtitle_vtt)}\n")
-                    f.write("#EXT-X-ENDLIST\n")
-                subtitle_manifests.append((lang, subtitle_manifest))
-
-        # Retourner les informations nécessaires pour le manifeste maître
-        bandwidth = {
-            "original": "8000000",
-            "2160p": "16000000",
-            "1440p": "8000000",
-            "1080p": "5000000",
-            "720p": "2800000",
-            "480p": "1400000",
-            "360p": "800000",
-            "240p": "400000",
-            "144p": "200000"
-        }.get(quality or "original", "5000000")
-        resolution = {
-            "original": "1920x1080",
-            "2160p": "3840x2160",
-            "1440p": "2560x1440",
-            "1080p": "1920x1080",
-            "720p": "1280x720",
-            "480p": "842x480",
-            "360p": "640x360",
-            "240p": "426x240",
-            "144p": "256x144"
-        }.get(quality or "original", "1920x1080")
-
-        return video_manifest, segments_dir, bandwidth, resolution, audio_manifests, subtitle_manifests
-    except Exception as e:
-        print(f"Erreur lors de la génération des segments : {e}")
-        return None, None, None, None, [], []
+        subtitle_manifests.append((name, manifest))
+    return audio_manifests, subtitle_manifests, args
+
+def add_vtt_timestamp_map(subtitle_manifest, mpegts_start=HLS_MPEGTS_START):
+    # Chaque segment WebVTT doit porter X-TIMESTAMP-MAP pour être aligné sur l'horloge des segments vidéo
+    segments_dir = os.path.dirname(subtitle_manifest)
+    with open(subtitle_manifest) as f:
+        segments = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    for segment in segments:
+        path = os.path.join(segments_dir, segment)
+        with open(path) as f:
+            content = f.read()
+        if "X-TIMESTAMP-MAP" in content:
+            continue
+        header, _, body = content.partition("\n")
+        with open(path, 'w') as f:
+            f.write(f"{header}\nX-TIMESTAMP-MAP=MPEGTS:{mpegts_start},LOCAL:00:00:00.000\n{body}")
+
+def package_video(video_path, video_dir, qualities):
+    # Une seule lecture de la source : vidéo (copie + échelle), chaque piste audio (copie si possible)
+    # et chaque sous-titre texte (WebVTT segmenté) sont tous des sorties du même processus ffmpeg.
+    media = probe_media(video_path)
+    segments_base_dir = os.path.join(video_dir, "segments")
+    renditions, encoded_dirs, ladder_args = ladder_outputs(segments_base_dir, qualities, get_eager_qualities(qualities))
+    for segments_dir in encoded_dirs:
+        os.makedirs(segments_dir, exist_ok=True)
+    audio_manifests, subtitle_manifests, track_args = track_outputs(media, renditions[0][1])
+
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", video_path, *ladder_args, *track_args]
+    subprocess.run(cmd, check=True)
+
+    # Valeurs attendues (scale=-2:h garde le ratio de la source), remplacées ensuite par celles mesurées
+    variant_manifests = []
+    for q, segments_dir in renditions:
+        key = get_quality_key(q)
+        if q == "original" and media.width and media.height:
+            bandwidth, resolution = str(media.bit_rate or BANDWIDTHS[key]), f"{media.width}x{media.height}"
+        elif key in QUALITY_HEIGHTS and media.width and media.height:
+            height = QUALITY_HEIGHTS[key]
+            bandwidth, resolution = BANDWIDTHS[key], f"{round(media.width * height / media.height / 2) * 2}x{height}"
+        else:
+            bandwidth, resolution = BANDWIDTHS[key], RESOLUTIONS[key]
+        variant_manifests.append((q, os.path.join(segments_dir, "video.m3u8"), bandwidth, resolution))
+    variant_manifests, ladder_stats = analyze_ladder(variant_manifests, audio_manifests, media.fps)
+    mpegts_start = 0 if is_cmaf() else (ladder_stats[variant_manifests[0][0]]["start_pts"] or HLS_MPEGTS_START)
+    for _, subtitle_manifest in subtitle_manifests:
+        add_vtt_timestamp_map(subtitle_manifest, mpegts_start)
+    return variant_manifests, audio_manifests, subtitle_manifests, ladder_stats
+
+def format_stream_inf(q, bandwidth, resolution, stats=None):
+    # BANDWIDTH/AVERAGE-BANDWIDTH mesurés (vidéo + piste audio la plus lourde), CODECS et FRAME-RATE lus dans les segments
+    stats = stats or {}
+    attrs = [f"BANDWIDTH={stats.get('bandwidth') or bandwidth}"]
+    if stats.get("average_bandwidth"):
+        attrs.append(f"AVERAGE-BANDWIDTH={stats['average_bandwidth']}")
+    if stats.get("codecs"):
+        attrs.append(f'CODECS="{stats["codecs"]}"')
+    attrs.append(f"RESOLUTION={resolution}")
+    if stats.get("frame_rate"):
+        attrs.append(f"FRAME-RATE={stats['frame_rate']:.3f}")
+    return ",".join(attrs + ['AUDIO="audio"', 'SUBTITLES="subs"', f'NAME="{q}"'])
+
+def write_master_manifest(video_dir, variant_manifests, audio_manifests, subtitle_manifests, ladder_stats=None):
+    master_manifest_path = os.path.join(video_dir, "master.m3u8")
+    # Écriture atomique : le master peut être réécrit pendant la lecture (qualité générée à la demande)
+    tmp_path = f"{master_manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        # Segments fMP4 (EXT-X-MAP) et plages d'octets : version 7
+        f.write(f"#EXTM3U\n#EXT-X-VERSION:{7 if is_cmaf() else 3}\n")
+        for lang, audio_manifest in audio_manifests:
+            relative_audio_path = os.path.relpath(audio_manifest, video_dir)
+            f.write(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_audio_path}"\n')
+        for lang, subtitle_manifest in subtitle_manifests:
+            relative_subtitle_path = os.path.relpath(subtitle_manifest, video_dir)
+            f.write(f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_subtitle_path}"\n')
+        for q, manifest, bandwidth, resolution in variant_manifests:
+            relative_video_path = os.path.relpath(manifest, video_dir)
+            f.write(f"#EXT-X-STREAM-INF:{format_stream_inf(q, bandwidth, resolution, (ladder_stats or {}).get(q))}\n")
+            f.write(f"{relative_video_path}\n")
+    os.replace(tmp_path, master_manifest_path)
+    return master_manifest_path
+
+def generate_rendition(video_id, quality):
+    # Qualité produite à la première demande de sa playlist (mode JIT). Playlist EVENT écrite au fil de
+    # l'encodage : le lecteur qui attend démarre dès les premiers segments, sans attendre la fin.
+    from apps.videos.models import VideoRendition
+    from apps.videos.renditions import get_rendition_dir, refresh_dash_manifest, refresh_master_manifest
+    from apps.users.models import default_created_at
+    video = Video.objects.get(id=video_id)
+    key = get_quality_key(quality)
+    if key not in QUALITY_HEIGHTS:
+        raise ValueError(f"Qualité inconnue : {quality}")
+    segments_dir = get_rendition_dir(video_id, quality)
+    shutil.rmtree(segments_dir, ignore_errors=True)
+    os.makedirs(segments_dir)
+    # Ligne créée avant l'encodage (taille 0 = en cours) : l'éviction connaît le répertoire même si le
+    # processus est tué, et le reprend s'il n'y a plus de tâche active (cf. RenditionEvictor.reclaim_interrupted)
+    now = default_created_at()
+    VideoRendition.objects.update_or_create(
+        video_id=video_id, quality=quality,
+        defaults={'size_bytes': 0, 'generated_at': now, 'last_accessed_at': now}
+    )
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", video.fichier.path,
+        "-map", "0:v:0", "-an", "-sn", "-vf", f"scale=-2:{QUALITY_HEIGHTS[key]}", *rendition_encoder_args(quality),
+        *hls_output_args(segments_dir, playlist_type="event")
+    ]
+    try:
+        subprocess.run(cmd, check=True)
+    except Exception:
+        # Playlist EVENT tronquée (sans ENDLIST) : rien ne doit rester servi
+        shutil.rmtree(segments_dir, ignore_errors=True)
+        VideoRendition.objects.filter(video_id=video_id, quality=quality).delete()
+        raise
+    size = sum(entry.stat().st_size for entry in os.scandir(segments_dir) if entry.is_file())
+    VideoRendition.objects.filter(video_id=video_id, quality=quality).update(size_bytes=size, last_accessed_at=default_created_at())
+    refresh_master_manifest(video_id)
+    if is_cmaf():
+        refresh_dash_manifest(video_id)
+    print(f"✅ Qualité {quality} générée à la demande pour la vidéo {video_id} ({size} octets)")
+
+def generate_video_info(video_id):
+    video = Video.objects.get(id=video_id)
+    video_info = get_available_info(video.fichier.path)
+    VideoInfo.objects.get_or_create(
+        video=video,
+        defaults={
+            "qualities": video_info['qualities'],
+            "audio_languages": video_info.get('audio_tracks', []),
+            "subtitle_languages": video_info.get('subtitle_languages', []),
+            "fps": video_info['fps'],
+            "width": video_info['width'],
+            "height": video_info['height'],
+            "duration": video_info['duration'],
+            "size": video_info['size']
+        }
+    )
+    print("✅ Informations vidéo générées...")
+    return video_info
 
 def process_video_conversion(video_id):
     print("🎊 Process video conversion...")
+    video = None
     try:
         video = Video.objects.get(id=video_id)
         video_path = video.fichier.path
-        video_info = get_available_info(video_path)
+        # Contenu déjà vu : qualités, descripteur et VideoInfo partagés, aucune conversion
+        if video.blob_id is not None and not claim_blob_conversion(video):
+            return
+        video_info = generate_video_info(video_id)
         qualities = video_info['qualities']
 
-        VideoInfo.objects.get_or_create(
-            video=video,
-            defaults={
-                "qualities": video_info['qualities'],
-                "audio_languages": video_info.get('audio_tracks', []),
-                "subtitle_languages": video_info.get('subtitle_languages', []),
-                "fps": video_info['fps'],
-                "width": video_info['width'],
-                "height": video_info['height'],
-                "duration": video_info['duration'],
-                "size": video_info['size']
-            }
-        )
-        
-        video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))
+        # Contenu dédupliqué : tout est produit dans son répertoire (videos/blobs/<sha256>/), à côté du fichier source
+        video_dir = os.path.dirname(video_path) if video.blob_id is not None else os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))
         os.makedirs(video_dir, exist_ok=True)
         
         original_filename = os.path.basename(video_path)
         new_path = os.path.join(video_dir, original_filename)
-        shutil.copy2(video_path, new_path)
-        os.remove(video.fichier.path)
-        video.fichier.name = os.path.relpath(new_path, settings.MEDIA_ROOT)
-        video.save()
-        
-        qualities_base_dir = os.path.join(video_dir, "qualities")
-        segments_base_dir = os.path.join(video_dir, "segments")
-        os.makedirs(qualities_base_dir, exist_ok=True)
-        os.makedirs(segments_base_dir, exist_ok=True)
-        
-        variant_manifests = []
-        audio_manifests = []
-        subtitle_manifests = []
-
-        manifest, segments_dir, bandwidth, resolution, audio_m, subtitle_m = generate_video_segments(video_id, "original")
-        if manifest:
-            variant_manifests.append(("original", manifest, bandwidth, resolution))
-            audio_manifests = audio_m
-            subtitle_manifests = subtitle_m
-            master_manifest_path = os.path.join(video_dir, "master.m3u8")
-            with open(master_manifest_path, 'w') as f:
-                f.write("#EXTM3U\n#EXT-X-VERSION:3\n")
-                for lang, audio_manifest in audio_manifests:
-                    relative_audio_path = os.path.relpath(audio_manifest, video_dir)
-                    f.write(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_audio_path}"\n')
-                for lang, subtitle_manifest in subtitle_manifests:
-                    relative_subtitle_path = os.path.relpath(subtitle_manifest, video_dir)
-                    f.write(f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_subtitle_path}"\n')
-                for q, manifest, bandwidth, resolution in variant_manifests:
-                    relative_video_path = os.path.relpath(manifest, video_dir)
-                    f.write(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution},AUDIO="audio",SUBTITLES="subs",NAME="{q}"\n')
-                    f.write(f"{relative_video_path}\n")
-            video.master_manifest_file = os.path.relpath(master_manifest_path, settings.MEDIA_ROOT)
-            video.segments_dir = os.path.relpath(segments_dir, settings.MEDIA_ROOT)
-            video.save()
-        for q in qualities[1:]:
-            quality_dir = os.path.join(qualities_base_dir, q)
-            os.makedirs(quality_dir, exist_ok=True)
-            converted_path = convert_video_quality(new_path, q)
-            quality_file_path = os.path.join(quality_dir, original_filename)
-            os.rename(converted_path, quality_file_path)
-            
-            manifest, segments_dir, bandwidth, resolution, _, _ = generate_video_segments(video_id, q)
-            if manifest:
-                variant_manifests.append((q, manifest, bandwidth, resolution))
-                with open(master_manifest_path, 'w') as f:
-                    f.write("#EXTM3U\n#EXT-X-VERSION:3\n")
-                    for lang, audio_manifest in audio_manifests:
-                        relative_audio_path = os.path.relpath(audio_manifest, video_dir)
-                        f.write(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_audio_path}"\n')
-                    for lang, subtitle_manifest in subtitle_manifests:
-                        relative_subtitle_path = os.path.relpath(subtitle_manifest, video_dir)
-                        f.write(f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_subtitle_path}"\n')
-                    for q, manifest, bandwidth, resolution in variant_manifests:
-                        relative_video_path = os.path.relpath(manifest, video_dir)
-                        f.write(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution},AUDIO="audio",SUBTITLES="subs",NAME="{q}"\n')
-                        f.write(f"{relative_video_path}\n")
-                video.master_manifest_file = os.path.relpath(master_manifest_path, settings.MEDIA_ROOT)
-                video.segments_dir = os.path.relpath(segments_dir, settings.MEDIA_ROOT)
-                video.save()
-        
+        if os.path.abspath(video_path) != os.path.abspath(new_path):
+            shutil.copy2(video_path, new_path)
+            os.remove(video_path)
+            video.fichier.name = os.path.relpath(new_path, settings.MEDIA_ROOT)
+            video.save(update_fields=["fichier"])
+
+        variant_manifests, audio_manifests, subtitle_manifests, ladder_stats = package_video(new_path, video_dir, qualities)
+        original_segments_dir = os.path.dirname(variant_manifests[0][1])
+        master_manifest_path = write_master_manifest(video_dir, variant_manifests, audio_manifests, subtitle_manifests, ladder_stats)
+        # En CMAF, le MPD DASH pointe vers les mêmes fragments que les playlists HLS : aucun second empaquetage
+        dash_manifest_path = write_dash_manifest(video_dir, variant_manifests, audio_manifests) if is_cmaf() else None
+
+        # Descripteur de lecture à côté de master.m3u8 : servi tel quel (via cache) à la connexion du lecteur
+        write_descriptor(video.id, build_descriptor(
+            video.id, master_manifest_path, variant_manifests, audio_manifests, subtitle_manifests, video_info,
+            dash_manifest_path, ladder_stats
+        ))
+
         video.master_manifest_file = os.path.relpath(master_manifest_path, settings.MEDIA_ROOT)
-        video.segments_dir = os.path.relpath(segments_dir, settings.MEDIA_ROOT)
-        video.save()
+        video.segments_dir = os.path.relpath(original_segments_dir, settings.MEDIA_ROOT)
+        video.save(update_fields=["master_manifest_file", "segments_dir"])
+        if video.blob_id is not None:
+            complete_blob_conversion(video)
         print("✅ Conversion et segmentation terminée.")
     except Exception as e:
         print(f"Erreur : {e}")
+        if video is not None and video.blob_id is not None:
+            fail_blob_conversion(video)
+        raise
 
 def generate_video_affichage(video_id):
     try:
         video = Video.objects.get(id=video_id)
         video_path = video.fichier.path
-        output_dir = os.path.join(os.path.dirname(video_path), "affichages")
+        # Fichier source partagé (contenu dédupliqué) : l'image d'affichage reste propre à la vidéo
+        video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id)) if video.blob_id is not None else os.path.dirname(video_path)
+        output_dir = os.path.join(video_dir, "affichages")
         os.makedirs(output_dir, exist_ok=True)
         affichage_path = extract_random_frame(video_path, output_dir)
         if affichage_path:
             video.affichage = os.path.relpath(affichage_path, MEDIA_ROOT)
-            video.save()
+            video.save(update_fields=["affichage"])
             print("✅ Image d'affichage générée...")
         print("[!] Génération d'affichage finie...")
     except Exception as e:
-        print(f"Erreur lors de la génération de l'image d'affichage : {e}")
\ No newline at end of file
+        print(f"Erreur lors de la génération de l'image d'affichage : {e}")
+        raise
\ No newline at end of file
@@ -1,3 +1,273 @@
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase, RequestFactory
+from django.http import Http404
+from django.utils.http import http_date
+import datetime
+import tempfile
+import hashlib
+import shutil
+import os
 
-# Create your tests here.
+from apps.users.models import User
+from apps.videos.models import Video
+from apps.videos.pagination import KeysetPaginator, InvalidCursor, encode_cursor, decode_cursor, paginate_search
+from apps.videos.search import parse_query, tokenize
+from apps.videos.uploads import UploadContentHashes
+from helpers.media import file_response, parse_ranges, get_etag
+
+def create_user(email="auteur@example.com"):
+    return User.objects.create(email=email, name="Auteur", sexe="M", birth_date=datetime.date(2000, 1, 1), is_active=True)
+
+def create_video(user, titre, **kwargs):
+    return Video.objects.create(titre=titre, description=kwargs.pop('description', ""), envoyeur=user, fichier="videos/test.mp4", **kwargs)
+
+def read_content(response):
+    if response.streaming:
+        return b"".join(response.streaming_content)
+    return response.content
+
+class ParseRangesTests(SimpleTestCase):
+    def test_closed_range(self):
+        self.assertEqual(parse_ranges("bytes=0-9", 100), [(0, 9)])
+
+    def test_open_range(self):
+        self.assertEqual(parse_ranges("bytes=90-", 100), [(90, 99)])
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_ranges("bytes=-10", 100), [(90, 99)])
+        self.assertEqual(parse_ranges("bytes=-500", 100), [(0, 99)])
+
+    def test_end_past_size_is_clamped(self):
+        self.assertEqual(parse_ranges("bytes=50-500", 100), [(50, 99)])
+
+    def test_multiple_ranges(self):
+        self.assertEqual(parse_ranges("bytes=0-1, 5-6,-2", 100), [(0, 1), (5, 6), (98, 99)])
+
+    def test_unsatisfiable_ranges_are_dropped(self):
+        self.assertEqual(parse_ranges("bytes=100-", 100), [])
+        self.assertEqual(parse_ranges("bytes=5-2", 100), [])
+
+    def test_invalid_header(self):
+        self.assertIsNone(parse_ranges("items=0-9", 100))
+        self.assertIsNone(parse_ranges("bytes=-", 100))
+
+class FileResponseTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "segment.ts")
+        self.data = bytes(range(256)) * 4
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get(self, **headers):
+        return file_response(self.factory.get("/media/segment.ts", **headers), self.path)
+
+    def test_full_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp2t')
+        self.assertEqual(read_content(response), self.data)
+
+    def test_suffix_range(self):
+        response = self.get(HTTP_RANGE="bytes=-10")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes {len(self.data) - 10}-{len(self.data) - 1}/{len(self.data)}")
+        self.assertEqual(read_content(response), self.data[-10:])
+
+    def test_open_range(self):
+        response = self.get(HTTP_RANGE="bytes=1000-")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Length'], "24")
+        self.assertEqual(read_content(response), self.data[1000:])
+
+    def test_multiple_ranges(self):
+        response = self.get(HTTP_RANGE="bytes=0-3,10-12")
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith("multipart/byteranges; boundary="))
+        content = read_content(response)
+        self.assertIn(f"Content-Range: bytes 0-3/{len(self.data)}".encode(), content)
+        self.assertIn(f"Content-Range: bytes 10-12/{len(self.data)}".encode(), content)
+        self.assertIn(b"\r\n\r\n" + self.data[0:4] + b"\r\n", content)
+        self.assertIn(b"\r\n\r\n" + self.data[10:13] + b"\r\n", content)
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE=f"bytes={len(self.data)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f"bytes */{len(self.data)}")
+
+    def test_if_range_matching_etag(self):
+        etag = get_etag(os.stat(self.path))
+        response = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(read_content(response), self.data[:10])
+
+    def test_if_range_stale_etag(self):
+        response = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"ancien"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(read_content(response), self.data)
+
+    def test_if_range_date(self):
+        modified = int(os.stat(self.path).st_mtime)
+        self.assertEqual(self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=http_date(modified)).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=http_date(modified - 60)).status_code, 200)
+
+    def test_not_modified(self):
+        response = self.get(HTTP_IF_NONE_MATCH=get_etag(os.stat(self.path)))
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_file(self):
+        with self.assertRaises(Http404):
+            file_response(self.factory.get("/media/absent.ts"), os.path.join(self.directory, "absent.ts"))
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        moment = datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+        cursor = encode_cursor([moment, 42], 'previous')
+        self.assertEqual(decode_cursor(cursor, 2), ([moment.isoformat(), 42], 'previous'))
+
+    def test_tampered_cursor(self):
+        cursor = encode_cursor([1], 'next')
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(cursor[:-2] + "xx", 1)
+
+    def test_wrong_size(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(encode_cursor([1, 2], 'next'), 1)
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        user = create_user()
+        same_time = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        # Dates identiques deux à deux : l'id départage
+        self.videos = [
+            create_video(user, f"Vidéo {i}", uploaded_at=same_time + datetime.timedelta(days=i // 2))
+            for i in range(7)
+        ]
+        self.expected = [video.id for video in sorted(self.videos, key=lambda video: (video.uploaded_at, video.id), reverse=True)]
+        self.paginator = KeysetPaginator(['-uploaded_at', '-id'], page_size=3)
+
+    def walk_forward(self):
+        pages, cursor = [], None
+        while True:
+            rows, next_cursor, previous_cursor = self.paginator.paginate(Video.objects.all(), cursor)
+            pages.append(([row.id for row in rows], previous_cursor))
+            if next_cursor is None:
+                return pages
+            cursor = next_cursor
+
+    def test_forward_covers_every_row_once_in_order(self):
+        pages = self.walk_forward()
+        self.assertEqual([len(ids) for ids, _ in pages], [3, 3, 1])
+        self.assertEqual([video_id for ids, _ in pages for video_id in ids], self.expected)
+        self.assertIsNone(pages[0][1])
+
+    def test_previous_cursor_returns_previous_page(self):
+        pages = self.walk_forward()
+        for index in range(1, len(pages)):
+            rows, next_cursor, previous_cursor = self.paginator.paginate(Video.objects.all(), pages[index][1])
+            self.assertEqual([row.id for row in rows], pages[index - 1][0])
+            self.assertIsNotNone(next_cursor)
+            self.assertEqual(previous_cursor is None, index == 1)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            self.paginator.paginate(Video.objects.all(), "pas-un-curseur")
+
+class ParseQueryTests(SimpleTestCase):
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(parse_query("recette gâteau cho"), (["recette", "gateau"], "cho"))
+
+    def test_trailing_space_ends_the_prefix(self):
+        self.assertEqual(parse_query("recette cho "), (["recette", "cho"], None))
+
+    def test_stop_words_and_elisions_are_ignored(self):
+        self.assertEqual(parse_query("le chat de l'école "), (["chat", "ecole"], None))
+
+    def test_plural_is_stemmed(self):
+        self.assertEqual(parse_query("chats gâteaux "), (["chat", "gateau"], None))
+        self.assertEqual(tokenize("Les chats"), ["chat"])
+
+    def test_prefix_already_in_terms(self):
+        self.assertEqual(parse_query("chat chat"), (["chat"], None))
+
+    def test_no_searchable_word(self):
+        self.assertEqual(parse_query("  !? "), ([], None))
+
+class SearchPaginationTests(TestCase):
+    def setUp(self):
+        user = create_user()
+        self.videos = [
+            create_video(user, "guitare " * (i % 3 + 1) + f"numéro {i}", categorie="musique" if i % 2 else "cours")
+            for i in range(9)
+        ]
+
+    def walk(self, videos, params):
+        results, cursor, pages = [], None, []
+        while True:
+            page = paginate_search(videos, "guitare ", dict(params, cursor=cursor) if cursor else params)
+            rows, next_cursor, previous_cursor = page
+            pages.append(([row.id for row in rows], previous_cursor))
+            results += [row.id for row in rows]
+            if next_cursor is None:
+                return results, pages
+            cursor = next_cursor
+
+    def test_pages_follow_rank_without_gaps(self):
+        results, pages = self.walk(Video.objects.all(), {'page_size': 2})
+        self.assertEqual(sorted(results), sorted(video.id for video in self.videos))
+        self.assertEqual(len(results), len(set(results)))
+        # Titres où "guitare" revient trois fois d'abord
+        self.assertEqual(set(results[:3]), {video.id for video in self.videos if video.titre.count("guitare") == 3})
+        for index in range(1, len(pages)):
+            rows, _, _ = paginate_search(Video.objects.all(), "guitare ", {'page_size': 2, 'cursor': pages[index][1]})
+            self.assertEqual([row.id for row in rows], pages[index - 1][0])
+
+    def test_filters_are_applied_to_each_window(self):
+        results, _ = self.walk(Video.objects.filter(categorie="musique"), {'page_size': 2})
+        self.assertEqual(sorted(results), sorted(video.id for video in self.videos if video.categorie == "musique"))
+
+    def test_no_searchable_word(self):
+        self.assertIsNone(paginate_search(Video.objects.all(), "le ", {}))
+
+class UploadContentHashesTests(SimpleTestCase):
+    def test_contiguous_chunks(self):
+        hashes = UploadContentHashes()
+        hasher = hashes.fork("u", 0)
+        hasher.update(b"abc")
+        hashes.commit("u", 0, 3, hasher)
+        hasher = hashes.fork("u", 3)
+        hasher.update(b"def")
+        hashes.commit("u", 3, 6, hasher)
+        self.assertEqual(hashes.pop("u", 6), hashlib.sha256(b"abcdef").hexdigest())
+        self.assertIsNone(hashes.pop("u", 6))
+
+    def test_fork_does_not_touch_the_committed_state(self):
+        hashes = UploadContentHashes()
+        hasher = hashes.fork("u", 0)
+        hasher.update(b"abc")
+        hashes.commit("u", 0, 3, hasher)
+        abandoned = hashes.fork("u", 3)
+        abandoned.update(b"xyz")
+        self.assertEqual(hashes.pop("u", 3), hashlib.sha256(b"abc").hexdigest())
+
+    def test_gap_drops_the_state(self):
+        hashes = UploadContentHashes()
+        hasher = hashes.fork("u", 0)
+        hasher.update(b"abc")
+        hashes.commit("u", 0, 3, hasher)
+        # Chunk traité ailleurs : l'état ne couvre plus l'offset demandé
+        self.assertIsNone(hashes.fork("u", 6))
+        hashes.commit("u", 6, 9, hashlib.sha256(b"ghi"))
+        self.assertIsNone(hashes.pop("u", 9))
+
+    def test_size_mismatch(self):
+        hashes = UploadContentHashes()
+        hasher = hashes.fork("u", 0)
+        hasher.update(b"abc")
+        hashes.commit("u", 0, 3, hasher)
+        self.assertIsNone(hashes.pop("u", 4))
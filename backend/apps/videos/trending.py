@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import Max
+from datetime import datetime, timedelta, timezone
+from threading import Thread, Lock
+import math
+import time
+
+from apps.users.models import default_created_at
+
+# Origine fixe des scores : un événement pèse poids * 2^((date - époque) / demi-vie)
+TRENDING_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+WRITE_BATCH_SIZE = 500
+
+def get_event_sources():
+    from apps.videos.models import VideoVue, VideoLike, Commentaire
+    return {
+        'vue': VideoVue,
+        'like': VideoLike,
+        'commentaire': Commentaire,
+    }
+
+def event_point(kind, created_at):
+    # Contribution d'un événement, en log2 : log2(poids) + âge depuis l'époque en demi-vies
+    half_lives = (created_at - TRENDING_EPOCH).total_seconds() / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+    return math.log2(settings.TRENDING_WEIGHTS[kind]) + half_lives
+
+def add_log2(a, b):
+    # log2(2^a + 2^b) sans débordement, même quand les exposants sont très grands
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+class TrendingIndex:
+    def __init__(self):
+        self.lock = Lock()
+        self.checked_at = None
+        self.recomputing = False
+
+    def record(self, kind, video_id, created_at):
+        # Mise à jour incrémentale, dans la transaction de l'écriture qui l'a déclenchée
+        from apps.videos.models import VideoTrending
+        point = event_point(kind, created_at)
+        with transaction.atomic():
+            row, created = VideoTrending.objects.select_for_update().get_or_create(video_id=video_id, defaults={'score': point})
+            if not created:
+                row.score = add_log2(row.score, point)
+                row.updated_at = default_created_at()
+                row.save(update_fields=['score', 'updated_at'])
+
+    def compute_scores(self, since, until=None):
+        scores = {}
+        for kind, model in get_event_sources().items():
+            rows = model.objects.filter(created_at__gte=since)
+            if until is not None:
+                rows = rows.filter(created_at__lte=until)
+            for video_id, created_at in rows.values_list('video_id', 'created_at').iterator(chunk_size=2000):
+                scores[video_id] = add_log2(scores.get(video_id), event_point(kind, created_at))
+        return scores
+
+    def recompute(self):
+        # Recalcul complet sur la fenêtre : corrige les retraits (like annulé, vidéo supprimée...) que
+        # l'incrémental ne sait pas soustraire, et sort du classement ce qui a décru hors de la fenêtre.
+        from apps.videos.models import Video, VideoTrending
+        now = default_created_at()
+        since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+        scores = self.compute_scores(since, now)
+        with transaction.atomic():
+            # Événements arrivés pendant le calcul : déjà comptés par l'incrémental, qu'on va écraser
+            for video_id, score in self.compute_scores(now + timedelta(microseconds=1)).items():
+                scores[video_id] = add_log2(scores.get(video_id), score)
+            existing = set(Video.objects.filter(id__in=list(scores)).values_list('id', flat=True)) if scores else set()
+            rows = [
+                VideoTrending(video_id=video_id, score=score, updated_at=now, computed_at=now)
+                for video_id, score in scores.items() if video_id in existing
+            ]
+            VideoTrending.objects.exclude(video_id__in=[row.video_id for row in rows]).delete()
+            VideoTrending.objects.bulk_create(
+                rows, batch_size=WRITE_BATCH_SIZE, update_conflicts=True,
+                unique_fields=['video'], update_fields=['score', 'updated_at', 'computed_at']
+            )
+        return len(rows)
+
+    def recompute_in_background(self):
+        try:
+            close_old_connections()
+            start = time.monotonic()
+            count = self.recompute()
+            print(f"[❕] Tendances : {count} vidéo(s) classée(s) en {time.monotonic() - start:.1f}s")
+        except Exception as e:
+            print(f"Erreur lors du recalcul des tendances : {e}")
+        finally:
+            close_old_connections()
+            with self.lock:
+                self.recomputing = False
+
+    def ensure_fresh(self):
+        # Vérifié au plus une fois par intervalle et par processus ; la date du dernier recalcul est en base,
+        # si bien qu'un seul processus recalcule par intervalle. Le calcul se fait hors de la requête.
+        from apps.videos.models import VideoTrending
+        now = time.monotonic()
+        with self.lock:
+            if self.recomputing or (self.checked_at is not None and now - self.checked_at < settings.TRENDING_RECOMPUTE_SECONDS):
+                return
+            self.checked_at = now
+        computed_at = VideoTrending.objects.aggregate(last=Max('computed_at'))['last']
+        if computed_at is not None and default_created_at() - computed_at < timedelta(seconds=settings.TRENDING_RECOMPUTE_SECONDS):
+            return
+        with self.lock:
+            if self.recomputing:
+                return
+            self.recomputing = True
+        Thread(target=self.recompute_in_background, daemon=True).start()
+
+trending_index = TrendingIndex()
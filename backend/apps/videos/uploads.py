@@ -0,0 +1,165 @@
+from django.conf import settings
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from contextlib import contextmanager
+from threading import Lock
+import binascii
+import fcntl
+import hashlib
+import base64
+import os
+
+CHECKSUM_ALGORITHMS = ('md5', 'sha1', 'sha256')
+
+class ChecksumMismatch(ValueError):
+    pass
+
+def get_partial_path(upload_id):
+    return os.path.join(settings.MEDIA_ROOT, 'videos', 'uploads', f"{upload_id}.part")
+
+@contextmanager
+def lock_upload(upload_id):
+    # Un seul écrivain par envoi : un doublon du chunk N (réponse perdue, renvoi) attend la fin du premier,
+    # puis voit next_chunk avancé et n'écrit rien ; il ne peut plus tronquer le chunk N+1 déjà commencé
+    path = get_partial_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def get_final_name(upload_id):
+    return os.path.join('videos', f"{upload_id}.mp4")
+
+def parse_checksum(request):
+    # Format tus "Upload-Checksum: sha1 <base64>" ou champ "checksum=sha256:<hex>"
+    header = request.headers.get('Upload-Checksum')
+    if header:
+        algorithm, _, value = header.strip().partition(' ')
+    else:
+        algorithm, _, value = request.POST.get('checksum', '').strip().partition(':')
+    if not algorithm:
+        return None
+    algorithm = algorithm.lower()
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError(f"Algorithme de checksum non supporté : {algorithm}")
+    try:
+        digest = bytes.fromhex(value)
+    except ValueError:
+        try:
+            digest = base64.b64decode(value, validate=True)
+        except binascii.Error:
+            raise ValueError("Checksum illisible (hexadécimal ou base64 attendu)")
+    return algorithm, digest
+
+def format_checksum(algorithm, digest):
+    return f"{algorithm}:{digest.hex()}"
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(settings.UPLOAD_BUFFER_SIZE):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+class ContentHashMixin:
+    # Empreinte SHA-256 calculée pendant la réception, par le gestionnaire qui garde réellement les données :
+    # le fichier reçu porte "content_hash", sans relecture
+    def new_file(self, *args, **kwargs):
+        self.content_hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            self.content_hasher.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.content_hasher.hexdigest()
+        return file
+
+class HashingMemoryFileUploadHandler(ContentHashMixin, MemoryFileUploadHandler):
+    pass
+
+class HashingTemporaryFileUploadHandler(ContentHashMixin, TemporaryFileUploadHandler):
+    pass
+
+class UploadContentHashes:
+    # Empreinte du fichier entier tenue au fil des chunks (reçus dans l'ordre) : état du hachage par upload,
+    # avec l'offset qu'il couvre. Chunk traité par un autre processus, renvoyé ou en concurrence : l'état n'est
+    # plus contigu et l'empreinte sera recalculée une fois le fichier assemblé.
+    def __init__(self):
+        self.lock = Lock()
+        self.states = {}
+
+    def fork(self, upload_id, offset):
+        with self.lock:
+            state = self.states.get(upload_id)
+        if offset == 0:
+            return hashlib.sha256()
+        if state is None or state[0] != offset:
+            return None
+        return state[1].copy()
+
+    def commit(self, upload_id, offset, end, hasher):
+        with self.lock:
+            state = self.states.get(upload_id)
+            if offset == 0 or (state is not None and state[0] == offset):
+                self.states[upload_id] = (end, hasher)
+            else:
+                self.states.pop(upload_id, None)
+
+    def pop(self, upload_id, size):
+        with self.lock:
+            state = self.states.pop(upload_id, None)
+        if state is None or state[0] != size:
+            return None
+        return state[1].hexdigest()
+
+upload_hashes = UploadContentHashes()
+
+def write_chunk(upload_id, chunk, offset, checksum=None):
+    # Écrit le chunk à l'offset validé du fichier partiel, par blocs de taille fixe,
+    # en calculant le checksum du chunk et l'empreinte du fichier au passage : un seul parcours des données.
+    # À appeler sous lock_upload, offset relu après l'avoir pris.
+    path = get_partial_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    algorithm = checksum[0] if checksum else 'sha256'
+    hasher = hashlib.new(algorithm)
+    content_hasher = upload_hashes.fork(upload_id, offset)
+    written = 0
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as partial:
+        partial.seek(offset)
+        for block in chunk.chunks(settings.UPLOAD_BUFFER_SIZE):
+            hasher.update(block)
+            if content_hasher is not None:
+                content_hasher.update(block)
+            partial.write(block)
+            written += len(block)
+        # Supprime d'éventuels octets d'une tentative précédente interrompue
+        partial.truncate(offset + written)
+    digest = hasher.digest()
+    if checksum and digest != checksum[1]:
+        with open(path, 'r+b') as partial:
+            partial.truncate(offset)
+        raise ChecksumMismatch(f"Checksum {algorithm} invalide pour le chunk")
+    if content_hasher is not None:
+        upload_hashes.commit(upload_id, offset, offset + written, content_hasher)
+    return written, format_checksum(algorithm, digest)
+
+def finalize_upload(upload_id, size):
+    # Le fichier partiel contient déjà la vidéo complète : il devient (par simple renommage) le contenu
+    # adressé par son empreinte, ou est supprimé si ce contenu est déjà connu
+    from apps.videos.blobs import acquire_blob
+    path = get_partial_path(upload_id)
+    content_hash = upload_hashes.pop(upload_id, size) or hash_file(path)
+    blob = acquire_blob(content_hash, size, get_final_name(upload_id), path=path)
+    try:
+        os.remove(f"{path}.lock")
+    except OSError:
+        pass
+    return blob
@@ -19,14 +19,17 @@ urlpatterns = [
     path('videos/<str:code_id>/details/', views.VideoDetailByCodeIdView.as_view(), name='video-detail-by-code'),
     path('videos/create/', views.VideoCreateView.as_view(), name='video-create'),
     path('videos/chunked-upload/', views.ManualVideoChunkUploadView.as_view(), name='video-chunked-upload'),
+    path('videos/chunked-upload/<uuid:upload_id>/', views.ManualVideoChunkUploadView.as_view(), name='video-chunked-upload-detail'),
     # path('videos/chunked-upload/', views.VideoChunkedUploadView.as_view(), name='video-chunked-upload'),
     path('videos/<int:video_id>/update/', views.VideoUpdateView.as_view(), name='video-update'),
     path('videos/<int:video_id>/delete/', views.VideoDeleteView.as_view(), name='video-delete'),
     path('videos/<int:video_id>/like/', views.VideoLikeView.as_view(), name='video-like'),
     path('videos/<int:video_id>/dislike/', views.VideoDislikeView.as_view(), name='video-dislike'),
     path('videos/<int:video_id>/view/', views.VideoViewView.as_view(), name='video-view'),
+    path('videos/events/', views.VideoEventResyncView.as_view(), name='video-events'),
     path('videos/<int:video_id>/download/', views.VideoDownloadView.as_view(), name='video-download'),
     path('videos/<int:video_id>/manifest/', views.VideoManifestView.as_view(), name='video-manifest'),
+    path('videos/<int:video_id>/dash/', views.VideoDashManifestView.as_view(), name='video-dash-manifest'),
     path('videos/<int:video_id>/segments/<str:segment_name>/', views.VideoSegmentView.as_view(), name='video-segment'),
 
     path('chaines/', views.ChaineListView.as_view(), name='chaine-list'),
@@ -41,7 +44,9 @@ urlpatterns = [
     path('videos/<int:video_id>/comments/create/', views.CommentCreateView.as_view(), name='comment-create'),
 
     path('comments/<int:comment_id>/messages/', views.MessageListView.as_view(), name='message-list'),
+    path('comments/<int:comment_id>/replies/', views.CommentReplyListView.as_view(), name='comment-replies'),
     path('messages/create/', views.MessageCreateView.as_view(), name='message-create'),
+    path('messages/<int:message_id>/update/', views.MessageUpdateView.as_view(), name='message-update'),
 
     path('videos/search/', views.VideoSearchView.as_view(), name='video-search'),
     path('historique/vues/', views.HistoriqueVuesView.as_view(), name='historique-vues'),
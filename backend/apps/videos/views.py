@@ -5,55 +5,41 @@ from rest_framework.parsers import MultiPartParser, FormParser
 
 from apps.videos.models import Video, Chaine, VideoPlaylist, Playlist, Commentaire, Message, Tag, VideoVue, VideoLike, VideoDislike, VideoRegarderPlusTard,VideoUpload, VideoChunk, VideoProcessingTask
 from apps.videos.serializers import VideoSerializer, ChaineSerializer, CommentaireSerializer, MessageSerializer, TagSerializer, PlaylistSerializer
-from apps.videos.tasks import process_video_conversion, generate_video_affichage
+from apps.videos.scheduler import video_processing_scheduler
+from apps.videos.search import video_search_index
+from apps.videos.filters import apply_filters, apply_ordering, DEFAULT_VIDEO_ORDERING
+from apps.videos.pagination import paginate_videos, paginate_related_videos, paginate_search, get_paginated_data, InvalidCursor
+from apps.videos.uploads import parse_checksum, format_checksum, write_chunk, finalize_upload, lock_upload, ChecksumMismatch
+from apps.videos.blobs import acquire_blob, release_blob
+from apps.videos.events import publish_event, get_events_since, parse_group
+from apps.videos.counters import increment_counters
+from apps.videos.comments import paginate_comments, paginate_messages, paginate_replies
+from apps.videos.comment_stream import publish_comment_message
+from apps.videos.dash import DASH_MANIFEST_NAME
+from apps.videos.playback import can_watch_video
+from helpers.media import file_response
 from helpers.helper import LOGGER, get_token_from_request, get_user, format_file_size, get_available_info, format_duration
 
 from drf_yasg.utils import swagger_auto_schema
-from django.core.files import File
 from drf_yasg import openapi
 from django.conf import settings
-from django.http import FileResponse
+from django.http import Http404
+from django.utils._os import safe_join
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Count
+from django.db.models import F
+from django.db import transaction
+from django.core.exceptions import ValidationError, SuspiciousFileOperation
 from django.utils import timezone as django_timezone
 # from chunked_upload.views import ChunkedUploadView
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
 from datetime import datetime
-from datetime import timedelta, timezone
+from datetime import timezone
 import uuid, time, os, shutil
-from queue import Queue
-from threading import Thread
 
 import traceback
 
-################################# WORKER #################################
-
-video_processing_queue = Queue()
-
-def video_processing_worker():
-    while True:
-        print(video_processing_queue)
-        video_info = video_processing_queue.get()
-        process_type = video_info.get('type')
-        video_id = video_info.get('video_id')
-        print("[!] 🖼️ Worker processing vidéo...", video_id)
-        try:
-            if process_type == "THUMBNAILS":
-                generate_video_affichage(video_id)
-            elif process_type == "CONVERSION":
-                process_video_conversion(video_id)
-        except Exception as e:
-            print("[❌] Erreur dans le worker pour image ID:", video_id, str(e))
-        finally:
-            video_processing_queue.task_done()
-            
-processing_worker_thread = Thread(target=video_processing_worker, daemon=True)
-processing_worker_thread.start()
-
-################################# WORKER #################################
-
 class TagCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -281,7 +267,9 @@ class VideoListView(APIView):
             openapi.Parameter('date_filter', openapi.IN_QUERY, description="Filtre de date (recent, today, week, month, year)", type=openapi.TYPE_STRING, required=False),
             openapi.Parameter('start_date', openapi.IN_QUERY, description="Date de début (format: YYYY-MM-DD)", type=openapi.TYPE_STRING, required=False),
             openapi.Parameter('end_date', openapi.IN_QUERY, description="Date de fin (format: YYYY-MM-DD)", type=openapi.TYPE_STRING, required=False),
-            openapi.Parameter('order_by', openapi.IN_QUERY, description="Trier par (likes, dislikes, comments, date)", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('order_by', openapi.IN_QUERY, description="Trier par (likes, dislikes, comments, date, trending)", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre de vidéos par page", type=openapi.TYPE_INTEGER, required=False),
         ],
         responses={
             200: VideoSerializer(many=True),
@@ -298,44 +286,15 @@ class VideoListView(APIView):
         if search_term:
             videos = videos.filter(titre__icontains=search_term)
 
-        tags = request.query_params.get('tags')
-        if tags:
-            videos = videos.filter(tags__name__in=tags.split(','))
-
-        categorie = request.query_params.get('categorie')
-        if categorie:
-            videos = videos.filter(categorie=categorie)
-
-        date_filter = request.query_params.get('date_filter')
-        now = django_timezone.now()
-        if date_filter == 'today':
-            videos = videos.filter(uploaded_at__date=now.date())
-        elif date_filter == 'week':
-            videos = videos.filter(uploaded_at__gte=now - timedelta(days=7))
-        elif date_filter == 'month':
-            videos = videos.filter(uploaded_at__gte=now - timedelta(days=30))
-        elif date_filter == 'year':
-            videos = videos.filter(uploaded_at__gte=now - timedelta(days=365))
-        elif date_filter == 'recent':
-            videos = videos.order_by('-uploaded_at')
-
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        if start_date and end_date:
-            videos = videos.filter(uploaded_at__range=[start_date, end_date])
-
-        order_by = request.query_params.get('order_by')
-        if order_by == 'likes':
-            videos = videos.annotate(like_count=Count('likes')).order_by('-like_count')
-        elif order_by == 'dislikes':
-            videos = videos.annotate(dislike_count=Count('dislikes')).order_by('-dislike_count')
-        elif order_by == 'comments':
-            videos = videos.annotate(comment_count=Count('commentaires')).order_by('-comment_count')
-        elif order_by == 'date':
-            videos = videos.order_by('-uploaded_at')
+        videos = apply_filters(videos, request.query_params)
+        videos, ordering = apply_ordering(videos, request.query_params)
+        try:
+            videos, next_cursor, previous_cursor = paginate_videos(videos, ordering or DEFAULT_VIDEO_ORDERING, request.query_params, request)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
 
         serializer = VideoSerializer(videos, many=True, context={'request': request, "with_suggestion": False})
-        return Response(serializer.data)
+        return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor))
 
 class MyVideoListView(APIView):
     permission_classes = [IsAuthenticated]
@@ -348,7 +307,9 @@ class MyVideoListView(APIView):
             openapi.Parameter('date_filter', openapi.IN_QUERY, description="Filtre de date (recent, today, week, month, year)", type=openapi.TYPE_STRING, required=False),
             openapi.Parameter('start_date', openapi.IN_QUERY, description="Date de début (format: YYYY-MM-DD)", type=openapi.TYPE_STRING, required=False),
             openapi.Parameter('end_date', openapi.IN_QUERY, description="Date de fin (format: YYYY-MM-DD)", type=openapi.TYPE_STRING, required=False),
-            openapi.Parameter('order_by', openapi.IN_QUERY, description="Trier par (likes, dislikes, comments, date)", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('order_by', openapi.IN_QUERY, description="Trier par (likes, dislikes, comments, date, trending)", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre de vidéos par page", type=openapi.TYPE_INTEGER, required=False),
         ],
         responses={
             200: VideoSerializer(many=True),
@@ -361,45 +322,14 @@ class MyVideoListView(APIView):
     def get(self, request):
         try:
             videos = Video.objects.filter(envoyeur=request.user)
-
-            tags = request.query_params.get('tags')
-            if tags:
-                videos = videos.filter(tags__name__in=tags.split(','))
-
-            categorie = request.query_params.get('categorie')
-            if categorie:
-                videos = videos.filter(categorie=categorie)
-
-            date_filter = request.query_params.get('date_filter')
-            now = django_timezone.now()
-            if date_filter == 'today':
-                videos = videos.filter(uploaded_at__date=now.date())
-            elif date_filter == 'week':
-                videos = videos.filter(uploaded_at__gte=now - timedelta(days=7))
-            elif date_filter == 'month':
-                videos = videos.filter(uploaded_at__gte=now - timedelta(days=30))
-            elif date_filter == 'year':
-                videos = videos.filter(uploaded_at__gte=now - timedelta(days=365))
-            elif date_filter == 'recent':
-                videos = videos.order_by('-uploaded_at')
-
-            start_date = request.query_params.get('start_date')
-            end_date = request.query_params.get('end_date')
-            if start_date and end_date:
-                videos = videos.filter(uploaded_at__range=[start_date, end_date])
-
-            order_by = request.query_params.get('order_by')
-            if order_by == 'likes':
-                videos = videos.annotate(like_count=Count('likes')).order_by('-like_count')
-            elif order_by == 'dislikes':
-                videos = videos.annotate(dislike_count=Count('dislikes')).order_by('-dislike_count')
-            elif order_by == 'comments':
-                videos = videos.annotate(comment_count=Count('commentaires')).order_by('-comment_count')
-            elif order_by == 'date':
-                videos = videos.order_by('-uploaded_at')
+            videos = apply_filters(videos, request.query_params)
+            videos, ordering = apply_ordering(videos, request.query_params)
+            videos, next_cursor, previous_cursor = paginate_videos(videos, ordering or DEFAULT_VIDEO_ORDERING, request.query_params, request)
 
             serializer = VideoSerializer(videos, many=True, context={'request': request, "with_suggestion": False})
-            return Response(serializer.data)
+            return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor))
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
         except Exception as e:
             return Response({"erreur":str(e)},status=500)
 
@@ -481,30 +411,18 @@ class VideoCreateView(APIView):
             video = serializer.save()
             fichier = request.FILES.get('fichier', None)
             if fichier:
-                video.fichier = fichier
+                # Empreinte calculée pendant la réception (cf. FILE_UPLOAD_HANDLERS) : contenu déjà connu, pas de copie
+                content_hash = getattr(fichier, 'content_hash', None)
+                if content_hash:
+                    video.blob = acquire_blob(content_hash, fichier.size, fichier.name, file=fichier)
+                    video.fichier.name = video.blob.fichier
+                else:
+                    video.fichier = fichier
             video.save()
-            video_processing_queue.put(
-                {
-                    "type":"THUMBNAILS",
-                    "video_id":video.id
-                }
-            )            
-            video_processing_queue.put(
-                {
-                    "type":"CONVERSION",
-                    "video_id":video.id
-                }
-            )
+            video_processing_scheduler.submit("THUMBNAILS", video.id)
+            video_processing_scheduler.submit("CONVERSION", video.id)
             
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "video_updates",
-                {
-                    "type": "video_created",
-                    "video_id": video.id,
-                    "video_data": VideoSerializer(video, context={'request': request}).data
-                }
-            )
+            publish_event("video_created", video_id=video.id, user_id=request.user.id)
             
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
@@ -513,48 +431,118 @@ class ManualVideoChunkUploadView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
-    def post(self, request):
+    def get_upload_status(self, video_upload):
+        return {
+            "upload_id": str(video_upload.upload_id),
+            "offset": video_upload.uploaded_bytes,
+            "next_chunk": video_upload.next_chunk,
+            "total_size": video_upload.total_size,
+            "total_chunks": video_upload.total_chunks,
+            "progress": round((video_upload.uploaded_bytes / video_upload.total_size) * 100, 2)
+        }
+
+    def status_response(self, video_upload, status=200, error=None):
+        data = self.get_upload_status(video_upload)
+        if error:
+            data["error"] = error
+        response = Response(data, status=status)
+        # En-têtes à la manière de tus : le client reprend à Upload-Offset
+        response['Upload-Offset'] = str(video_upload.uploaded_bytes)
+        response['Upload-Length'] = str(video_upload.total_size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    @swagger_auto_schema(
+        operation_description="État d'un upload reprenable : offset validé et prochain chunk attendu (HEAD renvoie seulement les en-têtes Upload-Offset / Upload-Length)",
+        manual_parameters=[
+            openapi.Parameter('upload_id', openapi.IN_QUERY, description="Identifiant de l'upload", type=openapi.TYPE_STRING, required=False),
+        ],
+        responses={
+            200: openapi.Response(description="État de l'upload"),
+            404: openapi.Response(description="Upload introuvable")
+        }
+    )
+    def get(self, request, upload_id=None):
+        upload_id = upload_id or request.query_params.get('upload_id')
+        try:
+            video_upload = VideoUpload.objects.get(upload_id=upload_id, user=request.user)
+        except (VideoUpload.DoesNotExist, ValidationError):
+            return Response({"error": "Upload introuvable"}, status=404)
+        return self.status_response(video_upload)
+
+    def post(self, request, upload_id=None):
         try:
             user = request.user
 
             start_time = datetime.now(timezone.utc)
             chunk = request.FILES.get('fichier')
-            upload_id = request.POST.get('upload_id', str(uuid.uuid4()))
+            upload_id = upload_id or request.POST.get('upload_id', str(uuid.uuid4()))
             chunk_number = int(request.POST.get('chunk_number', 0))
             total_chunks = int(request.POST.get('total_chunks', 0))
             total_size = int(request.POST.get('total_size', 0))
 
             if not chunk or not total_chunks or not total_size:
                 return Response({"error": "Données manquantes (fichier, total_chunks, total_size)"}, status=400)
+            try:
+                checksum = parse_checksum(request)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+
+            try:
+                if chunk_number == 0:
+                    # get_or_create : le premier chunk peut être renvoyé si sa réponse a été perdue
+                    video_upload, created = VideoUpload.objects.get_or_create(upload_id=upload_id, user=user, defaults={
+                        'titre': request.POST.get('titre', ''),
+                        'description': request.POST.get('description', ''),
+                        'categorie': request.POST.get('categorie', ''),
+                        'visibilite': request.POST.get('visibilite', 'PUBLIC'),
+                        'tags': request.POST.get('tags', ''),
+                        'total_size': total_size,
+                        'total_chunks': total_chunks
+                    })
+                else:
+                    video_upload = VideoUpload.objects.get(upload_id=upload_id, user=user)
+            except (VideoUpload.DoesNotExist, ValidationError):
+                return Response({"error": "Upload ID invalide ou métadonnées manquantes"}, status=400)
+
+            if chunk_number < video_upload.next_chunk:
+                # Chunk déjà validé (réponse perdue côté client) : rien à réécrire
+                received = video_upload.chunks.filter(chunk_number=chunk_number).first()
+                if checksum and received and received.checksum != format_checksum(*checksum):
+                    return self.status_response(video_upload, status=409, error="Ce chunk a déjà été reçu avec un contenu différent")
+                return self.status_response(video_upload)
+            if chunk_number > video_upload.next_chunk:
+                return self.status_response(video_upload, status=409, error=f"Chunk {video_upload.next_chunk} attendu, reprendre à l'offset {video_upload.uploaded_bytes}")
+            with lock_upload(video_upload.upload_id):
+                # Relu sous le verrou : un doublon concurrent de ce chunk a pu être validé entre-temps
+                video_upload.refresh_from_db(fields=['uploaded_bytes', 'next_chunk'])
+                if chunk_number != video_upload.next_chunk:
+                    return self.status_response(video_upload)
+                offset = video_upload.uploaded_bytes
+                if offset + chunk.size > video_upload.total_size:
+                    return self.status_response(video_upload, status=400, error="Le chunk dépasse la taille totale annoncée")
 
-            if chunk_number == 0:
-                video_upload_data = {
-                    'upload_id': upload_id,
-                    'user': user,
-                    'titre': request.POST.get('titre', ''),
-                    'description': request.POST.get('description', ''),
-                    'categorie': request.POST.get('categorie', ''),
-                    'visibilite': request.POST.get('visibilite', 'PUBLIC'),
-                    'tags': request.POST.get('tags', ''),
-                    'total_size': total_size,
-                    'total_chunks': total_chunks
-                }
-                video_upload = VideoUpload.objects.create(**video_upload_data)
-            else:
                 try:
-                    video_upload = VideoUpload.objects.get(upload_id=upload_id)
-                except VideoUpload.DoesNotExist:
-                    return Response({"error": "Upload ID invalide ou métadonnées manquantes"}, status=400)
-
-            chunk_instance = VideoChunk.objects.create(
-                video_upload=video_upload,
-                chunk_number=chunk_number,
-                chunk_file=chunk
-            )
-
+                    size, digest = write_chunk(video_upload.upload_id, chunk, offset, checksum)
+                except ChecksumMismatch as e:
+                    # 460 : code tus pour un checksum invalide, le client renvoie le même chunk
+                    return self.status_response(video_upload, status=460, error=str(e))
+
+                with transaction.atomic():
+                    # Compare-and-swap : garde-fou si un autre noeud écrit le même envoi (verrou local au serveur)
+                    committed = VideoUpload.objects.filter(id=video_upload.id, next_chunk=chunk_number).update(
+                        next_chunk=F('next_chunk') + 1, uploaded_bytes=F('uploaded_bytes') + size, updated_at=django_timezone.now()
+                    )
+                    if committed:
+                        VideoChunk.objects.create(video_upload=video_upload, chunk_number=chunk_number, offset=offset, size=size, checksum=digest)
+                video_upload.refresh_from_db(fields=['uploaded_bytes', 'next_chunk'])
+            if not committed:
+                return self.status_response(video_upload)
+
+            total_size = video_upload.total_size
             elapsed_time = (datetime.now(timezone.utc) - start_time).total_seconds()
-            speed = chunk.size / elapsed_time if elapsed_time > 0 else 0
-            uploaded_bytes = sum(c.chunk_file.size for c in video_upload.chunks.all())
+            speed = size / elapsed_time if elapsed_time > 0 else 0
+            uploaded_bytes = video_upload.uploaded_bytes
             progress = (uploaded_bytes / total_size) * 100
             total_duration = total_size / speed if speed > 0 else 0
             remaining_duration = total_duration * (1 - progress / 100)
@@ -576,87 +564,58 @@ class ManualVideoChunkUploadView(APIView):
                 }
             )
 
-            if video_upload.chunks.count() == int(total_chunks):
+            if video_upload.next_chunk == video_upload.total_chunks:
+                if uploaded_bytes != total_size:
+                    return self.status_response(video_upload, status=400, error="Taille reçue différente de la taille annoncée")
+                blob = None
                 try:
-                    final_file_path = os.path.join(settings.MEDIA_ROOT, 'videos', f"{upload_id}.mp4")
-                    os.makedirs(os.path.dirname(final_file_path), exist_ok=True)
-                    with open(final_file_path, 'wb') as final_file:
-                        for i in range(total_chunks):
-                            chunk_instance = video_upload.chunks.get(chunk_number=i)
-                            with open(chunk_instance.chunk_file.path, 'rb') as chunk_file:
-                                final_file.write(chunk_file.read())
-                            os.remove(chunk_instance.chunk_file.path)
-                            chunk_instance.delete()
-
-                    if not os.path.exists(final_file_path):
-                        return Response({"error": "Le fichier final n'a pas été créé correctement"}, status=500)
-
-                    with open(final_file_path, 'rb') as final_file:
-                        django_file = File(final_file, name=f"{upload_id}.mp4")
-
-                        video_data = {
-                            'envoyeur': user,
-                            'titre': video_upload.titre,
-                            'description': video_upload.description,
-                            'categorie': video_upload.categorie,
-                            'visibilite': video_upload.visibilite,
-                            'tags_names': [tag.strip() for tag in video_upload.tags.split(',') if tag.strip()]
-                        }
-
-                        serializer = VideoSerializer(data=video_data, context={'request': request})
-                        if serializer.is_valid(raise_exception=True):
-                            video = serializer.save(fichier=django_file)
-                            video_upload.delete()
-                            async_to_sync(channel_layer.group_send)(
-                                f"upload_{user.id}_{upload_id}",
-                                {
-                                    'type': 'upload_progress',
-                                    'progress': 100,
-                                    'speed': format_file_size(0) + "/s",
-                                    'total_duration': format_duration(0),
-                                    'remaining_duration': format_duration(0),
-                                    'remaining_size': format_file_size(0),
-                                    'uploaded_bytes': total_size,
-                                    'total_bytes': total_size,
-                                    'video_id': video.id,
-                                    'status': 'completed'
-                                }
-                            )
-                            video_processing_queue.put(
-                                {
-                                    "type":"THUMBNAILS",
-                                    "video_id":video.id
-                                }
-                            )        
-                            video_processing_queue.put(
-                                {
-                                    "type":"CONVERSION",
-                                    "video_id":video.id
-                                }
-                            )
-                            
-                            # Diffusion via WebSocket pour la création de la vidéo
-                            async_to_sync(channel_layer.group_send)(
-                                "video_updates",
-                                {
-                                    "type": "video_created",
-                                    "video_id": video.id,
-                                    "video_data": VideoSerializer(video, context={'request': request}).data
-                                }
-                            )
-                            
-                            return Response(serializer.data, status=201)
-                        else:
-                            return Response(serializer.errors, status=400)
+                    blob = finalize_upload(video_upload.upload_id, total_size)
+
+                    video_data = {
+                        'envoyeur': user,
+                        'titre': video_upload.titre,
+                        'description': video_upload.description,
+                        'categorie': video_upload.categorie,
+                        'visibilite': video_upload.visibilite,
+                        'tags_names': [tag.strip() for tag in video_upload.tags.split(',') if tag.strip()]
+                    }
+
+                    serializer = VideoSerializer(data=video_data, context={'request': request})
+                    if serializer.is_valid(raise_exception=True):
+                        video = serializer.save(fichier=blob.fichier, blob=blob)
+                        blob = None
+                        video_upload.delete()
+                        async_to_sync(channel_layer.group_send)(
+                            f"upload_{user.id}_{upload_id}",
+                            {
+                                'type': 'upload_progress',
+                                'progress': 100,
+                                'speed': format_file_size(0) + "/s",
+                                'total_duration': format_duration(0),
+                                'remaining_duration': format_duration(0),
+                                'remaining_size': format_file_size(0),
+                                'uploaded_bytes': total_size,
+                                'total_bytes': total_size,
+                                'video_id': video.id,
+                                'status': 'completed'
+                            }
+                        )
+                        video_processing_scheduler.submit("THUMBNAILS", video.id)
+                        video_processing_scheduler.submit("CONVERSION", video.id)
+                        
+                        # Diffusion via WebSocket pour la création de la vidéo
+                        publish_event("video_created", video_id=video.id, user_id=user.id)
+                        
+                        return Response(serializer.data, status=201)
+                    else:
+                        return Response(serializer.errors, status=400)
                 except Exception as e:
+                    if blob is not None:
+                        release_blob(blob.id)
                     print(f"Erreur lors de la recombinaison: {str(e)}")
                     return Response({"error": f"Erreur lors de la recombinaison: {str(e)}"}, status=500)
 
-            return Response({
-                "upload_id": upload_id,
-                "chunk_number": chunk_number,
-                "progress": round(progress, 2)
-            }, status=200)
+            return self.status_response(video_upload)
 
         except Exception as e:
             print(f"Erreur dans ManualVideoChunkUploadView: {str(e)}")
@@ -793,15 +752,7 @@ class VideoUpdateView(APIView):
                 serializer.save()
                 
                 # Diffusion via WebSocket
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "video_updates",
-                    {
-                        "type": "video_updated",
-                        "video_id": video.id,
-                        "video_data": VideoSerializer(video, context={'request': request}).data
-                    }
-                )
+                publish_event("video_updated", video_id=video.id)
                 
                 return Response(serializer.data)
             return Response(serializer.errors, status=400)
@@ -832,24 +783,18 @@ class VideoDeleteView(APIView):
 
             if hasattr(video, 'video_playlist'):
                 video.video_playlist.all().delete()
-            if os.path.exists(video.fichier.path):
+            # Fichier source partagé (contenu dédupliqué) : libéré avec la dernière référence (cf. signals.py)
+            if video.blob_id is None and os.path.exists(video.fichier.path):
                 os.remove(video.fichier.path)
             if os.path.exists(video.affichage.path):
                 os.remove(video.affichage.path)
             video.delete()
             if os.path.exists(video_dir):
                 shutil.rmtree(video_dir)
-            if os.path.exists(original_file_path) and original_file_path != video.fichier.path:
+            if video.blob_id is None and os.path.exists(original_file_path) and original_file_path != video.fichier.path:
                 os.remove(original_file_path)
                 
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "video_updates",
-                {
-                    "type": "video_deleted",
-                    "video_id": video_id
-                }
-            )
+            publish_event("video_deleted", video_id=video_id)
             
             return Response({"message": "Vidéo supprimée"}, status=204)
         except Video.DoesNotExist:
@@ -989,9 +934,17 @@ class CommentListView(APIView):
     permission_classes = [AllowAny]
 
     @swagger_auto_schema(
-        operation_description="Liste des commentaires pour une vidéo, triés par TOP ou NOUVEAUTE",
+        operation_description="Liste paginée des fils de commentaires d'une vidéo, triés par TOP ou NOUVEAUTE",
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre d'éléments par page", type=openapi.TYPE_INTEGER, required=False),
+        ],
         responses={
             200: CommentaireSerializer(many=True),
+            400: openapi.Response(
+                description="Curseur invalide",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            ),
             404: openapi.Response(
                 description="Vidéo non trouvée",
                 schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
@@ -1001,13 +954,11 @@ class CommentListView(APIView):
     def get(self, request, video_id):
         try:
             video = Video.objects.get(id=video_id)
-            comments = video.commentaires.all()
-            if video.ordre_de_commentaire == 'TOP':
-                comments = comments.annotate(message_count=Count('messages')).order_by('-message_count')
-            else:
-                comments = comments.order_by('-created_at')
+            comments, next_cursor, previous_cursor = paginate_comments(video, request.query_params)
             serializer = CommentaireSerializer(comments, many=True, context={'request': request})
-            return Response(serializer.data)
+            return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor))
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
         except Video.DoesNotExist:
             return Response({'error': 'Vidéo non trouvée'}, status=404)
 
@@ -1045,22 +996,15 @@ class CommentCreateView(APIView):
             video = Video.objects.get(id=video_id)
             if not video.autoriser_commentaire:
                 return Response({'error': 'Les commentaires sont désactivés pour cette vidéo'}, status=403)
-            new_commentaire = Commentaire.objects.create(video=video)
-            new_commentaire.membres.add(request.user)
-            Message.objects.create(commentaire=new_commentaire, envoyeur=request.user, contenu=request.data.get('contenu', ''))
+            with transaction.atomic():
+                new_commentaire = Commentaire.objects.create(video=video, messages_count=1)
+                new_commentaire.membres.add(request.user)
+                message = Message.objects.create(commentaire=new_commentaire, envoyeur=request.user, contenu=request.data.get('contenu', ''))
+                increment_counters(Video, video.id, commentaires_count=1)
             
-            # Diffusion via WebSocket
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "video_updates",
-                {
-                    "type": "comment_created",
-                    "video_id": video_id,
-                    "comment_id": new_commentaire.id,
-                    "comment_data": CommentaireSerializer(new_commentaire).data,
-                    "commentaires": CommentaireSerializer(Commentaire.objects.filter(video=video), many=True, context={"request":request}).data
-                }
-            )
+            # Diffusion via WebSocket : le nouveau fil seul dans le flux comments_<id>, le compteur dans video_<id>
+            publish_comment_message("message_created", message, is_thread=True)
+            publish_event("comment_created", video_id=video_id, user_id=request.user.id, object_id=new_commentaire.id)
             
             return Response(CommentaireSerializer(new_commentaire).data, status=201)
         except Video.DoesNotExist:
@@ -1074,9 +1018,17 @@ class MessageListView(APIView):
     permission_classes = [AllowAny]
 
     @swagger_auto_schema(
-        operation_description="Liste des messages pour un commentaire, triés par date (plus récent en premier)",
+        operation_description="Liste paginée des messages d'un commentaire, triés par date (plus récent en premier)",
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre d'éléments par page", type=openapi.TYPE_INTEGER, required=False),
+        ],
         responses={
             200: MessageSerializer(many=True),
+            400: openapi.Response(
+                description="Curseur invalide",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            ),
             404: openapi.Response(
                 description="Commentaire non trouvé",
                 schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
@@ -1086,9 +1038,43 @@ class MessageListView(APIView):
     def get(self, request, comment_id):
         try:
             comment = Commentaire.objects.get(id=comment_id)
-            messages = comment.messages.all().order_by('-created_at')
+            messages, next_cursor, previous_cursor = paginate_messages(comment, request.query_params)
             serializer = MessageSerializer(messages, many=True, context={'request': request})
-            return Response(serializer.data)
+            return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor))
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
+        except Commentaire.DoesNotExist:
+            return Response({'error': 'Commentaire non trouvé'}, status=404)
+
+class CommentReplyListView(APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Réponses d'un fil de commentaire, par ordre chronologique (suite de 'reponses', curseur 'reponses_next')",
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre d'éléments par page", type=openapi.TYPE_INTEGER, required=False),
+        ],
+        responses={
+            200: MessageSerializer(many=True),
+            400: openapi.Response(
+                description="Curseur invalide",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            ),
+            404: openapi.Response(
+                description="Commentaire non trouvé",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            )
+        }
+    )
+    def get(self, request, comment_id):
+        try:
+            comment = Commentaire.objects.get(id=comment_id)
+            replies, next_cursor, previous_cursor = paginate_replies(comment, request.query_params)
+            serializer = MessageSerializer(replies, many=True, context={'request': request})
+            return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor))
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
         except Commentaire.DoesNotExist:
             return Response({'error': 'Commentaire non trouvé'}, status=404)
 
@@ -1121,12 +1107,57 @@ class MessageCreateView(APIView):
             comment = Commentaire.objects.get(id=request.data.get('comment_id'))
             serializer = MessageSerializer(data=request.data, context={'request': request})
             if serializer.is_valid():
-                serializer.save(commentaire=comment, envoyeur=request.user)
+                with transaction.atomic():
+                    message = serializer.save(commentaire=comment, envoyeur=request.user)
+                    increment_counters(Commentaire, comment.id, messages_count=1)
+                
+                # Diffusion via WebSocket
+                publish_comment_message("message_created", message)
+                
                 return Response(serializer.data, status=201)
             return Response(serializer.errors, status=400)
         except Commentaire.DoesNotExist:
             return Response({'error': 'Commentaire non trouvé'}, status=404)
 
+class MessageUpdateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Modifie le contenu d'un message (par son auteur)",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'contenu': openapi.Schema(type=openapi.TYPE_STRING, description="Nouveau contenu du message"),
+            },
+            required=['contenu']
+        ),
+        responses={
+            200: MessageSerializer(),
+            403: openapi.Response(
+                description="Permission refusée",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            ),
+            404: openapi.Response(
+                description="Message non trouvé",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            )
+        }
+    )
+    def put(self, request, message_id):
+        try:
+            message = Message.objects.select_related('commentaire', 'envoyeur').get(id=message_id)
+            if message.envoyeur_id != request.user.id:
+                return Response({"error": "Vous n'êtes pas autorisé à modifier ce message"}, status=403)
+            message.contenu = request.data.get('contenu', message.contenu)
+            message.save(update_fields=['contenu'])
+            
+            # Diffusion via WebSocket
+            publish_comment_message("message_updated", message)
+            
+            return Response(MessageSerializer(message).data)
+        except Message.DoesNotExist:
+            return Response({'error': 'Message non trouvé'}, status=404)
+
 # Search and Other Views
 
 class VideoSearchView(APIView):
@@ -1135,13 +1166,15 @@ class VideoSearchView(APIView):
     @swagger_auto_schema(
         operation_description="Recherche de vidéos par critères",
         manual_parameters=[
-            openapi.Parameter('search_term', openapi.IN_QUERY, description="Terme de recherche (titre/description)", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('search_term', openapi.IN_QUERY, description="Terme de recherche plein texte (titre/description/tags/catégorie), classé par pertinence", type=openapi.TYPE_STRING, required=False),
             openapi.Parameter('tags', openapi.IN_QUERY, description="Tags séparés par des virgules", type=openapi.TYPE_STRING, required=False),
             openapi.Parameter('categorie', openapi.IN_QUERY, description="Catégorie de la vidéo", type=openapi.TYPE_STRING, required=False),
             openapi.Parameter('date_filter', openapi.IN_QUERY, description="Filtre de date (recent, today, week, month, year)", type=openapi.TYPE_STRING, required=False),
             openapi.Parameter('start_date', openapi.IN_QUERY, description="Date de début (format: YYYY-MM-DD)", type=openapi.TYPE_STRING, required=False),
             openapi.Parameter('end_date', openapi.IN_QUERY, description="Date de fin (format: YYYY-MM-DD)", type=openapi.TYPE_STRING, required=False),
-            openapi.Parameter('order_by', openapi.IN_QUERY, description="Trier par (likes, dislikes, comments, date)", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('order_by', openapi.IN_QUERY, description="Trier par (likes, dislikes, comments, date, trending)", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre de vidéos par page", type=openapi.TYPE_INTEGER, required=False),
         ],
         responses={
             200: VideoSerializer(many=True),
@@ -1152,50 +1185,24 @@ class VideoSearchView(APIView):
         }
     )
     def get(self, request):
-        videos = Video.objects.all()
-
         search_term = request.query_params.get('search_term')
-        if search_term:
-            videos = videos.filter(titre__icontains=search_term) #| videos.filter(description__icontains=search_term)
-
-        tags = request.query_params.get('tags')
-        if tags:
-            videos = videos.filter(tags__name__in=tags.split(','))
-
-        categorie = request.query_params.get('categorie')
-        if categorie:
-            videos = videos.filter(categorie=categorie)
-
-        date_filter = request.query_params.get('date_filter')
-        now = django_timezone.now()
-        if date_filter == 'today':
-            videos = videos.filter(uploaded_at__date=now.date())
-        elif date_filter == 'week':
-            videos = videos.filter(uploaded_at__gte=now - timedelta(days=7))
-        elif date_filter == 'month':
-            videos = videos.filter(uploaded_at__gte=now - timedelta(days=30))
-        elif date_filter == 'year':
-            videos = videos.filter(uploaded_at__gte=now - timedelta(days=365))
-        elif date_filter == 'recent':
-            videos = videos.order_by('-uploaded_at')
-
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        if start_date and end_date:
-            videos = videos.filter(uploaded_at__range=[start_date, end_date])
-
-        order_by = request.query_params.get('order_by')
-        if order_by == 'likes':
-            videos = videos.annotate(like_count=Count('likes')).order_by('-like_count')
-        elif order_by == 'dislikes':
-            videos = videos.annotate(dislike_count=Count('dislikes')).order_by('-dislike_count')
-        elif order_by == 'comments':
-            videos = videos.annotate(comment_count=Count('commentaires')).order_by('-comment_count')
-        elif order_by == 'date':
-            videos = videos.order_by('-uploaded_at')
+        videos = apply_filters(Video.objects.all(), request.query_params)
+        videos, ordering = apply_ordering(videos, request.query_params)
+        try:
+            page = None
+            if search_term and ordering is None:
+                # Sans autre tri demandé, ordre de pertinence BM25 : pagination sur le rang renvoyé par l'index
+                page = paginate_search(videos, search_term, request.query_params, request)
+            if page is None:
+                if search_term:
+                    videos = video_search_index.filter(videos, search_term)
+                page = paginate_videos(videos, ordering or DEFAULT_VIDEO_ORDERING, request.query_params, request)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
+        videos, next_cursor, previous_cursor = page
 
         serializer = VideoSerializer(videos, many=True, context={'request': request})
-        return Response(serializer.data)
+        return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor))
 
 class HistoriqueVuesView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1203,6 +1210,10 @@ class HistoriqueVuesView(APIView):
     @swagger_auto_schema(
         operation_description="Liste les vidéos vues par l'utilisateur authentifié, triées par date de vue la plus récente",
         tags=["Historique"],
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre de vidéos par page", type=openapi.TYPE_INTEGER, required=False),
+        ],
         responses={
             200: VideoSerializer(many=True),
             401: openapi.Response(
@@ -1217,10 +1228,12 @@ class HistoriqueVuesView(APIView):
     )
     def get(self, request):
         try:
-            vues = VideoVue.objects.filter(user=request.user).order_by('-created_at')
-            videos = [vue.video for vue in vues]
+            vues = VideoVue.objects.filter(user=request.user)
+            videos, next_cursor, previous_cursor = paginate_related_videos(vues, request.query_params, request)
             serializer = VideoSerializer(videos, many=True, context={'request': request})
-            return Response(serializer.data, status=200)
+            return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor), status=200)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
         except Exception as e:
             return Response({"erreur": str(e)}, status=500)
 
@@ -1230,6 +1243,10 @@ class LikedVideosView(APIView):
     @swagger_auto_schema(
         operation_description="Liste les vidéos aimées par l'utilisateur authentifié, triées par date de like la plus récente",
         tags=["Vidéos"],
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre de vidéos par page", type=openapi.TYPE_INTEGER, required=False),
+        ],
         responses={
             200: VideoSerializer(many=True),
             401: openapi.Response(
@@ -1244,10 +1261,12 @@ class LikedVideosView(APIView):
     )
     def get(self, request):
         try:
-            likes = VideoLike.objects.filter(user=request.user).order_by('-created_at')
-            videos = [like.video for like in likes]
+            likes = VideoLike.objects.filter(user=request.user)
+            videos, next_cursor, previous_cursor = paginate_related_videos(likes, request.query_params, request)
             serializer = VideoSerializer(videos, many=True, context={'request': request})
-            return Response(serializer.data, status=200)
+            return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor), status=200)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
         except Exception as e:
             return Response({"erreur": str(e)}, status=500)
 
@@ -1257,6 +1276,10 @@ class DislikedVideosView(APIView):
     @swagger_auto_schema(
         operation_description="Liste les vidéos dislikées par l'utilisateur authentifié, triées par date de dislike la plus récente",
         tags=["Vidéos"],
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre de vidéos par page", type=openapi.TYPE_INTEGER, required=False),
+        ],
         responses={
             200: VideoSerializer(many=True),
             401: openapi.Response(
@@ -1271,10 +1294,12 @@ class DislikedVideosView(APIView):
     )
     def get(self, request):
         try:
-            dislikes = VideoDislike.objects.filter(user=request.user).order_by('-created_at')
-            videos = [dislike.video for dislike in dislikes]
+            dislikes = VideoDislike.objects.filter(user=request.user)
+            videos, next_cursor, previous_cursor = paginate_related_videos(dislikes, request.query_params, request)
             serializer = VideoSerializer(videos, many=True, context={'request': request})
-            return Response(serializer.data, status=200)
+            return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor), status=200)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
         except Exception as e:
             return Response({"erreur": str(e)}, status=500)
 
@@ -1284,6 +1309,10 @@ class RegarderPlusTardListView(APIView):
     @swagger_auto_schema(
         operation_description="Liste les vidéos marquées 'à regarder plus tard' par l'utilisateur authentifié, triées par date d'ajout la plus récente",
         tags=["Vidéos"],
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Curseur opaque (next/previous) de la page à charger", type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Nombre de vidéos par page", type=openapi.TYPE_INTEGER, required=False),
+        ],
         responses={
             200: VideoSerializer(many=True),
             401: openapi.Response(
@@ -1298,10 +1327,12 @@ class RegarderPlusTardListView(APIView):
     )
     def get(self, request):
         try:
-            regarder_plus_tard = VideoRegarderPlusTard.objects.filter(user=request.user).order_by('-created_at')
-            videos = [rpt.video for rpt in regarder_plus_tard]
+            regarder_plus_tard = VideoRegarderPlusTard.objects.filter(user=request.user)
+            videos, next_cursor, previous_cursor = paginate_related_videos(regarder_plus_tard, request.query_params, request)
             serializer = VideoSerializer(videos, many=True, context={'request': request})
-            return Response(serializer.data, status=200)
+            return Response(get_paginated_data(serializer.data, next_cursor, previous_cursor), status=200)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=400)
         except Exception as e:
             return Response({"erreur": str(e)}, status=500)
 
@@ -1331,15 +1362,7 @@ class RegarderPlusTardMarquerView(APIView):
             video = Video.objects.get(id=video_id)
             VideoRegarderPlusTard.objects.create(user=request.user, video=video)
             
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "video_updates",
-                {
-                    "type": "watch_later_added",
-                    "video_id": video_id,
-                    "user_id": request.user.id
-                }
-            )
+            publish_event("watch_later_added", video_id=video_id, user_id=request.user.id)
             
             return Response({"message": "✅ Vidéo marquée pour regarder plus tard"}, status=200)
         except Exception as e:
@@ -1389,9 +1412,44 @@ class VideoManifestView(APIView):
     def get(self, request, video_id):
         try:
             video = Video.objects.get(id=video_id)
-            return FileResponse(open(os.path.join(settings.MEDIA_ROOT, video.master_manifest_file), 'rb'), content_type='application/vnd.apple.mpegurl')
+            if not can_watch_video(video, request.user):
+                return Response({'error': 'Vidéo non trouvée'}, status=404)
+            if not video.master_manifest_file:
+                return Response({'error': 'Manifeste non disponible'}, status=404)
+            return file_response(request, os.path.join(settings.MEDIA_ROOT, video.master_manifest_file.name), content_type='application/vnd.apple.mpegurl')
+        except Video.DoesNotExist:
+            return Response({'error': 'Vidéo non trouvée'}, status=404)
+        except Http404:
+            return Response({'error': 'Manifeste non disponible'}, status=404)
+
+class VideoDashManifestView(APIView):
+    @swagger_auto_schema(
+        operation_description="Récupère le manifeste DASH (.mpd) d'une vidéo empaquetée en CMAF (mêmes fragments que le HLS)",
+        tags=["Streaming"],
+        responses={
+            200: openapi.Response(
+                description="Manifeste DASH",
+                content={'application/dash+xml': {}}
+            ),
+            404: openapi.Response(
+                description="Vidéo non trouvée",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            )
+        }
+    )
+    def get(self, request, video_id):
+        try:
+            video = Video.objects.get(id=video_id)
+            if not can_watch_video(video, request.user):
+                return Response({'error': 'Vidéo non trouvée'}, status=404)
+            if not video.master_manifest_file:
+                return Response({'error': 'Manifeste non disponible'}, status=404)
+            dash_manifest_path = os.path.join(os.path.dirname(os.path.join(settings.MEDIA_ROOT, video.master_manifest_file.name)), DASH_MANIFEST_NAME)
+            return file_response(request, dash_manifest_path, content_type='application/dash+xml')
         except Video.DoesNotExist:
             return Response({'error': 'Vidéo non trouvée'}, status=404)
+        except Http404:
+            return Response({'error': 'Manifeste DASH non disponible'}, status=404)
 
 class VideoSegmentView(APIView):
     @swagger_auto_schema(
@@ -1411,13 +1469,19 @@ class VideoSegmentView(APIView):
     def get(self, request, video_id, segment_name):
         try:
             video = Video.objects.get(id=video_id)
-            segment_path = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id), "segments", segment_name)
-            if os.path.exists(segment_path):
-                return FileResponse(open(segment_path, 'rb'), content_type='video/mp4')
+            # Répertoire réel des segments : celui de la vidéo ou celui du contenu partagé (videos/blobs/<sha256>/)
+            if video.segments_dir:
+                segments_dir = safe_join(settings.MEDIA_ROOT, video.segments_dir)
+            elif video.master_manifest_file:
+                segments_dir = os.path.join(os.path.dirname(safe_join(settings.MEDIA_ROOT, video.master_manifest_file.name)), "segments")
             else:
-                return Response({'error': 'Segment non trouvé'}, status=404)
+                raise Http404
+            segment_path = safe_join(segments_dir, segment_name)
+            return file_response(request, segment_path)
         except Video.DoesNotExist:
             return Response({'error': 'Vidéo non trouvée'}, status=404)
+        except (Http404, SuspiciousFileOperation):
+            return Response({'error': 'Segment non trouvé'}, status=404)
 
 class VideoLikeView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1440,39 +1504,25 @@ class VideoLikeView(APIView):
             video = Video.objects.get(id=video_id)
             user = request.user
             if VideoLike.objects.filter(video=video, user=user).exists():
-                VideoLike.objects.filter(video=video, user=user).delete()
-                video.likes.remove(user)
+                with transaction.atomic():
+                    VideoLike.objects.filter(video=video, user=user).delete()
+                    removed, _ = Video.likes.through.objects.filter(video_id=video.id, user_id=user.id).delete()
+                    increment_counters(Video, video.id, likes_count=-removed)
                 
                 # Diffusion via WebSocket
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "video_updates",
-                    {
-                        "type": "video_liked",
-                        "video_id": video_id,
-                        "user_id": user.id,
-                        "action": "Like retiré"
-                    }
-                )
+                publish_event("video_liked", video_id=video_id, user_id=user.id)
                 
                 return Response({"message": "Like retiré"}, status=200)
             else:
-                VideoLike.objects.create(video=video, user=user)
-                video.likes.add(user)
-                VideoDislike.objects.filter(video=video, user=user).delete()
-                video.dislikes.remove(user)
+                with transaction.atomic():
+                    VideoLike.objects.create(video=video, user=user)
+                    added = not video.likes.filter(id=user.id).exists()
+                    video.likes.add(user)
+                    VideoDislike.objects.filter(video=video, user=user).delete()
+                    removed, _ = Video.dislikes.through.objects.filter(video_id=video.id, user_id=user.id).delete()
+                    increment_counters(Video, video.id, likes_count=int(added), dislikes_count=-removed)
                 
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "video_updates",
-                    {
-                        "type": "video_liked",
-                        "video_id": video_id,
-                        "user_id": user.id,
-                        "action": "Like ajouté",
-                        "video": VideoSerializer(video, context={"request":request}).data
-                    }
-                )
+                publish_event("video_liked", video_id=video_id, user_id=user.id)
                 
                 return Response({"message": "Like ajouté"}, status=200)
         except Video.DoesNotExist:
@@ -1499,40 +1549,26 @@ class VideoDislikeView(APIView):
             video = Video.objects.get(id=video_id)
             user = request.user
             if VideoDislike.objects.filter(video=video, user=user).exists():
-                VideoDislike.objects.filter(video=video, user=user).delete()
-                video.dislikes.remove(user)
+                with transaction.atomic():
+                    VideoDislike.objects.filter(video=video, user=user).delete()
+                    removed, _ = Video.dislikes.through.objects.filter(video_id=video.id, user_id=user.id).delete()
+                    increment_counters(Video, video.id, dislikes_count=-removed)
                 
                 # Diffusion via WebSocket
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "video_updates",
-                    {
-                        "type": "video_disliked",
-                        "video_id": video_id,
-                        "user_id": user.id,
-                        "action": "Dislike retiré"
-                    }
-                )
+                publish_event("video_disliked", video_id=video_id, user_id=user.id)
                 
                 return Response({"message": "Dislike retiré"}, status=200)
             else:
-                VideoDislike.objects.create(video=video, user=user)
-                video.dislikes.add(user)
-                VideoLike.objects.filter(video=video, user=user).delete()
-                video.likes.remove(user)
+                with transaction.atomic():
+                    VideoDislike.objects.create(video=video, user=user)
+                    added = not video.dislikes.filter(id=user.id).exists()
+                    video.dislikes.add(user)
+                    VideoLike.objects.filter(video=video, user=user).delete()
+                    removed, _ = Video.likes.through.objects.filter(video_id=video.id, user_id=user.id).delete()
+                    increment_counters(Video, video.id, dislikes_count=int(added), likes_count=-removed)
                 
                 # Diffusion via WebSocket
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "video_updates",
-                    {
-                        "type": "video_disliked",
-                        "video_id": video_id,
-                        "user_id": user.id,
-                        "action": "Dislike ajouté",
-                        "video":VideoSerializer(video, context={"request":request}).data
-                    }
-                )
+                publish_event("video_disliked", video_id=video_id, user_id=user.id)
                 
                 return Response({"message": "Dislike ajouté"}, status=200)
         except Video.DoesNotExist:
@@ -1562,33 +1598,14 @@ class ChaineSubscribeView(APIView):
                 chaine.abonnees.remove(user)
                 
                 # Diffusion via WebSocket
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "video_updates",
-                    {
-                        "type": "channel_subscribed",
-                        "channel_id": chaine_id,
-                        "user_id": user.id,
-                        "action": "Désabonné"
-                    }
-                )
+                publish_event("channel_subscribed", chaine_id=chaine_id, user_id=user.id)
                 
                 return Response({"message": "Désabonné"}, status=200)
             else:
                 chaine.abonnees.add(user)
                 
                 # Diffusion via WebSocket
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "video_updates",
-                    {
-                        "type": "channel_subscribed",
-                        "channel_id": chaine_id,
-                        "user_id": user.id,
-                        "action": "Abonné",
-                        "chaine":ChaineSerializer(chaine, context={"request":request}).data
-                    }
-                )
+                publish_event("channel_subscribed", chaine_id=chaine_id, user_id=user.id)
                 
                 return Response({"message": "Abonné"}, status=200)
         except Chaine.DoesNotExist:
@@ -1615,22 +1632,14 @@ class VideoViewView(APIView):
             video = Video.objects.get(id=video_id)
             user = request.user
             if not VideoVue.objects.filter(video=video, user=user).exists():
-                VideoVue.objects.create(video=video, user=user)
-                video.vues.add(user)
+                with transaction.atomic():
+                    VideoVue.objects.create(video=video, user=user)
+                    added = not video.vues.filter(id=user.id).exists()
+                    video.vues.add(user)
+                    increment_counters(Video, video.id, vues_count=int(added))
                 
                 # Diffusion via WebSocket
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "video_updates",
-                    {
-                        "type": "video_viewed",
-                        "video_id": video_id,
-                        "user_id": user.id,
-                        "video":VideoSerializer(video, context={"request":request}).data,
-                        "videos": VideoSerializer(Video.objects.all(),many=True, context={"request":request}).data,
-                        "my_videos": VideoSerializer(Video.objects.filter(envoyeur=request.user),many=True, context={"request":request}).data
-                    }
-                )
+                publish_event("video_viewed", video_id=video_id, user_id=user.id)
                 
                 return Response({"message": "Vidéo marquée comme vue"}, status=200)
             else:
@@ -1638,11 +1647,56 @@ class VideoViewView(APIView):
         except Video.DoesNotExist:
             return Response({'error': 'Vidéo non trouvée'}, status=404)
 
+class VideoEventResyncView(APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Rattrapage des événements temps réel manqués : renvoie les événements de version supérieure à 'since'. Si 'reset' vaut true, le trou dépasse le journal conservé et les listes doivent être rechargées",
+        tags=["Vidéos"],
+        manual_parameters=[
+            openapi.Parameter('since', openapi.IN_QUERY, description="Dernière version reçue par le client", type=openapi.TYPE_INTEGER, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Nombre maximum d'événements", type=openapi.TYPE_INTEGER, required=False),
+            openapi.Parameter('groups', openapi.IN_QUERY, description="Groupes à rattraper, séparés par des virgules (videos, video_<id>, chaine_<id>, user_<id>)", type=openapi.TYPE_STRING, required=False),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Événements manqués",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                    "version": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "reset": openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                    "has_more": openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                    "events": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                })
+            ),
+            400: openapi.Response(
+                description="Paramètre invalide",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            )
+        }
+    )
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', ''))
+            limit = int(request.query_params.get('limit') or 0) or None
+        except ValueError:
+            return Response({"error": "Paramètre 'since' ou 'limit' invalide"}, status=400)
+        if since < 0 or (limit is not None and limit < 0):
+            return Response({"error": "Paramètre 'since' ou 'limit' invalide"}, status=400)
+        groups = [group for group in request.query_params.get('groups', '').split(',') if group]
+        for group in groups:
+            parsed = parse_group(group)
+            if parsed is None:
+                return Response({"error": f"Groupe invalide : {group}"}, status=400)
+            # Les événements d'un utilisateur ne sont rattrapables que par lui-même
+            if parsed[0] == 'user' and not (request.user.is_authenticated and parsed[1] == request.user.id):
+                return Response({"error": f"Groupe interdit : {group}"}, status=403)
+        return Response(get_events_since(since, limit, groups), status=200)
+
 class VideoDownloadView(APIView):
     permission_classes = [AllowAny]
 
     @swagger_auto_schema(
-        operation_description="Récupère les informations de téléchargement pour une vidéo spécifique, incluant les qualités disponibles, leurs URLs directes, tailles et durées",
+        operation_description="Récupère les informations de téléchargement pour une vidéo spécifique : le fichier source (qualité, URL directe, taille et durée)",
         tags=["Téléchargements"],
         responses={
             200: openapi.Response(
@@ -1680,22 +1734,15 @@ class VideoDownloadView(APIView):
             duration = video_info.get('duration_formatted', 'N/A')
             base_url = settings.BASE_URL
             media_url = settings.MEDIA_URL
-            original_filename = os.path.basename(video_path)
-            qualities_list = []
-            for quality in qualities:
-                if quality == video_info.get('quality',None):
-                    quality_file_path = os.path.join("videos", str(video.id), original_filename)
-                else:
-                    quality_file_path = os.path.join("videos", str(video.id), "qualities", quality, original_filename)
-                quality_url = f"{base_url}{media_url}{quality_file_path}"
-                full_path = os.path.join(settings.MEDIA_ROOT, quality_file_path)
-                size = format_file_size(os.path.getsize(full_path)) if os.path.exists(full_path) else "N/A"
-                qualities_list.append({
-                    "quality": quality,
-                    "url": quality_url,
-                    "taille": size,
-                    "duration": duration
-                })
+            # Seul le fichier source se télécharge : les autres qualités n'existent qu'en segments HLS/CMAF
+            # (playlist et fragments, pas de fichier unique), éventuellement retirées ou pas encore produites
+            size = format_file_size(os.path.getsize(video_path)) if os.path.exists(video_path) else "N/A"
+            qualities_list = [{
+                "quality": qualities[0],
+                "url": f"{base_url}{media_url}{video.fichier.name}",
+                "taille": size,
+                "duration": duration
+            }] if qualities else []
             return Response({"qualities": qualities_list}, status=200)
         except Video.DoesNotExist:
             return Response({'error': 'Vidéo non trouvée'}, status=404)
@@ -17,4 +17,11 @@ application = ProtocolTypeRouter({
             )
         )
     ),
-})
\ No newline at end of file
+})
+
+from django.conf import settings
+from apps.videos.scheduler import video_processing_scheduler
+
+# Reprend les tâches en attente laissées par un redémarrage précédent
+if settings.VIDEO_PROCESSING_EMBEDDED_WORKER:
+    video_processing_scheduler.start()
@@ -81,11 +81,27 @@ TEMPLATES = [
 # WSGI_APPLICATION = 'config.wsgi.application'
 ASGI_APPLICATION = 'config.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+# Couche de canaux : 'memory' limite les WebSockets à un seul processus ASGI ;
+# 'redis' permet plusieurs workers daphne/uvicorn, sur une ou plusieurs machines
+CHANNEL_LAYER_BACKEND = os.getenv('CHANNEL_LAYER_BACKEND', 'memory')
+CHANNEL_REDIS_URL = os.getenv('CHANNEL_REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+if CHANNEL_LAYER_BACKEND == 'redis':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+                'prefix': os.getenv('CHANNEL_REDIS_PREFIX', 'streaming'),
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
 
 DATABASES = {
     'default': {
@@ -150,6 +166,135 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 BASE_URL = f"http://{IP_ADDR}:{PORT}"
 
+HLS_SEGMENT_DURATION = int(os.getenv('HLS_SEGMENT_DURATION', 10))
+VIDEO_ENCODER_PRESET = os.getenv('VIDEO_ENCODER_PRESET', 'veryfast')
+# Échelle de qualités : une qualité doit être au moins VIDEO_LADDER_MIN_STEP fois moins lourde (débit moyen mesuré)
+# que celle du dessus, sinon elle est retirée du master
+VIDEO_LADDER_MIN_STEP = float(os.getenv('VIDEO_LADDER_MIN_STEP', 1.2))
+# Format des segments : "ts" (MPEG-TS, HLS seul) ou "cmaf" (MP4 fragmenté, mêmes fichiers pour HLS et DASH)
+VIDEO_SEGMENT_FORMAT = os.getenv('VIDEO_SEGMENT_FORMAT', 'ts')
+# En CMAF : un seul fichier par rendu/piste, adressé par plages d'octets, au lieu d'un fichier par segment
+VIDEO_SEGMENT_SINGLE_FILE = os.getenv('VIDEO_SEGMENT_SINGLE_FILE', 'True') == 'True'
+
+# Qualités à la demande (JIT) : à l'envoi, seuls "original" et une qualité intermédiaire sont encodés ; les autres
+# le sont à la première demande de leur playlist, et les moins utilisées sont évincées au-delà du quota disque
+VIDEO_JIT_RENDITIONS = os.getenv('VIDEO_JIT_RENDITIONS', 'False') == 'True'
+VIDEO_JIT_EAGER_QUALITY = os.getenv('VIDEO_JIT_EAGER_QUALITY', '480p')
+VIDEO_JIT_RETRY_AFTER = 2
+VIDEO_RENDITION_DISK_QUOTA = int(os.getenv('VIDEO_RENDITION_DISK_QUOTA', 0))
+VIDEO_RENDITION_EVICT_SECONDS = int(os.getenv('VIDEO_RENDITION_EVICT_SECONDS', 600))
+VIDEO_RENDITION_MIN_IDLE_SECONDS = 3600
+VIDEO_RENDITION_WATCH_DAYS = 7
+RENDITION_ACCESS_FLUSH_SECONDS = 30
+
+# Direct : segments CMAF courts découpés en parties (LL-HLS), fenêtre glissante de quelques segments
+LIVE_SEGMENT_DURATION = float(os.getenv('LIVE_SEGMENT_DURATION', 2))
+LIVE_PART_DURATION = float(os.getenv('LIVE_PART_DURATION', 0.5))
+LIVE_WINDOW_SEGMENTS = int(os.getenv('LIVE_WINDOW_SEGMENTS', 6))
+LIVE_QUALITIES = [q.strip() for q in os.getenv('LIVE_QUALITIES', '720p,480p,360p').split(',') if q.strip()]
+LIVE_INGEST_HOST = os.getenv('LIVE_INGEST_HOST', '0.0.0.0')
+LIVE_RTMP_PORT = int(os.getenv('LIVE_RTMP_PORT', 1935))
+LIVE_SRT_PORT = int(os.getenv('LIVE_SRT_PORT', 9000))
+LIVE_SRT_LATENCY_MS = int(os.getenv('LIVE_SRT_LATENCY_MS', 120))
+LIVE_PACKAGER_POLL_SECONDS = 0.05
+# Sorties des directs (playlists, segments, enregistrement, état) : sous MEDIA_ROOT pour que l'enregistrement
+# devienne le fichier de la vidéo, mais jamais servies par /media/ (seulement par les vues du direct)
+LIVE_ROOT = os.path.join(MEDIA_ROOT, 'live')
+LIVE_STATUS_POLL_SECONDS = 1
+
+# Cache d'authentification : utilisateurs (durée de vie courte, invalidés à la modification) et tokens validés
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', 30))
+USER_CACHE_TOKEN_SIZE = 50000
+ANONYMOUS_TOKEN_REFRESH_SECONDS = 3600
+
+MEDIA_PROBE_CACHE_SIZE = 1024
+MEDIA_PROBE_CACHE_DIR = os.getenv('MEDIA_PROBE_CACHE_DIR')
+
+# Descripteurs de lecture (playback.json) gardés en mémoire, validés par le mtime du fichier
+PLAYBACK_DESCRIPTOR_CACHE_SIZE = 1024
+
+# Index de similarité (n-grammes de caractères hachés) utilisé pour les vidéos suggérées
+SUGGESTION_INDEX_DIMENSIONS = 4096
+SUGGESTION_INDEX_SYNC_SECONDS = int(os.getenv('SUGGESTION_INDEX_SYNC_SECONDS', 5))
+
+# Recherche plein texte : 'fts5' (SQLite), 'memory' (index inversé en mémoire) ou 'auto'
+VIDEO_SEARCH_BACKEND = os.getenv('VIDEO_SEARCH_BACKEND', 'auto')
+# Taille maximale d'une fenêtre de résultats lue dans l'index (la pagination continue au-delà)
+VIDEO_SEARCH_MAX_RESULTS = 1000
+# Index en mémoire : intervalle de synchronisation incrémentale (documents modifiés par les autres processus)
+VIDEO_SEARCH_REFRESH_SECONDS = int(os.getenv('VIDEO_SEARCH_REFRESH_SECONDS', 5))
+
+# Pagination par curseur des listes de vidéos (REST et WebSocket)
+VIDEO_LIST_PAGE_SIZE = 20
+VIDEO_LIST_MAX_PAGE_SIZE = 100
+
+# Fils de commentaires : pages par curseur, et seule une première page est incluse dans une vidéo
+COMMENT_PAGE_SIZE = 20
+COMMENT_MAX_PAGE_SIZE = 100
+COMMENT_EMBED_SIZE = 5
+COMMENT_REPLY_PREVIEW_SIZE = 3
+# Flux temps réel des commentaires : derniers messages conservés par vidéo pour le rejeu à la reconnexion
+COMMENT_STREAM_REPLAY_SIZE = 500
+
+# Upload reprenable : taille des blocs pour écrire les chunks sur disque
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+# Empreinte SHA-256 calculée pendant la réception des fichiers envoyés (déduplication des vidéos)
+FILE_UPLOAD_HANDLERS = [
+    'apps.videos.uploads.HashingMemoryFileUploadHandler',
+    'apps.videos.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# Service des médias (Range, ETag, cache) : segments terminés immuables, playlists toujours revalidées
+MEDIA_STREAM_BLOCK_SIZE = 256 * 1024
+MEDIA_IMMUTABLE_EXTENSIONS = ('.ts', '.m4s', '.aac', '.vtt')
+MEDIA_PLAYLIST_EXTENSIONS = ('.m3u8', '.mpd')
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MEDIA_DEFAULT_MAX_AGE = int(os.getenv('MEDIA_DEFAULT_MAX_AGE', 3600))
+
+# Événements temps réel : journal borné (rattrapage par version) et purge périodique
+VIDEO_EVENT_LOG_SIZE = int(os.getenv('VIDEO_EVENT_LOG_SIZE', 10000))
+VIDEO_EVENT_PRUNE_INTERVAL = 500
+VIDEO_EVENT_RESYNC_LIMIT = 500
+VIDEO_EVENT_MAX_SUBSCRIPTIONS = 200
+
+# Classement "tendances" : score décroissant exponentiellement (demi-vie), recalcul complet périodique
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 24))
+TRENDING_WINDOW_DAYS = 14
+TRENDING_RECOMPUTE_SECONDS = int(os.getenv('TRENDING_RECOMPUTE_SECONDS', 3600))
+TRENDING_WEIGHTS = {
+    'vue': 1.0,
+    'like': 3.0,
+    'commentaire': 5.0,
+}
+
+# Positions de lecture : fusionnées en mémoire puis écrites par lots (write-behind)
+WATCH_PROGRESS_FLUSH_SECONDS = int(os.getenv('WATCH_PROGRESS_FLUSH_SECONDS', 5))
+WATCH_PROGRESS_MAX_PENDING = 5000
+
+VIDEO_PROCESSING_WORKERS = int(os.getenv('VIDEO_PROCESSING_WORKERS', 3))
+VIDEO_PROCESSING_START_METHOD = 'spawn'
+VIDEO_PROCESSING_CONCURRENCY = {
+    'THUMBNAILS': 2,
+    'METADATA': 2,
+    'CONVERSION': 1,
+    'RENDITION': 2,
+}
+# File de tâches durable (VideoProcessingTask) partagée entre tous les noeuds
+VIDEO_PROCESSING_EMBEDDED_WORKER = os.getenv('VIDEO_PROCESSING_EMBEDDED_WORKER', 'True') == 'True'
+VIDEO_PROCESSING_LEASE_SECONDS = 60
+VIDEO_PROCESSING_HEARTBEAT_SECONDS = 15
+VIDEO_PROCESSING_POLL_SECONDS = 2
+VIDEO_PROCESSING_MAX_ATTEMPTS = 3
+# Durée maximale d'exécution par type de tâche (secondes) : au-delà, le processus est interrompu et le bail n'est
+# plus renouvelé (tâche remise en file, ou en échec après VIDEO_PROCESSING_MAX_ATTEMPTS)
+VIDEO_PROCESSING_MAX_RUNTIME = {
+    'THUMBNAILS': 600,
+    'METADATA': 300,
+    'CONVERSION': int(os.getenv('VIDEO_CONVERSION_MAX_RUNTIME', 4 * 3600)),
+    'RENDITION': 3600,
+}
+
 AUTH_USER_MODEL = 'users.User'
 AUTHENTICATION_BACKENDS = ['apps.users.backends.EmailBackend']
 
@@ -159,7 +304,7 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.users.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'DEFAULT_PERMISSION_CLASSES': [
@@ -4,21 +4,20 @@ from django.utils import timezone as django_timezone
 from django.conf import settings
 
 from rest_framework.request import Request
-from rest_framework_simplejwt.tokens import AccessToken, TokenError
+from rest_framework_simplejwt.tokens import TokenError
 
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from base64 import b64decode,b64encode
 from cryptography.hazmat.backends import default_backend
 from difflib import SequenceMatcher
 from moviepy.editor import VideoFileClip
-from PIL import Image
 
-from apps.users.models import User, default_created_at
+from apps.users.models import default_created_at
 
 import os, jwt, logging
 import random, re
 from helpers.constantes import *
-import ffmpeg
+from helpers.probe import probe_media
 import traceback
 
 load_dotenv()
@@ -63,21 +62,17 @@ def get_user(token):
     if not token:
         LOGGER.error("Aucun token fourni")
         return None
+    from apps.users.cache import user_cache
     try:
-        access_token = AccessToken(token)
-        user_id = access_token.get('user_id')
-        if not user_id:
-            LOGGER.error("Le token ne contient pas 'user_id'")
+        # Token validé et utilisateur servis depuis le cache (durée de vie courte, invalidé à la modification)
+        user = user_cache.get_user_from_token(token)
+        if user is None:
+            LOGGER.error("Utilisateur du token introuvable")
             return None
-        user = User.objects.get(id=user_id)
-        LOGGER.info(f"Utilisateur récupéré : {user}")
         return user
     except TokenError as e:
         LOGGER.error(f"Token invalide : {e}")
         return None
-    except User.DoesNotExist:
-        LOGGER.error(f"Utilisateur avec id {user_id} n'existe pas")
-        return None
 
 def calcule_de_similarite_de_phrase(text1, text2):
     def clean_text(text):
@@ -102,28 +97,15 @@ def calcule_de_similarite_de_phrase(text1, text2):
 
 def get_video_info(file_path):
     try:
-        clip = VideoFileClip(file_path)
-        height = clip.h
-        standard_qualities = {
-            2160: "2160p (4K)",
-            1440: "1440p (2K)",
-            1080: "1080p (Full HD)",
-            720: "720p (HD)",
-            480: "480p",
-            360: "360p",
-            240: "240p"
-        }
-        quality = next((q for h, q in standard_qualities.items() if height >= h - 10), f"{height}p")
-        info = {
-            'size': os.path.getsize(file_path),
-            'duration': clip.duration,
-            'width': clip.w,
-            'height': height,
-            'fps': clip.fps,
-            'quality': quality
+        media = probe_media(file_path)
+        return {
+            'size': media.size,
+            'duration': media.duration,
+            'width': media.width,
+            'height': media.height,
+            'fps': media.fps,
+            'quality': media.quality
         }
-        clip.close()
-        return info
     except Exception as e:
         raise Exception(str(e)+str(traceback.format_exc()))
     
@@ -147,142 +129,14 @@ def format_duration(seconds):
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
 def get_available_info(file_path):
-    print("[❕] Getting available info....")
     if not os.path.exists(file_path):
         raise Exception(f"[❗]le chemin de fichier {file_path} est introuvable, veuillez verifiez...")
     try:
-        clip = VideoFileClip(file_path)
-        height = clip.h
-        
-        standard_qualities = [
-            (2160, "2160p (4K)"),
-            (1440, "1440p (2K)"),
-            (1080, "1080p (Full HD)"),
-            (720, "720p (HD)"),
-            (480, "480p"),
-            (360, "360p"),
-            (240, "240p"),
-            (144, "144p")
-        ]
-        
-        available_qualities = [quality for threshold, quality in standard_qualities if height >= threshold]
-        quality = next((q for h, q in {
-            2160: "2160p (4K)",
-            1440: "1440p (2K)",
-            1080: "1080p (Full HD)",
-            720: "720p (HD)",
-            480: "480p",
-            360: "360p",
-            240: "240p"
-        }.items() if height >= h - 10), f"{height}p")
-        probe = ffmpeg.probe(file_path)
-        video_info = {
-            'qualities': available_qualities,
-            'size': os.path.getsize(file_path),
-            'size_formatted': format_file_size(os.path.getsize(file_path)),
-            'duration': clip.duration,
-            'duration_formatted': format_duration(clip.duration),
-            'width': clip.w,
-            'height': clip.h,
-            'fps': clip.fps,
-            'has_subtitles': False,
-            'subtitle_languages': [],
-            'audio_tracks': [],
-            'has_multiple_languages': False,
-            'quality': quality
-        }
-        
-        subtitle_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'subtitle']
-        if subtitle_streams:
-            video_info['has_subtitles'] = True
-            video_info['subtitle_languages'] = [
-                stream.get('tags', {}).get('language', 'unknown') for stream in subtitle_streams
-            ]
-        
-        audio_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'audio']
-        audio_tracks = []
-        for stream in audio_streams:
-            language = stream.get('tags', {}).get('language', 'unknown')
-            title = stream.get('tags', {}).get('title', '')
-            if title:
-                audio_tracks.append(f"{language} ({title})")
-            elif language not in audio_tracks:
-                audio_tracks.append(language)
-        video_info['audio_tracks'] = audio_tracks
-        video_info['has_multiple_languages'] = len(set(audio_tracks)) > 1
-        
-        clip.close()
-        return video_info
-    
+        return probe_media(file_path).to_available_info()
     except Exception as e:
-        if 'clip' in locals():
-            clip.close()
         print(traceback.format_exc())
         raise Exception(f"Erreur lors de l'obtention des informations vidéo: {str(e)}")
 
-def custom_resize(clip, newsize, resample=Image.Resampling.LANCZOS):
-    return clip.resize(newsize, resample=resample)
-
-def convert_video_quality(file_path, target_quality):
-    try:
-        clip = VideoFileClip(file_path)
-        
-        quality_heights = {
-            "2160p": 2160,
-            "1440p": 1440,
-            "1080p": 1080,
-            "720p": 720,
-            "480p": 480,
-            "360p": 360,
-            "240p": 240,
-            "144p": 144
-        }
-        
-        target_height = None
-        for quality, height in quality_heights.items():
-            if target_quality.startswith(quality):
-                target_height = height
-                break
-                
-        if not target_height:
-            clip.close()
-            raise ValueError(f"Qualité cible '{target_quality}' non supportée")
-            
-        if clip.h < target_height:
-            clip.close()
-            raise ValueError(f"La vidéo source ({clip.h}p) est de qualité inférieure à la qualité cible ({target_quality})")
-        
-        aspect_ratio = clip.w / clip.h
-        target_width = int(target_height * aspect_ratio)
-        target_width = target_width if target_width % 2 == 0 else target_width + 1
-        
-        file_name, file_ext = os.path.splitext(file_path)
-        output_path = f"{file_name}_{target_quality}{file_ext}"
-        
-        resized_clip = clip.resize(height=target_height, width=target_width)
-        
-        resized_clip.write_videofile(
-            output_path,
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
-            remove_temp=True,
-            threads=4
-        )
-        
-        clip.close()
-        resized_clip.close()
-        
-        return output_path
-    
-    except Exception as e:
-        if 'clip' in locals():
-            clip.close()
-        if 'resized_clip' in locals():
-            resized_clip.close()
-        print(traceback.format_exc())
-        raise Exception(f"Erreur lors de la conversion de la vidéo: {str(e)}")
-
 def format_views(views):
     if views >= 1000000:
         return f"{views / 1000000:.1f}M"
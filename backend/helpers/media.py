@@ -0,0 +1,205 @@
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.core.exceptions import SuspiciousFileOperation
+from uuid import uuid4
+import mimetypes
+import stat
+import os
+import re
+
+RANGE_PATTERN = re.compile(r"^bytes=([0-9]*-[0-9]*(?:\s*,\s*[0-9]*-[0-9]*)*)$")
+
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.mpd': 'application/dash+xml',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.vtt': 'text/vtt',
+}
+
+class RangeFile:
+    # Fichier limité à une plage d'octets : read() s'arrête à la fin de la plage, et fileno()/tell()
+    # restent ceux du vrai fichier pour que le serveur WSGI puisse utiliser sendfile().
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        self.name = file.name
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+def get_content_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+def get_cache_control(path):
+    # Segments terminés : jamais réécrits, donc cachables indéfiniment. Les playlists sont toujours
+    # revalidées (ETag) car elles peuvent être régénérées ; le reste garde un cache court.
+    extension = os.path.splitext(path)[1].lower()
+    if extension in settings.MEDIA_IMMUTABLE_EXTENSIONS:
+        return f"public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+    if extension in settings.MEDIA_PLAYLIST_EXTENSIONS:
+        return "no-cache"
+    return f"public, max-age={settings.MEDIA_DEFAULT_MAX_AGE}"
+
+def get_etag(file_stat):
+    return quote_etag(f"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}")
+
+def parse_ranges(header, size):
+    match = RANGE_PATTERN.match(header.replace(" ", ""))
+    if not match:
+        return None
+    ranges = []
+    for part in match.group(1).split(','):
+        first, _, last = part.partition('-')
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            # Suffixe "bytes=-N" : les N derniers octets
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+        if start <= end and start < size:
+            ranges.append((start, end))
+    return ranges
+
+def range_applies(request, etag, last_modified):
+    # If-Range : la plage n'est servie que si la ressource n'a pas changé depuis
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and last_modified <= if_range_date
+
+def set_file_headers(response, etag, last_modified, cache_control):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+def iter_multipart_ranges(path, ranges, size, content_type, boundary):
+    with open(path, 'rb') as file:
+        for start, end in ranges:
+            yield (
+                f"\r\n--{boundary}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode()
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = file.read(min(settings.MEDIA_STREAM_BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+def file_response(request, path, content_type=None, cache_control=None):
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        raise Http404("Fichier introuvable")
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404("Fichier introuvable")
+
+    size = file_stat.st_size
+    last_modified = int(file_stat.st_mtime)
+    etag = get_etag(file_stat)
+    content_type = content_type or get_content_type(path)
+    cache_control = cache_control or get_cache_control(path)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return set_file_headers(not_modified, etag, last_modified, cache_control)
+
+    ranges = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and request.method in ('GET', 'HEAD') and range_applies(request, etag, last_modified):
+        ranges = parse_ranges(range_header, size)
+        if ranges is not None and not ranges:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return set_file_headers(response, etag, last_modified, cache_control)
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = str(size)
+        return set_file_headers(response, etag, last_modified, cache_control)
+
+    if ranges and len(ranges) > 1:
+        boundary = uuid4().hex
+        response = StreamingHttpResponse(
+            iter_multipart_ranges(path, ranges, size, content_type, boundary),
+            status=206, content_type=f"multipart/byteranges; boundary={boundary}"
+        )
+        return set_file_headers(response, etag, last_modified, cache_control)
+
+    if ranges:
+        start, end = ranges[0]
+        response = FileResponse(RangeFile(open(path, 'rb'), start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        # Fichier entier : FileResponse passe par wsgi.file_wrapper, donc sendfile() sous gunicorn
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(size)
+    response.block_size = settings.MEDIA_STREAM_BLOCK_SIZE
+    return set_file_headers(response, etag, last_modified, cache_control)
+
+def serve_media(request, path, document_root=None):
+    try:
+        full_path = safe_join(document_root or settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Fichier introuvable")
+    # Fichiers des directs (enregistrement en cours, état, segments des directs privés) : uniquement via
+    # LiveMediaView et live_playlist_view, qui filtrent les noms et appliquent la visibilité
+    if os.path.commonpath([full_path, os.path.abspath(settings.LIVE_ROOT)]) == os.path.abspath(settings.LIVE_ROOT):
+        raise Http404("Fichier introuvable")
+    if settings.VIDEO_JIT_RENDITIONS and document_root is None:
+        response = serve_rendition(path, full_path)
+        if response is not None:
+            return response
+    return file_response(request, full_path)
+
+def serve_rendition(path, full_path):
+    # Qualité à la demande : la première demande de sa playlist (absente, ou tronquée par un encodage interrompu)
+    # lance (une seule fois) la génération, puis 503 avec Retry-After tant que le premier segment n'est pas écrit
+    # (pas d'attente : la vue bloquerait le thread partagé par toutes les vues synchrones sous ASGI)
+    from apps.videos.renditions import parse_rendition_path, resolve_rendition_video, rendition_requests, rendition_access, RENDITION_PLAYLIST_NAME
+    rendition = parse_rendition_path(path)
+    if rendition is None:
+        return None
+    if os.path.basename(full_path) == RENDITION_PLAYLIST_NAME:
+        video_id = resolve_rendition_video(rendition[0])
+        ready = rendition_requests.ensure(video_id, rendition[1], full_path) if video_id is not None else None
+        if ready is None:
+            raise Http404("Fichier introuvable")
+        if not ready:
+            response = HttpResponse(status=503)
+            response['Retry-After'] = str(settings.VIDEO_JIT_RETRY_AFTER)
+            return response
+    rendition_access.touch(*rendition)
+    return None
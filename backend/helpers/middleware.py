@@ -1,14 +1,11 @@
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
-from rest_framework_simplejwt.tokens import AccessToken
-from apps.users.models import User
+from apps.users.cache import user_cache
 
 @database_sync_to_async
 def get_user_from_token(token):
     try:
-        access_token = AccessToken(token)
-        user_id = access_token['user_id']
-        return User.objects.get(id=user_id)
+        return user_cache.get_user_from_token(token)
     except Exception as e:
         print(e)
         return None
@@ -0,0 +1,196 @@
+from dataclasses import dataclass, field, asdict
+from collections import OrderedDict
+from django.conf import settings
+from threading import Lock
+import hashlib
+import json
+import os
+import ffmpeg
+
+STANDARD_QUALITIES = [
+    (2160, "2160p (4K)"),
+    (1440, "1440p (2K)"),
+    (1080, "1080p (Full HD)"),
+    (720, "720p (HD)"),
+    (480, "480p"),
+    (360, "360p"),
+    (240, "240p"),
+    (144, "144p")
+]
+
+@dataclass(frozen=True)
+class AudioTrack:
+    index: int
+    codec: str
+    language: str
+    title: str = ""
+    channels: int = 0
+
+@dataclass(frozen=True)
+class SubtitleTrack:
+    index: int
+    codec: str
+    language: str
+
+@dataclass(frozen=True)
+class MediaProbe:
+    path: str
+    size: int
+    duration: float
+    width: int
+    height: int
+    fps: float
+    video_codec: str
+    bit_rate: int
+    audio_tracks: list = field(default_factory=list)
+    subtitle_tracks: list = field(default_factory=list)
+
+    @property
+    def qualities(self):
+        return [quality for threshold, quality in STANDARD_QUALITIES if self.height >= threshold]
+
+    @property
+    def quality(self):
+        return next((q for h, q in STANDARD_QUALITIES[:-1] if self.height >= h - 10), f"{self.height}p")
+
+    def to_available_info(self):
+        from helpers.helper import format_file_size, format_duration
+        audio_tracks = []
+        for track in self.audio_tracks:
+            if track.title:
+                audio_tracks.append(f"{track.language} ({track.title})")
+            elif track.language not in audio_tracks:
+                audio_tracks.append(track.language)
+        return {
+            'qualities': self.qualities,
+            'size': self.size,
+            'size_formatted': format_file_size(self.size),
+            'duration': self.duration,
+            'duration_formatted': format_duration(self.duration),
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+            'has_subtitles': bool(self.subtitle_tracks),
+            'subtitle_languages': [track.language for track in self.subtitle_tracks],
+            'audio_tracks': audio_tracks,
+            'has_multiple_languages': len(set(audio_tracks)) > 1,
+            'quality': self.quality
+        }
+
+    def to_json(self):
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data)
+        data['audio_tracks'] = [AudioTrack(**track) for track in data['audio_tracks']]
+        data['subtitle_tracks'] = [SubtitleTrack(**track) for track in data['subtitle_tracks']]
+        return cls(**data)
+
+def parse_frame_rate(rate):
+    try:
+        num, _, den = (rate or "0/1").partition('/')
+        return round(float(num) / float(den or 1), 3) if float(den or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+def parse_probe(path, size, probe):
+    streams = probe.get('streams', [])
+    video_stream = next((s for s in streams if s['codec_type'] == 'video' and not s.get('disposition', {}).get('attached_pic')), None)
+    if video_stream is None:
+        raise ValueError(f"Aucun flux vidéo dans {path}")
+
+    width, height = int(video_stream.get('width', 0)), int(video_stream.get('height', 0))
+    rotation = video_stream.get('tags', {}).get('rotate')
+    if rotation is None:
+        rotation = next((d.get('rotation') for d in video_stream.get('side_data_list', []) if 'rotation' in d), 0)
+    if abs(int(float(rotation))) in (90, 270):
+        width, height = height, width
+
+    duration = float(probe.get('format', {}).get('duration') or video_stream.get('duration') or 0)
+    audio_tracks = []
+    subtitle_tracks = []
+    for idx, stream in enumerate(s for s in streams if s['codec_type'] == 'audio'):
+        tags = stream.get('tags', {})
+        audio_tracks.append(AudioTrack(
+            index=idx, codec=stream.get('codec_name', ''), language=tags.get('language', 'unknown'),
+            title=tags.get('title', ''), channels=int(stream.get('channels', 0))
+        ))
+    for idx, stream in enumerate(s for s in streams if s['codec_type'] == 'subtitle'):
+        subtitle_tracks.append(SubtitleTrack(
+            index=idx, codec=stream.get('codec_name', ''), language=stream.get('tags', {}).get('language', 'unknown')
+        ))
+
+    return MediaProbe(
+        path=path,
+        size=size,
+        duration=duration,
+        width=width,
+        height=height,
+        fps=parse_frame_rate(video_stream.get('avg_frame_rate')) or parse_frame_rate(video_stream.get('r_frame_rate')),
+        video_codec=video_stream.get('codec_name', ''),
+        bit_rate=int(probe.get('format', {}).get('bit_rate') or 0),
+        audio_tracks=audio_tracks,
+        subtitle_tracks=subtitle_tracks
+    )
+
+class ProbeCache:
+    def __init__(self, max_entries=None, cache_dir=None):
+        self.max_entries = max_entries or settings.MEDIA_PROBE_CACHE_SIZE
+        self.cache_dir = cache_dir if cache_dir is not None else settings.MEDIA_PROBE_CACHE_DIR
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                return result
+        if self.cache_dir:
+            try:
+                with open(self.disk_path(key)) as f:
+                    result = MediaProbe.from_json(f.read())
+                self.put(key, result, persist=False)
+                return result
+            except (OSError, ValueError, TypeError, KeyError):
+                return None
+        return None
+
+    def put(self, key, result, persist=True):
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if persist and self.cache_dir:
+            path = self.disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(result.to_json())
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Erreur lors de l'écriture du cache de probe : {e}")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+probe_cache = ProbeCache()
+
+def probe_media(file_path):
+    # La clé inclut taille et mtime : un fichier remplacé au même chemin est re-sondé
+    path = os.path.realpath(file_path)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    result = probe_cache.get(key)
+    if result is None:
+        result = parse_probe(path, stat.st_size, ffmpeg.probe(path))
+        probe_cache.put(key, result)
+    return result
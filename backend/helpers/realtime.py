@@ -0,0 +1,33 @@
+import asyncio
+import time
+
+async def count_group_members(channel_layer, group):
+    # Seul endroit qui lit l'état interne des couches de canaux : écrit pour channels==4.2.0 et
+    # channels-redis==4.2.0 (versions figées dans requirements.txt), à revoir à chaque mise à jour.
+    # Renvoie None si la couche n'est pas reconnue ou si sa structure a changé.
+    from channels.layers import InMemoryChannelLayer
+    try:
+        if isinstance(channel_layer, InMemoryChannelLayer):
+            # Les groupes sont un simple dict du processus (groupe -> {canal: date d'ajout})
+            return len(channel_layer.groups.get(group, {}))
+        from channels_redis.core import RedisChannelLayer
+        if isinstance(channel_layer, RedisChannelLayer):
+            # Le groupe est un sorted set (canal -> date d'ajout) : on compte les membres non expirés
+            connection = channel_layer.connection(channel_layer.consistent_hash(group))
+            return await connection.zcount(channel_layer._group_key(group), time.time() - channel_layer.group_expiry, '+inf')
+    except Exception as e:
+        print(f"[❕] Abonnés du groupe {group} illisibles ({type(channel_layer).__name__}) : {e}")
+    return None
+
+async def group_has_subscribers(channel_layer, group):
+    # Dans le doute (couche inconnue, internes modifiés, Redis en erreur), on considère qu'il y a des abonnés :
+    # le message part comme si la vérification n'existait pas
+    count = await count_group_members(channel_layer, group)
+    return count is None or count > 0
+
+async def filter_subscribed_groups(channel_layer, groups):
+    found = await asyncio.gather(*(group_has_subscribers(channel_layer, group) for group in groups))
+    return [group for group, subscribed in zip(groups, found) if subscribed]
+
+async def group_send_many(channel_layer, messages):
+    await asyncio.gather(*(channel_layer.group_send(group, message) for group, message in messages))
@@ -8,7 +8,7 @@ import Sidebar from "./Sidebar"
 import VideoList from "./VideoList"
 import FinalUserDashboard from "./final-user-dashboard"
 import { useNavigate } from "react-router-dom"
-import api from "../../services/Api"
+import api, { fetchAllPages } from "../../services/Api"
 import "./Home.css"
 
 function Home() {
@@ -41,12 +41,12 @@ function Home() {
       return
     }
     try {
-      const response = await api.get("/videos/mes/", {
+      const myVideos = await fetchAllPages("/videos/mes/", {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       })
-      const mappedVideos = response.data.map((video) => ({
+      const mappedVideos = myVideos.map((video) => ({
         id: video.id,
         title: video.titre,
         description: video.description,
@@ -5,7 +5,7 @@ import { useState, useEffect, useRef } from "react"
 import { Box, Chip, Typography } from "@mui/material"
 import VideoCard from "./VideoCard"
 import VideoSkeleton from "./VideoSkeleton"
-import api from "../../services/Api"
+import { fetchAllPages } from "../../services/Api"
 
 function VideoList({ searchQuery, category, setCategory, apiEndpoint }) {
   const [allVideos, setAllVideos] = useState([])
@@ -18,7 +18,7 @@ function VideoList({ searchQuery, category, setCategory, apiEndpoint }) {
   const fetchVideos = async () => {
     setLoading(true)
     try {
-      let response
+      let videos
       const params = {}
       const headers = {}
       const token = localStorage.getItem("token")
@@ -34,18 +34,17 @@ function VideoList({ searchQuery, category, setCategory, apiEndpoint }) {
           setLoading(false)
           return
         }
-        response = await api.get(apiEndpoint, { headers })
+        videos = await fetchAllPages(apiEndpoint, { headers })
       } else {
         if (searchQuery) params.search_term = searchQuery
         if (category !== "Tous") params.categorie = category
 
-        response = await api.get('/videos/search', {
+        videos = await fetchAllPages('/videos/search', {
           params,
           headers,
         })
       }
 
-      const videos = response.data
       setAllVideos(videos)
       const uniqueCategories = ["Tous", ...new Set(videos.map((video) => video.categorie))]
       setCategories(apiEndpoint === "/videos/" ? uniqueCategories : ["Tous"]) // Only show categories for /videos/
@@ -12,6 +12,8 @@ const FinalUserDashboard = (video_length=0) => {
   const [videos, setVideos] = useState([])
   const navigate = useNavigate()
   const wsRef = useRef(null)
+  // Pages de list_my_videos déjà reçues : la première remplace la liste, les suivantes (curseur "next") s'y ajoutent
+  const listPagesRef = useRef([])
 
   // const fetchVideos = async () => {
   //   const token = localStorage.getItem("token")
@@ -68,13 +70,14 @@ const FinalUserDashboard = (video_length=0) => {
 
     ws.onopen = () => {
       console.log("WebSocket connected for Dashboard")
+      listPagesRef.current = []
       ws.send(JSON.stringify({ type: "list_my_videos", params: {} }))
     }
 
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data)
-      if (data.status === "success") {
-        const mappedVideos = data.data.map((video) => ({
+      if (data.status === "success" && Array.isArray(data.data?.results)) {
+        const mappedVideos = data.data.results.map((video) => ({
           id: video.id,
           title: video.titre,
           description: video.description,
@@ -98,7 +101,12 @@ const FinalUserDashboard = (video_length=0) => {
           duration: video.duration || "00:00",
           thumbnail: video.affichage_url || "/placeholder.svg?height=120&width=200",
         }))
-        setVideos(mappedVideos)
+        listPagesRef.current = [...listPagesRef.current, ...mappedVideos]
+        if (data.data.next) {
+          ws.send(JSON.stringify({ type: "list_my_videos", params: {}, cursor: data.data.next }))
+        } else {
+          setVideos(listPagesRef.current)
+        }
       } else if (data.type === "video_created") {
         const newVideo = {
           id: data.video.id,
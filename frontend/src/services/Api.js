@@ -4,4 +4,16 @@ const api = axios.create({
   baseURL: import.meta.env.VITE_API_URL,
 });
 
+// Listes paginées par curseur ({ next, previous, results }) : suit "next" jusqu'à la dernière page
+export const fetchAllPages = async (url, config = {}) => {
+  const results = [];
+  let cursor = null;
+  do {
+    const response = await api.get(url, { ...config, params: { ...(config.params || {}), ...(cursor ? { cursor } : {}) } });
+    results.push(...response.data.results);
+    cursor = response.data.next;
+  } while (cursor);
+  return results;
+};
+
 export default api;
\ No newline at end of file